@@ -0,0 +1,5 @@
+import os
+import sys
+
+# アプリケーションと同じ import 形式 (db.database など) を使えるように src をパスに追加
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
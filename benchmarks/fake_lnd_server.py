@@ -0,0 +1,285 @@
+import json
+import queue
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CHANNEL_EVENTS_PATH = '/v1/channels/subscribe'
+HTLC_EVENTS_PATH = '/v2/router/htlcevents'
+STREAM_PATHS = (CHANNEL_EVENTS_PATH, HTLC_EVENTS_PATH)
+
+
+class FakeLndServer:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None, host='127.0.0.1', port=0):
+        """
+        Local stand-in for the LND REST API used by the fee manager
+
+        Serves POST /v1/chanpolicy, GET /v1/channels and GET /v1/feereport
+        over plain HTTP, with a configurable per-request latency (seconds) and
+        error rate (0-1, answered with 500). Channels registered with
+        add_channel() are listed, and successful policy updates are applied
+        to them so the fee report reflects what was sent. The streaming
+        endpoints GET /v1/channels/subscribe and GET /v2/router/htlcevents
+        send the events pushed with push_event() or forward_htlc() as
+        newline-delimited JSON.
+
+        Args:
+            latency: Delay added to every request
+            error_rate: Fraction of requests answered with HTTP 500
+            seed: Random seed for the error injection
+            host: Listen address
+            port: Listen port (0 picks a free port)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.policy_updates = []
+        # channel_point -> チャネルの状態（ListChannels と FeeReport の形式）
+        self.channels = {}
+        self.request_count = 0
+        self.error_count = 0
+        # ストリーミングエンドポイント -> 購読中の接続ごとのイベントキュー
+        self.subscribers = {path: [] for path in STREAM_PATHS}
+        self.stopping = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # ヘッダーと本文を別々に書き込むため、Nagle による遅延 ACK 待ちを避ける
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                fake._handle_get(self)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                fake._handle_post(self, body)
+
+        return Handler
+
+    def _should_fail(self):
+        with self.lock:
+            self.request_count += 1
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+            return failed
+
+    def add_channel(self, channel_point, chan_id, capacity, local_balance, fee_per_mil=0, inbound_fee_per_mil=0,
+                    base_fee_msat=1000, active=True):
+        """Register a channel served by /v1/channels and /v1/feereport"""
+        with self.lock:
+            self.channels[channel_point] = {
+                'chan_id': str(chan_id),
+                'active': active,
+                'capacity': int(capacity),
+                'local_balance': int(local_balance),
+                'base_fee_msat': int(base_fee_msat),
+                'fee_per_mil': int(fee_per_mil),
+                'inbound_base_fee_msat': 0,
+                'inbound_fee_per_mil': int(inbound_fee_per_mil),
+            }
+
+    def push_event(self, path, event):
+        """Send an event to every open subscription of a streaming endpoint"""
+        with self.lock:
+            subscribers = list(self.subscribers[path])
+        for events in subscribers:
+            events.put(event)
+
+    def wait_for_subscribers(self, path, count=1, timeout=5.0):
+        """Wait until a streaming endpoint has count subscriptions; True on success"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.subscribers[path]) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def forward_htlc(self, incoming_chan_id, outgoing_chan_id, amt_msat, fee_msat=0, htlc_id=0):
+        """
+        Settle a forwarded HTLC: move the balances and stream its forward and settle events
+
+        Args:
+            incoming_chan_id: chan_id the HTLC arrived on
+            outgoing_chan_id: chan_id it was forwarded to
+            amt_msat: Outgoing amount
+            fee_msat: Routing fee (the incoming amount is amt_msat + fee_msat)
+            htlc_id: HTLC index used on both channels
+        """
+        keys = {
+            'incoming_channel_id': str(incoming_chan_id),
+            'outgoing_channel_id': str(outgoing_chan_id),
+            'incoming_htlc_id': str(htlc_id),
+            'outgoing_htlc_id': str(htlc_id),
+            'event_type': 'FORWARD',
+        }
+        with self.lock:
+            for channel in self.channels.values():
+                if channel['chan_id'] == str(incoming_chan_id):
+                    channel['local_balance'] += (amt_msat + fee_msat) // 1000
+                elif channel['chan_id'] == str(outgoing_chan_id):
+                    channel['local_balance'] -= amt_msat // 1000
+        self.push_event(HTLC_EVENTS_PATH, dict(keys, forward_event={'info': {
+            'incoming_amt_msat': str(amt_msat + fee_msat),
+            'outgoing_amt_msat': str(amt_msat),
+        }}))
+        self.push_event(HTLC_EVENTS_PATH, dict(keys, settle_event={'preimage': ''}))
+
+    def _handle_stream(self, handler, path):
+        events = queue.Queue()
+        with self.lock:
+            self.subscribers[path].append(events)
+
+        # LND と同じく {"result": ...} を1行ずつ chunked で送る
+        def write_chunk(data):
+            handler.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            handler.wfile.flush()
+
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Transfer-Encoding', 'chunked')
+            handler.end_headers()
+            if path == HTLC_EVENTS_PATH:
+                write_chunk(json.dumps({'result': {'subscribed_event': {}}}).encode('utf-8') + b"\n")
+            while not self.stopping.is_set():
+                try:
+                    event = events.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                write_chunk(json.dumps({'result': event}).encode('utf-8') + b"\n")
+            write_chunk(b'')
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.subscribers[path].remove(events)
+            handler.close_connection = True
+
+    def _handle_get(self, handler):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = handler.path.split('?')[0]
+        if path in STREAM_PATHS:
+            self._handle_stream(handler, path)
+            return
+
+        if path not in ('/v1/channels', '/v1/feereport'):
+            handler._send_json(404, {'message': 'not found'})
+            return
+
+        if self._should_fail():
+            handler._send_json(500, {'message': 'injected error'})
+            return
+
+        # LND の REST API と同じく 64 ビット整数は文字列で返す
+        with self.lock:
+            if path == '/v1/channels':
+                body = {'channels': [
+                    {
+                        'active': channel['active'],
+                        'channel_point': channel_point,
+                        'chan_id': channel['chan_id'],
+                        'capacity': str(channel['capacity']),
+                        'local_balance': str(channel['local_balance']),
+                        'remote_balance': str(channel['capacity'] - channel['local_balance']),
+                    }
+                    for channel_point, channel in self.channels.items()
+                ]}
+            else:
+                body = {'channel_fees': [
+                    {
+                        'chan_id': channel['chan_id'],
+                        'channel_point': channel_point,
+                        'base_fee_msat': str(channel['base_fee_msat']),
+                        'fee_per_mil': str(channel['fee_per_mil']),
+                        'fee_rate': channel['fee_per_mil'] / 1000000,
+                        'inbound_base_fee_msat': channel['inbound_base_fee_msat'],
+                        'inbound_fee_per_mil': channel['inbound_fee_per_mil'],
+                    }
+                    for channel_point, channel in self.channels.items()
+                ]}
+        handler._send_json(200, body)
+
+    def _apply_policy(self, data):
+        if data.get('global'):
+            targets = list(self.channels.values())
+        else:
+            point = data.get('chan_point') or {}
+            channel = self.channels.get(f"{point.get('funding_txid_str')}:{point.get('output_index')}")
+            targets = [] if channel is None else [channel]
+        for channel in targets:
+            channel['base_fee_msat'] = int(data.get('base_fee_msat', channel['base_fee_msat']))
+            channel['fee_per_mil'] = int(data.get('fee_rate_ppm', channel['fee_per_mil']))
+            inbound_fee = data.get('inbound_fee') or {}
+            channel['inbound_base_fee_msat'] = int(inbound_fee.get('base_fee_msat', 0))
+            channel['inbound_fee_per_mil'] = int(inbound_fee.get('fee_rate_ppm', 0))
+
+    def _handle_post(self, handler, body):
+        if self.latency:
+            time.sleep(self.latency)
+
+        if handler.path != '/v1/chanpolicy':
+            handler._send_json(404, {'message': 'not found'})
+            return
+
+        if self._should_fail():
+            handler._send_json(500, {'message': 'injected error'})
+            return
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            handler._send_json(400, {'message': 'invalid json'})
+            return
+
+        with self.lock:
+            self.policy_updates.append({'data': data, 'macaroon': handler.headers.get('Grpc-Metadata-macaroon')})
+            self._apply_policy(data)
+        handler._send_json(200, {'failed_updates': []})
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-lnd', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,143 @@
+"""
+End-to-end throughput benchmark for the fee run
+
+Builds a synthetic database, starts a local fake LND REST server and runs
+main() in initial and regular mode with --profile, reporting the per-stage
+timings and channels/sec. Example:
+
+    python -m benchmarks.run_fee_benchmark --channels 10000 --snapshots 100 --latency 0.005
+"""
+import argparse
+import configparser
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_lnd_server import FakeLndServer
+from benchmarks.synthetic_db import build_synthetic_database, write_channel_list
+# main はインポート時に標準出力を UTF-8 で包み直すため、出力を捨てる前に読み込んでおく
+import main as fee_manager
+
+MODES = ('initial', 'regular')
+
+
+def write_config(path, db_file, fixed_list, control_list, api_url, macaroon_path, args):
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config['database'] = {'database_file': db_file}
+    config['channels'] = {'fixed_channel_list': fixed_list, 'control_channel_list': control_list}
+    config['api'] = {
+        'api_url': api_url,
+        'macaroon_path': macaroon_path,
+        'tls_path': '',
+        'timeout': '10',
+        'max_workers': str(args.workers),
+        'max_retries': str(args.max_retries),
+        'retry_backoff': '0',
+        'apply_mode': args.apply_mode,
+    }
+    config['fees'] = {
+        'basefee_msat': '500',
+        'time_lock_delta': '72',
+        'inboundFee_base': '-1000',
+        'inboundFee_ratio': '0, 0, 0, 0, 0.1',
+        'LocalFee_ratio': '1.2, 1, 0.8, 0.6, 0.4',
+        'fee_decreasing_threshold': '0.4',
+    }
+    config['analysis'] = {'data_period': str(args.data_period)}
+    config['debug'] = {'Debug_mode': 'False'}
+    with open(path, 'w', encoding='utf-8') as file:
+        config.write(file)
+
+
+def run_main(config_file, initial, report_file):
+    """
+    Run main() once with --profile and return its timing report
+
+    Regular mode uses --full so that repeated runs evaluate every channel.
+    """
+    argv = ['--config', config_file, '--initial' if initial else '--full', '--profile', report_file]
+    fee_manager.main(argv)
+    with open(report_file, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def report(mode, channels, profile, requests):
+    counters = profile['counters']
+    total = profile['spans']['total']['total_ms'] / 1000
+    print(f"== {mode} mode: {channels} channels, "
+          f"{counters.get('updates.succeeded', 0)} succeeded, {counters.get('updates.failed', 0)} failed, "
+          f"{requests} API requests")
+    for name, span in profile['spans'].items():
+        if name != 'total':
+            print(f"  {name:<16}{span['total_ms']:>12.1f} ms")
+    print(f"  {'total':<16}{total * 1000:>12.1f} ms  ({channels / total:,.0f} channels/sec)")
+    http = profile['histograms'].get('http.chanpolicy')
+    if http:
+        print(f"  {'http p50/p99':<16}{http['p50_ms']:>12.1f} / {http['p99_ms']:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fee run throughput benchmark')
+    parser.add_argument('--channels', type=int, default=1000, help='Number of synthetic channels')
+    parser.add_argument('--snapshots', type=int, default=10, help='Snapshots per channel')
+    parser.add_argument('--data-period', type=int, default=8, help='[analysis] data_period')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake LND latency per request (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--workers', type=int, default=8, help='[api] max_workers')
+    parser.add_argument('--max-retries', type=int, default=0, help='[api] max_retries')
+    parser.add_argument('--apply-mode', default='per_channel', help='[api] apply_mode')
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help='Directory for the generated files (default: temporary)')
+    parser.add_argument('--json', metavar='FILE', help='Also write the results to a JSON file')
+    args = parser.parse_args(argv)
+
+    modes = MODES if args.mode == 'both' else (args.mode,)
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(workdir, exist_ok=True)
+        db_file = os.path.join(workdir, 'benchmark.db')
+        fixed_list = os.path.join(workdir, 'fixed_channel_list.csv')
+        control_list = os.path.join(workdir, 'control_channel_list.csv')
+        macaroon_path = os.path.join(workdir, 'admin.macaroon')
+        config_file = os.path.join(workdir, 'benchmark.conf')
+
+        start = time.perf_counter()
+        channel_ids = build_synthetic_database(db_file, args.channels, args.snapshots, args.seed)
+        print(f"Generated {args.channels} channels x {args.snapshots} snapshots "
+              f"in {time.perf_counter() - start:.1f}s ({db_file})")
+
+        # 1割を固定手数料、残りを制御対象にする
+        split = len(channel_ids) // 10
+        write_channel_list(fixed_list, channel_ids[:split], fee=100)
+        write_channel_list(control_list, channel_ids[split:])
+        with open(macaroon_path, 'wb') as file:
+            file.write(b'benchmark-macaroon')
+
+        server = stack.enter_context(FakeLndServer(args.latency, args.error_rate, args.seed))
+        write_config(config_file, db_file, fixed_list, control_list, server.url, macaroon_path, args)
+
+        results = {}
+        for mode in modes:
+            initial = mode == 'initial'
+            requests_before = server.request_count
+            report_file = os.path.join(workdir, f'profile_{mode}.json')
+            # 計画・適用の各チャネルのログは計測の邪魔になるので捨てる
+            with contextlib.redirect_stdout(io.StringIO()):
+                profile = run_main(config_file, initial, report_file)
+            report(mode, len(channel_ids), profile, server.request_count - requests_before)
+            results[mode] = profile
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'parameters': vars(args), 'results': results}, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,100 @@
+import csv
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from db.migrations import migrate
+
+# スナップショットの基準日時（1時間ごとに記録される想定）
+START_DATE = datetime(2024, 1, 1)
+INSERT_CHUNK = 10000
+
+
+def _channel_id(index):
+    # short channel id 風の数値文字列
+    return str(900000000000000000 + index)
+
+
+def _channel_point(rng):
+    return f"{rng.getrandbits(256):064x}:{rng.randrange(4)}"
+
+
+def build_synthetic_database(db_file, channels=1000, snapshots=10, seed=1, inactive_rate=0.02):
+    """
+    Create a channel_lists / channel_datas database at the given scale
+
+    Local balances follow a bounded random walk so that both the decrease and
+    the ratio-change branches of the regular analysis are exercised.
+
+    Args:
+        db_file: Output SQLite file (overwritten)
+        channels: Number of channels
+        snapshots: Number of snapshots per channel
+        seed: Random seed
+        inactive_rate: Fraction of channels whose latest snapshot is inactive
+
+    Returns:
+        list: Channel IDs in insertion order
+    """
+    if os.path.exists(db_file):
+        os.remove(db_file)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_file)
+    migrate(conn)
+    # 生成時は耐久性が不要なので書き込みを速くする
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    channel_ids = []
+    channel_rows = []
+    for index in range(channels):
+        channel_id = _channel_id(index)
+        channel_ids.append(channel_id)
+        capacity = rng.choice((1000000, 2000000, 5000000, 10000000))
+        channel_rows.append((f"node-{index:06d}", channel_id, _channel_point(rng), capacity))
+    conn.executemany(
+        "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+        channel_rows
+    )
+
+    dates = [(START_DATE + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M:%S') for hour in range(snapshots)]
+    rows = []
+    for (_, channel_id, _, capacity) in channel_rows:
+        balance = rng.randrange(capacity + 1)
+        local_fee = rng.randrange(0, 3000)
+        amboss_fee = rng.randrange(50, 6000)
+        step = capacity // 20
+        inactive = rng.random() < inactive_rate
+        for index, date in enumerate(dates):
+            balance = min(max(balance + rng.randint(-step, step), 0), capacity)
+            active = 0 if inactive and index == snapshots - 1 else 1
+            rows.append((channel_id, date, balance, local_fee, -1000, capacity - balance,
+                         rng.randrange(0, 3000), 0, index, amboss_fee, active))
+            if len(rows) >= INSERT_CHUNK:
+                conn.executemany("INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                rows = []
+    if rows:
+        conn.executemany("INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return channel_ids
+
+
+def write_channel_list(filename, channel_ids, fee=None):
+    """
+    Write a fixed / control channel list CSV (channel_name, channel_id, fee)
+
+    Args:
+        filename: Output CSV path
+        channel_ids: Channel IDs to include
+        fee: Fee column value (defaults to 0)
+    """
+    with open(filename, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["channel_name", "channel_id", "fee"])
+        for channel_id in channel_ids:
+            writer.writerow([channel_id, channel_id, 0 if fee is None else fee])
@@ -0,0 +1,131 @@
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+from datetime import datetime
+
+
+def parse_channel_list(filename, content):
+    """
+    Parse and validate a channel list CSV (channel_name, channel_id, fee)
+
+    The first row is the header. Rows that are too short, have an empty
+    channel_id or a non-integer fee are reported and skipped; for duplicate
+    channel IDs the last row wins.
+
+    Args:
+        filename: File name used in the warnings
+        content: File content as text
+
+    Returns:
+        dict: Dictionary with channel IDs as keys and (channel_name, fee) as values
+    """
+    entries = {}
+    reader = csv.reader(io.StringIO(content))
+    next(reader, None)  # ヘッダー行をスキップ
+    for row in reader:
+        line = reader.line_num
+        if not row or not any(field.strip() for field in row):
+            continue
+        if len(row) < 3:
+            print(f"Warning: {filename}:{line}: expected channel_name, channel_id, fee; skipped")
+            continue
+
+        channel_name, channel_id, fee = row[0].strip(), row[1].strip(), row[2].strip()
+        if not channel_id:
+            print(f"Warning: {filename}:{line}: empty channel_id; skipped")
+            continue
+        try:
+            fee = int(fee)
+        except ValueError:
+            print(f"Warning: {filename}:{line}: invalid fee '{fee}' for channel {channel_id}; skipped")
+            continue
+
+        if channel_id in entries:
+            print(f"Warning: {filename}:{line}: duplicate channel {channel_id}; using the last row")
+        entries[channel_id] = (channel_name, fee)
+    return entries
+
+
+class ChannelListStore:
+    def __init__(self, conn):
+        """
+        Fixed / control channel lists kept in SQLite next to channel_lists
+
+        The CSV files are parsed and validated once and re-imported only when
+        their mtime / size changes and their SHA-256 differs from the last import.
+
+        Args:
+            conn: sqlite3 connection (schema version 4 or later)
+        """
+        self.conn = conn
+
+    def load(self, list_name, filename):
+        """
+        Get a channel list, re-importing the CSV file if it has changed
+
+        Args:
+            list_name: Name of the list ('fixed' or 'control')
+            filename: CSV filename
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and fees (int) as values
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            print(f"Warning: Channel list file {filename} not found")
+            return {}
+
+        try:
+            row = self.conn.execute(
+                "SELECT path, mtime_ns, size, sha256 FROM channel_list_files WHERE list_name = ?",
+                (list_name,)
+            ).fetchone()
+
+            unchanged = row is not None and row[0] == filename and row[1] == stat.st_mtime_ns and row[2] == stat.st_size
+            if not unchanged:
+                with open(filename, 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if row is not None and row[0] == filename and row[3] == digest:
+                    # 内容は同じ（touch されただけ）なので mtime だけ更新する
+                    with self.conn:
+                        self._record_file(list_name, filename, stat, digest)
+                else:
+                    self._import(list_name, filename, stat, digest, data)
+
+            return dict(self.conn.execute(
+                "SELECT channel_id, fee FROM channel_list_entries WHERE list_name = ?",
+                (list_name,)
+            ).fetchall())
+        except (sqlite3.Error, OSError, UnicodeDecodeError) as e:
+            print(f"Error loading channel list: {e}")
+            return {}
+
+    def _record_file(self, list_name, filename, stat, digest):
+        self.conn.execute("""
+            INSERT INTO channel_list_files (list_name, path, mtime_ns, size, sha256, imported_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(list_name) DO UPDATE SET
+                path = excluded.path,
+                mtime_ns = excluded.mtime_ns,
+                size = excluded.size,
+                sha256 = excluded.sha256,
+                imported_at = excluded.imported_at
+        """, (list_name, filename, stat.st_mtime_ns, stat.st_size, digest,
+              datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def _import(self, list_name, filename, stat, digest, data):
+        # UTF-8 (BOM 付きも可) として読み込む
+        entries = parse_channel_list(filename, data.decode('utf-8-sig'))
+        # リストの入れ替えとファイル情報の記録を1つのトランザクションで行う
+        with self.conn:
+            self.conn.execute("DELETE FROM channel_list_entries WHERE list_name = ?", (list_name,))
+            self.conn.executemany(
+                "INSERT INTO channel_list_entries (list_name, channel_id, channel_name, fee) VALUES (?, ?, ?, ?)",
+                [(list_name, channel_id, channel_name, fee) for channel_id, (channel_name, fee) in entries.items()]
+            )
+            self._record_file(list_name, filename, stat, digest)
+        print(f"Imported {len(entries)} channels from {filename}")
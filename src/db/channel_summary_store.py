@@ -0,0 +1,110 @@
+import json
+import sqlite3
+from dataclasses import astuple, fields, replace
+from models.channel_summary import ChannelSummary
+from utils.profiling import profiler
+
+SUMMARY_COLUMNS = tuple(field.name for field in fields(ChannelSummary))
+
+
+class ChannelSummaryStore:
+    def __init__(self, conn, read_conn=None):
+        """
+        Per-channel rolling summaries kept in SQLite next to channel_datas
+
+        Each refresh folds only the snapshots newer than the stored summary
+        into it. A summary that is missing, or was built with a different
+        capacity, is rebuilt from the channel's full history.
+
+        Args:
+            conn: Read-write sqlite3 connection (schema version 5 or later)
+            read_conn: Read-only connection for the channel_datas reads (default: conn)
+        """
+        self.conn = conn
+        self.read_conn = conn if read_conn is None else read_conn
+
+    @profiler.timed('sql.refresh_channel_summaries')
+    def refresh(self, channel_ids=None):
+        """
+        Bring the summaries up to date with channel_datas
+
+        Args:
+            channel_ids: Optional list of channel IDs to restrict the refresh to
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and ChannelSummary as values
+                  (channels without snapshots are omitted)
+        """
+        if channel_ids is None:
+            channel_filter = ""
+            params = ()
+        else:
+            channel_filter = "WHERE l.channel_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(channel_ids)),)
+
+        try:
+            summaries = self._load(channel_filter, params)
+
+            # 保存済みの要約より新しい行だけを読む（要約がない・容量が変わったチャネルは全履歴）
+            rows = self.read_conn.execute(f"""
+                SELECT l.channel_id, l.capacity, d.date, d.local_balance, d.local_fee,
+                       d.local_infee, d.amboss_fee, d.active
+                FROM channel_lists l
+                LEFT JOIN channel_summary s
+                  ON s.channel_id = l.channel_id AND s.capacity = l.capacity
+                JOIN channel_datas d
+                  ON d.channel_id = l.channel_id AND d.date > COALESCE(s.last_date, '')
+                {channel_filter}
+                ORDER BY l.channel_id, d.date
+            """, params)
+
+            updated = {}
+            for channel_id, capacity, *snapshot in rows:
+                summary = updated.get(channel_id)
+                if summary is None:
+                    summary = summaries.get(channel_id)
+                    if summary is None or summary.capacity != capacity:
+                        summary = ChannelSummary.empty(channel_id, capacity)
+                summary = summary.append(*snapshot)
+                updated[channel_id] = summary
+
+            if updated:
+                with self.conn:
+                    self.conn.executemany(f"""
+                        INSERT OR REPLACE INTO channel_summary ({', '.join(SUMMARY_COLUMNS)})
+                        VALUES ({', '.join('?' * len(SUMMARY_COLUMNS))})
+                    """, [astuple(summary) for summary in updated.values()])
+
+            summaries.update(updated)
+            return summaries
+        except sqlite3.Error as e:
+            print(f"Error refreshing channel summaries: {e}")
+            return {}
+
+    def rebuild(self):
+        """
+        Drop every summary and rebuild them from the full history
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and ChannelSummary as values
+        """
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM channel_summary")
+        except sqlite3.Error as e:
+            print(f"Error clearing channel summaries: {e}")
+            return {}
+        return self.refresh()
+
+    def _load(self, channel_filter, params):
+        summaries = {}
+        for row in self.read_conn.execute(f"""
+            SELECT {', '.join('s.' + column for column in SUMMARY_COLUMNS)}
+            FROM channel_summary s
+            JOIN channel_lists l ON l.channel_id = s.channel_id
+            {channel_filter}
+        """, params):
+            # active は INTEGER として保存されている
+            summary = replace(ChannelSummary(*row), active=bool(row[SUMMARY_COLUMNS.index('active')]))
+            summaries[summary.channel_id] = summary
+        return summaries
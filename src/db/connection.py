@@ -0,0 +1,108 @@
+import os
+import re
+import sqlite3
+from urllib.request import pathname2url
+
+# 分析用の読み取り接続に設定する既定の PRAGMA
+DEFAULT_PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,  # 履歴の大きなスキャンはメモリマップ I/O で読む
+    'cache_size': -64 * 1024,        # 負の値は KiB 単位（64 MiB）
+    'temp_store': 'MEMORY',
+}
+
+# PRAGMA の値として許可するキーワード（MEMORY など）
+_PRAGMA_KEYWORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# プリペアドステートメントのキャッシュ数（sqlite3 の既定は 128）
+CACHED_STATEMENTS = 256
+
+# 収集プロセスの書き込みと重なった場合に待つ時間（ミリ秒）
+BUSY_TIMEOUT_MS = 5000
+
+
+def is_file_database(db_file):
+    """True if db_file refers to an on-disk database (not :memory: or a URI)"""
+    return bool(db_file) and db_file != ':memory:' and not db_file.startswith('file:')
+
+
+def apply_pragmas(conn, pragmas):
+    """
+    Apply PRAGMA settings to a connection
+
+    PRAGMA statements cannot take bound parameters, so the names are limited
+    to DEFAULT_PRAGMAS and the values to integers or keywords before they are
+    formatted into the statement.
+
+    Args:
+        conn: sqlite3 connection
+        pragmas: Dictionary of PRAGMA names and values
+
+    Raises:
+        ValueError: If a name is not allowed or a value is not an integer or keyword
+    """
+    for name, value in pragmas.items():
+        if name not in DEFAULT_PRAGMAS:
+            raise ValueError(f"PRAGMA {name!r} is not allowed (allowed: {', '.join(DEFAULT_PRAGMAS)})")
+        if isinstance(value, bool) or not (
+                isinstance(value, int) or (isinstance(value, str) and _PRAGMA_KEYWORD.fullmatch(value))):
+            raise ValueError(f"Invalid value for PRAGMA {name}: {value!r}")
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def ensure_wal(conn):
+    """
+    Switch the database to WAL mode (persistent, a no-op if already enabled)
+
+    In WAL mode readers never block the collector's writes and vice versa.
+
+    Args:
+        conn: Read-write sqlite3 connection
+
+    Returns:
+        str: Journal mode after the change
+    """
+    try:
+        journal_mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    except sqlite3.OperationalError as e:
+        # 他のプロセスがロックしている場合は現在のモードのまま続ける
+        print(f"Warning: could not enable WAL mode: {e}")
+        return conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode.lower() != 'wal':
+        print(f"Warning: database journal mode is {journal_mode}, not WAL")
+    return journal_mode
+
+
+def connect_read_write(db_file):
+    """
+    Open the connection used for migrations and the state tables
+
+    Args:
+        db_file: Database file
+
+    Returns:
+        sqlite3.Connection: Read-write connection in WAL mode
+    """
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+    if is_file_database(db_file):
+        ensure_wal(conn)
+        # WAL では NORMAL でもコミット済みデータは失われない
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def connect_read_only(db_file, pragmas=None):
+    """
+    Open the read-only analysis connection via a mode=ro URI
+
+    Args:
+        db_file: Database file
+        pragmas: PRAGMA settings (default: DEFAULT_PRAGMAS)
+
+    Returns:
+        sqlite3.Connection: Read-only connection
+    """
+    uri = f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+    apply_pragmas(conn, DEFAULT_PRAGMAS if pragmas is None else pragmas)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
@@ -1,52 +1,68 @@
 import sqlite3
+import json
 from datetime import datetime, timedelta
 from models.channel import Channel
 from models.channel_data import ChannelData
+from models.channel_history import ChannelHistory
+from db.migrations import migrate
+from db.connection import connect_read_only, connect_read_write, is_file_database
+from utils.profiling import profiler
 
 class Database:
-    def __init__(self, db_file):
+    def __init__(self, db_file, pragmas=None):
+        """
+        Access to the node database shared with the collector process
+
+        Two connections are used: conn (read-write, WAL mode) for migrations
+        and the fee manager's own state tables, and read_conn (read-only URI,
+        tuned for large scans) for the channel_datas analysis queries.
+
+        Args:
+            db_file: Database file
+            pragmas: PRAGMA settings of the read-only connection (default: db.connection.DEFAULT_PRAGMAS)
+        """
         self.db_file = db_file
+        self.pragmas = pragmas
         self.conn = None
         self.cursor = None
+        self.read_conn = None
+        self.read_cursor = None
 
     def connect(self):
         """Connect to the SQLite database"""
         try:
-            self.conn = sqlite3.connect(self.db_file)
+            self.conn = connect_read_write(self.db_file)
             self.cursor = self.conn.cursor()
+            if is_file_database(self.db_file):
+                self.read_conn = connect_read_only(self.db_file, self.pragmas)
+            else:
+                # インメモリのデータベースは別の接続から参照できないため共有する
+                self.read_conn = self.conn
+            self.read_cursor = self.read_conn.cursor()
             return True
-        except sqlite3.Error as e:
+        except (sqlite3.Error, ValueError) as e:
+            # ValueError は設定ファイルの PRAGMA 名・値が不正な場合
             print(f"Database connection error: {e}")
             return False
 
     def create_tables(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channel_lists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_name TEXT NOT NULL,
-                channel_id TEXT NOT NULL UNIQUE,
-                channel_point TEXT NOT NULL,
-                capacity INTEGER NOT NULL
-            )
-        ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channel_datas (
-                channel_id TEXT NOT NULL,
-                date TEXT NOT NULL,
-                local_balance INTEGER,
-                local_fee INTEGER,
-                local_infee INTEGER,
-                remote_balance INTEGER,
-                remote_fee INTEGER,
-                remote_infee INTEGER,
-                num_updates INTEGER,
-                amboss_fee INTEGER,
-                active INTEGER,
-                FOREIGN KEY (channel_id) REFERENCES channel_lists (channel_id)
-            )
-        ''')
-        self.conn.commit()
+        """Create the tables and indexes by applying all schema migrations"""
+        self.migrate()
 
+    def migrate(self):
+        """
+        Upgrade the database schema in place to the latest version
+
+        Returns:
+            int: Schema version after the upgrade, or None on error
+        """
+        try:
+            return migrate(self.conn)
+        except sqlite3.Error as e:
+            print(f"Database migration error: {e}")
+            return None
+
+    @profiler.timed('sql.get_latest_channel_data')
     def get_latest_channel_data(self, channel_id, data_period):
         query = '''
             SELECT * FROM channel_datas
@@ -54,14 +70,35 @@ class Database:
             ORDER BY date DESC
             LIMIT ?
         '''
-        self.cursor.execute(query, (channel_id, data_period))
-        return self.cursor.fetchall()
+        self.read_cursor.execute(query, (channel_id, data_period))
+        return self.read_cursor.fetchall()
+
+    @profiler.timed('sql.get_snapshot_marker')
+    def get_snapshot_marker(self):
+        """
+        Get a cheap marker that changes whenever new snapshot rows are written
+
+        Returns:
+            int: Largest rowid in channel_datas, or None if unavailable
+        """
+        if not self.read_cursor:
+            return None
+
+        try:
+            self.read_cursor.execute("SELECT MAX(rowid) FROM channel_datas")
+            return self.read_cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Error fetching snapshot marker: {e}")
+            return None
 
     def close(self):
         """Close the database connection"""
+        if self.read_conn and self.read_conn is not self.conn:
+            self.read_conn.close()
         if self.conn:
             self.conn.close()
 
+    @profiler.timed('sql.get_channels')
     def get_channels(self):
         """
         Get all channels from the channel_lists table
@@ -69,17 +106,17 @@ class Database:
         Returns:
             list: List of Channel objects
         """
-        if not self.cursor:
+        if not self.read_cursor:
             return []
             
         try:
-            self.cursor.execute("""
+            self.read_cursor.execute("""
                 SELECT id, channel_name, channel_id, channel_point, capacity
                 FROM channel_lists
             """)
             
             channels = []
-            for row in self.cursor.fetchall():
+            for row in self.read_cursor.fetchall():
                 channel = Channel(
                     id=row[0],
                     channel_name=row[1],
@@ -94,6 +131,69 @@ class Database:
             print(f"Error fetching channels: {e}")
             return []
 
+    def iter_channels_with_latest_data(self):
+        """
+        Stream every channel joined with its latest snapshot, one row at a time
+
+        The latest date of each channel is looked up through the
+        (channel_id, date) index, so the whole export is a single pass and
+        rows are never materialized as a list.
+
+        Yields:
+            tuple: (channel_name, channel_id, channel_point, capacity, date,
+                    local_balance, local_fee, local_infee, amboss_fee, active);
+                   the snapshot columns are None for channels without data
+        """
+        if not self.read_conn:
+            return
+
+        # self.read_cursor は他のクエリと共有しているため専用のカーソルを使う
+        cursor = self.read_conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT l.channel_name, l.channel_id, l.channel_point, l.capacity,
+                       d.date, d.local_balance, d.local_fee, d.local_infee, d.amboss_fee, d.active
+                FROM channel_lists l
+                LEFT JOIN channel_datas d
+                  ON d.channel_id = l.channel_id
+                 AND d.date = (
+                     SELECT MAX(date) FROM channel_datas WHERE channel_id = l.channel_id
+                 )
+                ORDER BY l.id
+            """)
+            yield from cursor
+        except sqlite3.Error as e:
+            print(f"Error fetching channels: {e}")
+        finally:
+            cursor.close()
+
+    def iter_channel_history(self):
+        """
+        Stream every snapshot in channel_datas in time order, one row at a time
+
+        The rows are read through the date index, so no sort or temporary
+        table is needed and memory use does not depend on the history size.
+
+        Yields:
+            tuple: (channel_id, date, local_balance, local_fee, local_infee, amboss_fee, active)
+        """
+        if not self.read_conn:
+            return
+
+        cursor = self.read_conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT channel_id, date, local_balance, local_fee, local_infee, amboss_fee, active
+                FROM channel_datas INDEXED BY ix_channel_datas_date
+                ORDER BY date
+            """)
+            yield from cursor
+        except sqlite3.Error as e:
+            print(f"Error fetching channel history: {e}")
+        finally:
+            cursor.close()
+
+    @profiler.timed('sql.get_recent_channel_data')
     def get_recent_channel_data(self, channel_id, limit):
         """
         Get the most recent N channel data records for the specified channel
@@ -103,45 +203,175 @@ class Database:
             limit: Number of most recent records to retrieve
             
         Returns:
-            list: List of ChannelData objects
+            ChannelHistory: Records (oldest first) with ChannelData row views
         """
-        if not self.cursor:
-            return []
+        if not self.read_cursor:
+            return ChannelHistory(channel_id)
             
         try:
-            self.cursor.execute("""
+            self.read_cursor.execute("""
                 SELECT channel_id, date, local_balance, local_fee, local_infee,
                        remote_balance, remote_fee, remote_infee, num_updates,
                        amboss_fee, active
-                FROM channel_datas
-                WHERE channel_id = ?
-                ORDER BY date DESC
-                LIMIT ?
+                FROM (
+                    SELECT * FROM channel_datas
+                    WHERE channel_id = ?
+                    ORDER BY date DESC
+                    LIMIT ?
+                )
+                ORDER BY date ASC
             """, (channel_id, limit))
             
-            rows = self.cursor.fetchall()
-            
-            # 日付の降順で取得したデータを昇順に並べ替え
-            rows.reverse()
+            history = ChannelHistory(channel_id)
+            for row in self.read_cursor:
+                history.append(*row[1:])
             
-            channel_data_list = []
-            for row in rows:
-                channel_data = ChannelData(
-                    channel_id=row[0],
-                    date=row[1],
-                    local_balance=row[2],
-                    local_fee=row[3],
-                    local_infee=row[4],
-                    remote_balance=row[5],
-                    remote_fee=row[6],
-                    remote_infee=row[7],
-                    num_updates=row[8],
-                    amboss_fee=row[9],
-                    active=bool(row[10])
+            return history
+        except sqlite3.Error as e:
+            print(f"Error fetching channel data: {e}")
+            return ChannelHistory(channel_id)
+
+    @profiler.timed('sql.get_recent_channel_data_bulk')
+    def get_recent_channel_data_bulk(self, limit, channel_ids=None):
+        """
+        Get the most recent N channel data records for every channel in one query
+
+        Args:
+            limit: Number of most recent records to retrieve per channel
+            channel_ids: Optional list of channel IDs to restrict the query to
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and ChannelHistory
+                  (oldest first) as values
+        """
+        if not self.read_cursor:
+            return {}
+
+        if channel_ids is None:
+            channel_filter = ""
+            params = (limit,)
+        else:
+            channel_filter = "WHERE channel_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(channel_ids)), limit)
+
+        try:
+            self.read_cursor.execute(f"""
+                SELECT channel_id, date, local_balance, local_fee, local_infee,
+                       remote_balance, remote_fee, remote_infee, num_updates,
+                       amboss_fee, active
+                FROM (
+                    SELECT *,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY channel_id ORDER BY date DESC
+                           ) AS rn
+                    FROM channel_datas
+                    {channel_filter}
                 )
-                channel_data_list.append(channel_data)
-            
-            return channel_data_list
+                WHERE rn <= ?
+                ORDER BY channel_id, date ASC
+            """, params)
+
+            channel_data_map = {}
+            history = None
+            for row in self.read_cursor:
+                # channel_id 順に並んでいるので切り替わった時だけ辞書に追加する
+                if history is None or history.channel_id != row[0]:
+                    history = ChannelHistory(row[0])
+                    channel_data_map[row[0]] = history
+                history.append(*row[1:])
+
+            return channel_data_map
+        except sqlite3.Error as e:
+            print(f"Error fetching channel data: {e}")
+            return {}
+
+    @profiler.timed('sql.get_channel_data_as_of')
+    def get_channel_data_as_of(self, timestamp):
+        """
+        Get the latest snapshot of every channel taken at or before a time
+
+        Args:
+            timestamp: Date string in the channel_datas format ('YYYY-MM-DD HH:MM:SS')
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and ChannelData as values
+                  (channels without a snapshot by then are omitted)
+        """
+        if not self.read_cursor:
+            return {}
+
+        try:
+            # (channel_id, date) のインデックスでチャネルごとに1行だけ探す
+            self.read_cursor.execute("""
+                SELECT d.channel_id, d.date, d.local_balance, d.local_fee, d.local_infee,
+                       d.remote_balance, d.remote_fee, d.remote_infee, d.num_updates,
+                       d.amboss_fee, d.active
+                FROM channel_lists l
+                JOIN channel_datas d ON d.channel_id = l.channel_id AND d.date = (
+                    SELECT MAX(date) FROM channel_datas
+                    WHERE channel_id = l.channel_id AND date <= ?
+                )
+            """, (timestamp,))
+            return {row[0]: ChannelData(*row[:10], bool(row[10])) for row in self.read_cursor}
         except sqlite3.Error as e:
             print(f"Error fetching channel data: {e}")
-            return []
\ No newline at end of file
+            return {}
+
+    @profiler.timed('sql.get_channels_with_new_data')
+    def get_channels_with_new_data(self):
+        """
+        Get the channels that have snapshots newer than their last evaluation
+
+        Each channel's latest snapshot (one lookup on the (channel_id, date)
+        index) is compared with its own evaluated date, so channels left
+        unmarked after a failed or deferred update, and late rows of any
+        channel, are picked up by the next run. Channels that have never been
+        evaluated are included.
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and their latest snapshot date as values
+        """
+        if not self.read_cursor:
+            return {}
+
+        try:
+            self.read_cursor.execute("""
+                SELECT channel_id, last_date
+                FROM (
+                    SELECT l.channel_id,
+                           (SELECT MAX(d.date) FROM channel_datas d WHERE d.channel_id = l.channel_id) AS last_date,
+                           e.last_date AS evaluated_date
+                    FROM channel_lists l
+                    LEFT JOIN channel_eval_state e ON e.channel_id = l.channel_id
+                )
+                WHERE last_date IS NOT NULL
+                  AND (evaluated_date IS NULL OR last_date > evaluated_date)
+            """)
+            return dict(self.read_cursor.fetchall())
+        except sqlite3.Error as e:
+            print(f"Error fetching channels with new data: {e}")
+            return {}
+
+    @profiler.timed('sql.mark_channels_evaluated')
+    def mark_channels_evaluated(self, last_dates):
+        """
+        Record the latest evaluated snapshot date for each channel
+
+        Args:
+            last_dates: Dictionary with channel IDs as keys and snapshot dates as values
+        """
+        if not self.cursor or not last_dates:
+            return
+
+        evaluated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self.cursor.executemany("""
+                INSERT INTO channel_eval_state (channel_id, last_date, evaluated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    last_date = excluded.last_date,
+                    evaluated_at = excluded.evaluated_at
+            """, [(channel_id, last_date, evaluated_at) for channel_id, last_date in last_dates.items()])
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving evaluation state: {e}")
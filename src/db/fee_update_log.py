@@ -0,0 +1,107 @@
+import sqlite3
+from dataclasses import astuple, fields
+from datetime import datetime
+from models.fee_update import FeeUpdateRecord
+from utils.profiling import profiler
+
+FEE_UPDATE_COLUMNS = tuple(field.name for field in fields(FeeUpdateRecord))
+
+# Debug_mode で送信しなかった更新の error 列に記録する値
+DRY_RUN_ERROR = 'dry run (Debug_mode): not sent to LND'
+
+
+class FeeUpdateLog:
+    def __init__(self, conn):
+        """
+        Audit log of the policy updates sent to LND
+
+        All rows of a run are inserted in a single transaction.
+
+        Args:
+            conn: Read-write sqlite3 connection (schema version 7 or later)
+        """
+        self.conn = conn
+
+    def record_results(self, results, fee_calculator, timestamp=None):
+        """
+        Log the results of a FeeUpdateExecutor run
+
+        Dry-run results (Debug_mode) are logged as not applied.
+
+        Args:
+            results: FeeUpdateResult records whose channel is a PolicyChange
+            fee_calculator: FeeCalculator that derived max_htlc_msat
+            timestamp: Time of the run (default: now)
+
+        Returns:
+            int: Number of rows written
+        """
+        timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        records = []
+        for result in results:
+            change = result.channel
+            if getattr(change, 'new_local_fee', None) is None:
+                continue
+            dry_run = getattr(result, 'dry_run', False)
+            max_htlc_msat = None
+            if result.local_balance is not None:
+                max_htlc_msat = fee_calculator.get_max_htlc_msat(result.local_balance)
+            records.append(FeeUpdateRecord(
+                channel_id=change.channel_id,
+                timestamp=timestamp,
+                old_local_fee=change.old_local_fee,
+                new_local_fee=change.new_local_fee,
+                old_inbound_fee=change.old_inbound_fee,
+                new_inbound_fee=change.new_inbound_fee,
+                max_htlc_msat=max_htlc_msat,
+                reason=change.reason,
+                ratio=change.ratio,
+                success=bool(result.success) and not dry_run,
+                error=DRY_RUN_ERROR if dry_run else result.error,
+            ))
+        return self.record(records)
+
+    @profiler.timed('sql.record_fee_updates')
+    def record(self, records):
+        """
+        Insert FeeUpdateRecord rows with one commit
+
+        Returns:
+            int: Number of rows written
+        """
+        if not records:
+            return 0
+        placeholders = ', '.join('?' for _ in FEE_UPDATE_COLUMNS)
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO fee_updates ({', '.join(FEE_UPDATE_COLUMNS)}) VALUES ({placeholders})",
+                    [astuple(record) for record in records]
+                )
+        except sqlite3.Error as e:
+            print(f"Error saving fee update log: {e}")
+            return 0
+        return len(records)
+
+    def get_channel_history(self, channel_id, limit=None):
+        """
+        Get the logged updates of one channel, newest first
+
+        Args:
+            channel_id: The channel ID
+            limit: Maximum number of rows (default: all)
+
+        Returns:
+            list: FeeUpdateRecord rows
+        """
+        try:
+            rows = self.conn.execute(f"""
+                SELECT {', '.join(FEE_UPDATE_COLUMNS)} FROM fee_updates
+                WHERE channel_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            """, (channel_id, -1 if limit is None else limit))
+            return [FeeUpdateRecord(*row[:-2], bool(row[-2]), row[-1]) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Error loading fee update log: {e}")
+            return []
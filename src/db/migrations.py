@@ -0,0 +1,251 @@
+import sqlite3
+
+# スキーマバージョンは PRAGMA user_version に記録する。
+# 新しいマイグレーションは末尾に (バージョン, 説明, 関数) の形で追加すること。
+
+
+def _create_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_lists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_name TEXT NOT NULL,
+            channel_id TEXT NOT NULL UNIQUE,
+            channel_point TEXT NOT NULL,
+            capacity INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_datas (
+            channel_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            local_balance INTEGER,
+            local_fee INTEGER,
+            local_infee INTEGER,
+            remote_balance INTEGER,
+            remote_fee INTEGER,
+            remote_infee INTEGER,
+            num_updates INTEGER,
+            amboss_fee INTEGER,
+            active INTEGER,
+            FOREIGN KEY (channel_id) REFERENCES channel_lists (channel_id)
+        )
+    ''')
+
+
+# 重複として削除する行の条件（(channel_id, date) ごとに最後に書き込まれた行を残す）
+_DUPLICATE_ROWS = "rowid NOT IN (SELECT MAX(rowid) FROM channel_datas GROUP BY channel_id, date)"
+# 削除した重複行を列挙する上限
+_DUPLICATE_REPORT_LIMIT = 10
+
+
+def _add_channel_datas_indexes(cursor):
+    # 一意制約を張る前に (channel_id, date) の重複行を取り除く。
+    # 収集側のデータを黙って失わないよう、削除する行は channel_datas_duplicates に退避する
+    duplicates = cursor.execute(f"""
+        SELECT channel_id, date, COUNT(*) FROM channel_datas
+        WHERE {_DUPLICATE_ROWS}
+        GROUP BY channel_id, date
+        ORDER BY channel_id, date
+    """).fetchall()
+    if duplicates:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_datas_duplicates (
+                channel_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                local_balance INTEGER,
+                local_fee INTEGER,
+                local_infee INTEGER,
+                remote_balance INTEGER,
+                remote_fee INTEGER,
+                remote_infee INTEGER,
+                num_updates INTEGER,
+                amboss_fee INTEGER,
+                active INTEGER,
+                removed_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute(f"""
+            INSERT INTO channel_datas_duplicates
+            SELECT channel_id, date, local_balance, local_fee, local_infee, remote_balance, remote_fee,
+                   remote_infee, num_updates, amboss_fee, active, datetime('now', 'localtime')
+            FROM channel_datas
+            WHERE {_DUPLICATE_ROWS}
+        """)
+        cursor.execute(f"DELETE FROM channel_datas WHERE {_DUPLICATE_ROWS}")
+        print(f"Warning: moved {cursor.rowcount} duplicate rows of {len(duplicates)} (channel_id, date) keys "
+              f"from channel_datas to channel_datas_duplicates (the last written row of each key was kept):")
+        for channel_id, date, count in duplicates[:_DUPLICATE_REPORT_LIMIT]:
+            print(f"  {channel_id} {date}: {count} removed")
+        if len(duplicates) > _DUPLICATE_REPORT_LIMIT:
+            print(f"  ... and {len(duplicates) - _DUPLICATE_REPORT_LIMIT} more keys")
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_channel_datas_channel_date
+        ON channel_datas (channel_id, date)
+    ''')
+    # 分析で参照する列を含めたカバリングインデックス（テーブル本体を読まずに済む）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_channel_datas_channel_date_cover
+        ON channel_datas (
+            channel_id, date DESC,
+            local_balance, local_fee, local_infee, amboss_fee, active
+        )
+    ''')
+
+
+def _add_channel_eval_state(cursor):
+    # 前回評価したスナップショットの日時（チャネルごとのハイウォーターマーク）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_eval_state (
+            channel_id TEXT PRIMARY KEY,
+            last_date TEXT NOT NULL,
+            evaluated_at TEXT NOT NULL
+        )
+    ''')
+    # 前回以降の新しい行だけを日付で絞り込むためのインデックス
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_channel_datas_date
+        ON channel_datas (date)
+    ''')
+
+
+def _add_channel_list_store(cursor):
+    # 固定・制御チャネルリスト CSV の取り込み元（mtime とハッシュで変更を検出する）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_list_files (
+            list_name TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            imported_at TEXT NOT NULL
+        )
+    ''')
+    # 検証済みのリスト行（fee は整数で保持する）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_list_entries (
+            list_name TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            channel_name TEXT NOT NULL,
+            fee INTEGER NOT NULL,
+            PRIMARY KEY (list_name, channel_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_channel_summary(cursor):
+    # チャネルごとの最新スナップショットと、残高区間・ローカル手数料の連続数
+    # （ChannelSummaryStore が新しい行を畳み込んで更新する。なければ履歴から作り直す）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_summary (
+            channel_id TEXT PRIMARY KEY,
+            capacity INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            last_date TEXT NOT NULL,
+            local_balance INTEGER,
+            local_fee INTEGER,
+            local_infee INTEGER,
+            amboss_fee INTEGER,
+            active INTEGER NOT NULL,
+            range_flags INTEGER NOT NULL,
+            range_run INTEGER NOT NULL,
+            fee_run INTEGER NOT NULL
+        )
+    ''')
+
+
+def _add_update_scheduler_state(cursor):
+    # UpdateScheduler の状態（チャネルごとの最終更新時刻と全体のトークンバケット、UNIX 時刻の秒）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_update_state (
+            channel_id TEXT PRIMARY KEY,
+            last_update REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS update_budget (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+
+def _add_fee_updates(cursor):
+    # 送信したポリシー更新の監査ログ（実行ごとに1トランザクションでまとめて書き込む）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fee_updates (
+            id INTEGER PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            old_local_fee INTEGER,
+            new_local_fee INTEGER NOT NULL,
+            old_inbound_fee INTEGER,
+            new_inbound_fee INTEGER NOT NULL,
+            max_htlc_msat INTEGER,
+            reason TEXT,
+            ratio REAL,
+            success INTEGER NOT NULL,
+            error TEXT
+        )
+    ''')
+    # チャネルごとの履歴を新しい順に引くためのインデックス
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS ix_fee_updates_channel_timestamp
+        ON fee_updates (channel_id, timestamp)
+    ''')
+
+
+MIGRATIONS = [
+    (1, "create channel_lists and channel_datas", _create_base_tables),
+    (2, "add unique and covering indexes on channel_datas (channel_id, date)", _add_channel_datas_indexes),
+    (3, "add channel_eval_state and date index", _add_channel_eval_state),
+    (4, "add channel_list_files and channel_list_entries", _add_channel_list_store),
+    (5, "add channel_summary", _add_channel_summary),
+    (6, "add channel_update_state and update_budget", _add_update_scheduler_state),
+    (7, "add fee_updates audit log", _add_fee_updates),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Return the schema version stored in PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply all pending migrations to the database in place
+
+    Each migration runs in its own transaction together with the
+    user_version update, so an interrupted upgrade can simply be re-run.
+
+    Args:
+        conn: sqlite3 connection
+
+    Returns:
+        int: Schema version after the upgrade
+    """
+    current_version = get_schema_version(conn)
+
+    for version, description, apply in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        cursor = conn.cursor()
+        try:
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+        print(f"Applied database migration {version}: {description}")
+        current_version = version
+
+    return current_version
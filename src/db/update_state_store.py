@@ -0,0 +1,82 @@
+import json
+import sqlite3
+from utils.profiling import profiler
+
+
+class UpdateStateStore:
+    def __init__(self, conn):
+        """
+        Persistent state of the UpdateScheduler
+
+        Keeps the time of the last successful policy update of each channel
+        and the token bucket of the global update budget, so cooldowns and the
+        budget carry over between runs and processes.
+
+        Args:
+            conn: Read-write sqlite3 connection (schema version 6 or later)
+        """
+        self.conn = conn
+
+    @profiler.timed('sql.load_last_updates')
+    def load_last_updates(self, channel_ids):
+        """
+        Get the last update time of the given channels
+
+        Args:
+            channel_ids: Iterable of channel IDs
+
+        Returns:
+            dict: Dictionary with channel IDs as keys and UNIX times as values
+                  (channels never updated are omitted)
+        """
+        try:
+            rows = self.conn.execute("""
+                SELECT channel_id, last_update FROM channel_update_state
+                WHERE channel_id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(list(channel_ids)),))
+            return dict(rows)
+        except sqlite3.Error as e:
+            print(f"Error loading update state: {e}")
+            return {}
+
+    def save_last_updates(self, last_updates):
+        """
+        Record the time of successful policy updates
+
+        Args:
+            last_updates: Dictionary with channel IDs as keys and UNIX times as values
+        """
+        if not last_updates:
+            return
+        try:
+            self.conn.executemany("""
+                INSERT INTO channel_update_state (channel_id, last_update) VALUES (?, ?)
+                ON CONFLICT (channel_id) DO UPDATE SET last_update = excluded.last_update
+            """, last_updates.items())
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving update state: {e}")
+
+    def load_budget(self):
+        """
+        Get the stored token bucket
+
+        Returns:
+            tuple: (tokens, updated_at), or None if no budget has been stored yet
+        """
+        try:
+            return self.conn.execute("SELECT tokens, updated_at FROM update_budget WHERE id = 1").fetchone()
+        except sqlite3.Error as e:
+            print(f"Error loading update budget: {e}")
+            return None
+
+    def save_budget(self, tokens, updated_at):
+        """Store the token bucket"""
+        try:
+            self.conn.execute("""
+                INSERT INTO update_budget (id, tokens, updated_at) VALUES (1, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            """, (tokens, updated_at))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving update budget: {e}")
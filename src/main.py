@@ -4,6 +4,9 @@ import argparse
 import sys
 import io
 import os
+import gzip
+import cProfile
+import multiprocessing
 
 # config.pyからのインポートを削除
 # from config import (
@@ -20,67 +23,165 @@ import os
 # 代わりにConfigLoaderをインポート
 from services.config_loader import ConfigLoader
 from db.database import Database
+from db.channel_list_store import ChannelListStore
+from db.channel_summary_store import ChannelSummaryStore
+from db.fee_update_log import FeeUpdateLog
 from services.fee_calculator import FeeCalculator
 from services.data_analyzer import DataAnalyzer
+from services.update_executor import FeeUpdateExecutor
+from services.update_scheduler import create_update_scheduler
+from services.daemon import FeeManagerDaemon
+from services.event_stream import EventStreamRunner
+from services.metrics import MetricsServer, metrics
+from services.fee_policy import FeePolicy, parse_policy_overrides
+from services.policy_planner import PolicyPlanner, export_plan
+from services.live_state import drop_live_noops, fetch_live_state, merge_live_state, merge_live_state_frame
+from services.restore import parse_restore_time, plan_restore
+from services.backtest import print_backtest_result, run_backtest
+from services.parameter_sweep import RANK_METRICS, expand_grid, parse_grid, run_parameter_sweep
+from services.policy_batcher import APPLY_COALESCED, APPLY_GLOBAL, coalesce_policy_changes, count_update_calls
+from services.node_runner import RunSummary, print_node_summary, run_nodes
+from utils.profiling import profiler
 
 # エンコーディングを設定
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-# グローバル変数として宣言
-database_file = None
-fixed_channel_list = None
-control_channel_list = None
-inboundFee_base = None
-inboundFee_ratio = None
-LocalFee_ratio = None
-data_period = None
-fee_decreasing_threshold = None
-
-def main():
-    global database_file, fixed_channel_list, control_channel_list
-    global inboundFee_base, inboundFee_ratio, LocalFee_ratio
-    global data_period, fee_decreasing_threshold
-
+def main(argv=None):
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Lightning Network Fee Manager')
     parser.add_argument('--initial', action='store_true', help='Initial fee setup mode')
     parser.add_argument('--channel_download', action='store_true', help='Download all channel info to CSV')
+    parser.add_argument('--gzip', action='store_true', help='Compress the --channel_download CSV with gzip')
+    parser.add_argument('--daemon', action='store_true', help='Keep running and re-evaluate channels periodically')
+    parser.add_argument('--stream', action='store_true',
+                        help="Follow LND's channel and HTLC event streams and adjust fees when a balance range changes")
+    parser.add_argument('--full', action='store_true', help='Re-evaluate all channels, not only those with new data')
+    parser.add_argument('--vectorized', action='store_true', help='Use the vectorized (pandas/NumPy) analysis engine')
+    parser.add_argument('--summary', action='store_true',
+                        help='Use the rolling per-channel summaries for the regular analysis (O(1) per channel)')
+    parser.add_argument('--live', action='store_true',
+                        help='Fetch the current channel balances and policies from LND before planning')
+    parser.add_argument('--restore', metavar='TIMESTAMP',
+                        help='Restore the channel policies recorded at TIMESTAMP (YYYY-MM-DD[ HH:MM:SS]); '
+                             'only channels that differ from LND are updated')
+    parser.add_argument('--plan', nargs='?', const='data/policy_plan.json', metavar='FILE',
+                        help='Only plan the policy changes and export them to a JSON/CSV file (no API calls)')
+    parser.add_argument('--backtest', nargs='?', const='data/backtest_trajectory.csv', metavar='FILE',
+                        help='Replay the fee decisions over the whole stored history and write the fee trajectory CSV')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a fee parameter for --backtest (e.g. LocalFee_ratio=1.2,1,0.8,0.6,0.4)')
+    parser.add_argument('--sweep', nargs='?', const='data/parameter_sweep.csv', metavar='FILE',
+                        help='Backtest a grid of fee parameters in parallel and write the ranking to a CSV file')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1|V2',
+                        help='Candidate values of a fee parameter for --sweep (e.g. decay_factor=0.8|0.9)')
+    parser.add_argument('--samples', type=int, metavar='N', help='Evaluate N random combinations of the --grid')
+    parser.add_argument('--seed', type=int, help='Random seed for --samples')
+    parser.add_argument('--workers', type=int, metavar='N', help='Worker processes for --sweep (default: all cores)')
+    parser.add_argument('--rank', choices=tuple(RANK_METRICS), default='updates', help='Ranking metric for --sweep')
     parser.add_argument('--config', help='Path to configuration file')
-    args = parser.parse_args()
+    parser.add_argument('--node', metavar='NAME', help='Only run the [node:NAME] section of a multi-node configuration')
+    parser.add_argument('--profile', metavar='FILE', help='Write a JSON timing report (stages, counters, SQL/HTTP latencies)')
+    parser.add_argument('--cprofile', metavar='FILE', help='Also write cProfile statistics (pstats format)')
+    args = parser.parse_args(argv)
+
+    # 計測は指定された場合のみ有効にする（無効時の計測コードはほぼ何もしない）
+    if args.profile:
+        profiler.enable()
+    cpu_profile = cProfile.Profile() if args.cprofile else None
+    if cpu_profile:
+        cpu_profile.enable()
 
-    # 設定ファイルの読み込み
     try:
-        config_loader = ConfigLoader(args.config if args.config else None)
-    except FileNotFoundError as e:
-        print(f"エラー: {e}")
+        with profiler.span('total'):
+            return run(args)
+    finally:
+        if cpu_profile:
+            cpu_profile.disable()
+            cpu_profile.dump_stats(args.cprofile)
+            print(f"Wrote cProfile statistics to {args.cprofile}")
+        if args.profile:
+            profiler.write_report(args.profile)
+            profiler.disable()
+
+def run(args):
+    """
+    Run the fee manager with the parsed command line arguments
+
+    Args:
+        args: argparse.Namespace from main()
+    """
+    # 設定ファイルの読み込み
+    with profiler.span('config'):
+        try:
+            config_loader = ConfigLoader(args.config if args.config else None)
+            if args.node:
+                config_loader = config_loader.for_node(args.node)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"エラー: {e}")
+            return
+
+    node_names = [] if args.node else config_loader.get_node_names()
+    if not node_names:
+        return run_node(config_loader, args)
+
+    # 複数ノード構成: 全ノードを並列に処理して結果をまとめて表示する
+    if args.daemon or args.stream:
+        print("エラー: --daemon / --stream は1ノードずつ実行してください（--node NAME）")
         return
 
-    # 設定値を取得
-    database_file = config_loader.get_database_file()
-    fixed_channel_list = config_loader.get_fixed_channel_list()
-    control_channel_list = config_loader.get_control_channel_list()
-    inboundFee_base = config_loader.get_inboundFee_base()
-    inboundFee_ratio = config_loader.get_inboundFee_ratio()
-    LocalFee_ratio = config_loader.get_LocalFee_ratio()
-    data_period = config_loader.get_data_period()
-    fee_decreasing_threshold = config_loader.get_fee_decreasing_threshold()
-
-    #print(f"Using database file: {database_file}")
-    #print(f"Using fixed channel list: {fixed_channel_list}")
-    #print(f"Using control channel list: {control_channel_list}")
-    #print(f"Inbound fee base: {inboundFee_base}")
-    #print(f"Inbound fee ratio: {inboundFee_ratio}")
-    #print(f"Local fee ratio: {LocalFee_ratio}")
-    #print(f"Data period: {data_period}")
-    #print(f"Fee decreasing threshold: {fee_decreasing_threshold}")
+    node_configs = [config_loader.for_node(node_name) for node_name in node_names]
+    print(f"Running {len(node_configs)} nodes: {', '.join(node_names)}")
+    summaries = run_nodes(
+        node_configs,
+        lambda node_config: run_node(node_config, args, output_suffix=node_config.node_name),
+        config_loader.get_nodes_max_parallel(),
+    )
+    print_node_summary(summaries)
+    return summaries
+
+def run_node(config_loader, args, output_suffix=None):
+    """
+    Run the fee manager for one node
+
+    Args:
+        config_loader: ConfigLoader of the node
+        args: argparse.Namespace from main()
+        output_suffix: Appended to the output file names (multi-node runs)
+
+    Returns:
+        RunSummary: Outcome of the run (None in daemon mode)
+    """
+    fee_policy = FeePolicy.from_config(config_loader)
+
+    #print(f"Using database file: {config_loader.get_database_file()}")
+    #print(f"Using fixed channel list: {config_loader.get_fixed_channel_list()}")
+    #print(f"Using control channel list: {config_loader.get_control_channel_list()}")
+    #print(f"Inbound fee base: {fee_policy.inboundFee_base}")
+    #print(f"Inbound fee ratio: {fee_policy.inboundFee_ratio}")
+    #print(f"Local fee ratio: {fee_policy.LocalFee_ratio}")
+    #print(f"Data period: {fee_policy.data_period}")
+    #print(f"Fee decreasing threshold: {fee_policy.fee_decreasing_threshold}")
     
     # Connect to the database
-    db = Database(database_file)
-    db.connect()
+    with profiler.span('connect'):
+        db = Database(config_loader.get_database_file(), config_loader.get_database_pragmas())
+        db.connect()
+
+        # スキーマを最新バージョンに更新（インデックスの追加など）
+        db.migrate()
+
+    if args.daemon:
+        run_daemon(config_loader, db, args.summary, args.live)
+        return None
+
+    if args.stream:
+        run_event_stream(config_loader, db)
+        return None
 
     # Load fixed channel list
-    fixed_channels = load_channel_list(fixed_channel_list)
-    control_channels = load_channel_list(control_channel_list)
+    with profiler.span('load_lists'):
+        fixed_channels = load_channel_list(db, 'fixed', config_loader.get_fixed_channel_list())
+        control_channels = load_channel_list(db, 'control', config_loader.get_control_channel_list())
 
     print(f"Loaded {len(fixed_channels)} fixed channels...")
     print(f"Loaded {len(control_channels)} control channels...")
@@ -89,222 +190,516 @@ def main():
     fee_calculator = FeeCalculator(config=config_loader, db_connection=db.conn)
     data_analyzer = DataAnalyzer(db_connection=db.conn, config=config_loader)
 
-    # Process channels
-    channels = db.get_channels()
-
-    print(f"Processing {len(channels)} channels...")
-    
-    # 全てのチャネル情報をCSVに出力
-    if args.channel_download:
-        download_all_channels(channels)
-        print(f"Downloaded {len(channels)} channels to data/all_channel_list.csv")
+    try:
+        # 全てのチャネル情報をCSVに出力
+        if args.channel_download:
+            with profiler.span('channel_download'):
+                output_file, count = download_all_channels(
+                    db, add_suffix("data/all_channel_list.csv", output_suffix), compress=args.gzip
+                )
+            print(f"Downloaded {count} channels to {output_file}")
+            return RunSummary(config_loader.node_name, count, (), 0, 0)
+
+        # 保存されている全履歴で手数料の判定を再現する（LND には触れない）
+        if args.backtest or args.sweep:
+            try:
+                overrides = parse_policy_overrides(config_loader.get_backtest_overrides())
+                overrides.update(parse_policy_overrides(args.param))
+                combinations = expand_grid(parse_grid(args.grid), args.samples, args.seed)
+            except ValueError as e:
+                print(f"エラー: {e}")
+                return None
+            backtest_policy = fee_policy.replace(**overrides)
+
+        if args.sweep:
+            print(f"Sweeping {len(combinations)} parameter combinations...")
+            with profiler.span('sweep'):
+                results = run_parameter_sweep(db, backtest_policy, combinations, fixed_channels, control_channels,
+                                              add_suffix(args.sweep, output_suffix), args.workers, args.rank)
+            return RunSummary(config_loader.node_name, results[0].result.channels if results else 0, (), 0, 0)
+
+        if args.backtest:
+            with profiler.span('backtest'):
+                result = run_backtest(db, backtest_policy, fixed_channels, control_channels,
+                                      add_suffix(args.backtest, output_suffix))
+            print_backtest_result(result, backtest_policy)
+            return RunSummary(config_loader.node_name, result.channels, (), 0, 0)
+
+        if args.restore:
+            try:
+                restore_time = parse_restore_time(args.restore)
+            except ValueError as e:
+                print(f"エラー: {e}")
+                return None
+            return run_restore(db, fee_calculator, restore_time, add_suffix(args.plan, output_suffix))
+
+        return run_fee_cycle(db, fee_calculator, data_analyzer, fee_policy, fixed_channels, control_channels,
+                             args.initial, args.full, args.vectorized, add_suffix(args.plan, output_suffix),
+                             args.summary, use_live_state(config_loader, args),
+                             create_update_scheduler(db.conn, config_loader))
+    finally:
+        fee_calculator.close()
         db.close()
-        return
 
-    print(f"Mode: {'Initial setup' if args.initial else 'Regular analysis'}")
+def use_live_state(config_loader, args):
+    """
+    Whether to fetch the live channel state from LND before planning
 
-    # Iterate through all channels
-    if args.initial:
-        for channel in channels:
-            # Initial setup mode
-            process_channel_initial_mode(channel, db, fee_calculator, fixed_channels, control_channels)
-    else:
-        for channel in channels:
-            # Regular analysis mode
-            process_channel_regular_mode(channel, db, fee_calculator, data_analyzer, fixed_channels, control_channels)
+    --live always enables it. live_state in the configuration is ignored
+    with --plan, which must not call LND unless asked to explicitly.
+    """
+    return args.live or (config_loader.get_api_live_state() and not args.plan)
 
-    db.close()
+def add_suffix(filename, suffix):
+    """
+    Insert a suffix before the file extension (e.g. plan.json -> plan_node1.json)
 
-def process_channel_initial_mode(channel, db, fee_calculator, fixed_channels, control_channels):
-    """Process a channel in initial setup mode"""
-    #print(f"Processing channel {channel.channel_id}...")
-    channel_data = db.get_recent_channel_data(channel.channel_id, data_period)
+    Args:
+        filename: File name, or None
+        suffix: Suffix to insert, or None to keep the name
+    """
+    if not filename or not suffix:
+        return filename
+    base, extension = os.path.splitext(filename)
+    if extension == '.gz':
+        base, inner = os.path.splitext(base)
+        extension = inner + extension
+    return f"{base}_{suffix}{extension}"
+
+def run_fee_cycle(db, fee_calculator, data_analyzer, fee_policy, fixed_channels, control_channels, initial,
+                  full=False, vectorized=False, plan_output=None, summary=False, live=False, scheduler=None):
+    """
+    Evaluate the channels once and send the resulting fee updates
 
-    if len(channel_data) == 0:
-        print(f"No data available for channel {channel.channel_id}")
-        return
+    The run is split into a planning stage, which turns the channel set into
+    PolicyChange records without touching LND, and an apply stage. In regular
+    mode only channels with snapshots newer than their last evaluation are
+    analyzed unless full is True.
 
-    latest_data = channel_data[-1]
+    Args:
+        db: Connected Database
+        fee_calculator: FeeCalculator used to send the updates
+        data_analyzer: DataAnalyzer used in regular mode
+        fee_policy: FeePolicy holding the fee parameters
+        fixed_channels: Fixed channel list (channel_id -> fee)
+        control_channels: Control channel list (channel_id -> fee)
+        initial: True for initial setup mode, False for regular analysis
+        full: Re-evaluate every channel even without new snapshots
+        vectorized: Use VectorizedFeeEngine for the regular analysis
+        plan_output: If set, only export the plan to this JSON/CSV file (no API calls)
+        summary: Use the rolling ChannelSummaryStore summaries for the regular analysis
+        live: Fetch the current balances and policies from LND and skip updates LND already has
+        scheduler: Optional UpdateScheduler deciding which changes of a regular run are sent now
 
-    if latest_data.active == 0:
-        # Skip inactive channels
-        # print(f"Skipping inactive channel {channel.channel_name}")
-        return
+    Returns:
+        RunSummary: Planned PolicyChange records and update results
+    """
+    # Process channels
+    with profiler.span('get_channels'):
+        channels = db.get_channels()
+    channel_count = len(channels)
+    node_channel_ids = [channel.channel_id for channel in channels]
 
-    if channel.channel_id in fixed_channels:
-        # Set fixed fee for this channel
-        fixed_fee = int(fixed_channels[channel.channel_id]) - inboundFee_base
+    print(f"Processing {len(channels)} channels...")
+    print(f"Mode: {'Initial setup' if initial else 'Regular analysis'}")
+
+    live_states = None
+    if live:
+        # 実行開始時に全チャネルの残高とポリシーを2回の呼び出しでまとめて取得する
+        with profiler.span('live_state'):
+            live_states = fetch_live_state(fee_calculator)
+        if live_states is None:
+            print("Warning: could not fetch the live channel state from LND; using the stored snapshots")
+        else:
+            print(f"Fetched live state of {len(live_states)} channels from LND...")
+
+    new_data = None
+    if not initial and not full:
+        # 前回評価以降に新しいスナップショットがあるチャネルだけを対象にする
+        with profiler.span('select_new_data'):
+            new_data = db.get_channels_with_new_data()
+            skipped = len(channels)
+            channels = [channel for channel in channels if channel.channel_id in new_data]
+            skipped -= len(channels)
+        profiler.count('skipped.no_new_data', skipped)
+        print(f"Skipping {skipped} channels without new data...")
+
+    channel_ids = None if new_data is None else [channel.channel_id for channel in channels]
+    planner = PolicyPlanner(fee_policy, data_analyzer, fixed_channels, control_channels)
+
+    # 計画ステージ: LND に触れずに全チャネルの変更内容を決定する
+    if vectorized and not initial:
+        # pandas の読み込みは起動時間に影響するため必要な場合のみ import する
+        from services.fee_engine import VectorizedFeeEngine
+
+        engine = VectorizedFeeEngine(fee_policy)
+        with profiler.span('load_history'):
+            window = engine.load_window(db.read_conn, channel_ids)
+        if live_states:
+            # 各チャネルの最新行を LND の現在値に置き換えてから評価する
+            merged = merge_live_state_frame(window, channels, live_states)
+            print(f"Merged live state into {merged} channels...")
+        with profiler.span('analyze'):
+            analysis_frame = engine.evaluate(window)
+            analysis_map = {row.Index: row for row in analysis_frame.itertuples()}
+        last_date_map = {channel_id: row.date for channel_id, row in analysis_map.items()}
+        with profiler.span('plan'):
+            changes = planner.plan_vectorized(channels, analysis_map)
+    elif summary and not initial:
+        # 新しいスナップショットだけを要約に畳み込み、判定は要約の参照だけで行う
+        with profiler.span('load_history'):
+            summary_map = ChannelSummaryStore(db.conn, db.read_conn).refresh(channel_ids)
+        last_date_map = {channel_id: channel_summary.last_date for channel_id, channel_summary in summary_map.items()}
+        if live_states:
+            # 要約は直前の行を持たないため最新行だけを置き換えられない
+            print("Warning: --summary plans from the stored summaries; "
+                  "the live state is only used to skip updates LND already has")
+        with profiler.span('plan'):
+            changes = planner.plan_summary(channels, summary_map)
+    else:
+        # 対象チャネルの直近データを1回のクエリでまとめて取得
+        with profiler.span('load_history'):
+            channel_data_map = db.get_recent_channel_data_bulk(fee_policy.data_period, channel_ids)
+        last_date_map = {channel_id: data[-1].date for channel_id, data in channel_data_map.items() if data}
+        if live_states:
+            # 最新行の残高・手数料を LND の現在値に置き換えて判定する
+            merged = merge_live_state(channels, channel_data_map, live_states)
+            print(f"Merged live state into {merged} channels...")
+        with profiler.span('plan'):
+            changes = planner.plan(channels, channel_data_map, initial)
+
+    print(f"Planned {len(changes)} policy changes...")
+
+    if live_states is not None:
+        # LND に既に設定されているポリシーは送らない
+        changes = drop_live_noops(changes, live_states, fee_calculator.basefee_msat)
+
+    if plan_output:
+        with profiler.span('export_plan'):
+            export_plan(changes, plan_output)
+        return RunSummary(getattr(fee_calculator.config, 'node_name', None), channel_count, changes, 0, 0)
+
+    scheduled = changes
+    deferred_ids = set()
+    if scheduler is not None and not initial:
+        # クールダウン中・予算超過の変更は送らず、次回の実行で計画し直す
+        with profiler.span('schedule'):
+            # 予算は送信時と同じまとめ方で数えた LND の呼び出し回数に対して消費する
+            scheduled, deferred = scheduler.schedule(changes, fee_calculator.is_dry_run(),
+                                                     policy_coalescer(fee_calculator, node_channel_ids))
+        deferred_ids = {change.channel_id for change in deferred}
+
+    # 適用ステージ: 手数料更新はワーカープールで並列に送信する
+    fee_updater = apply_policy_changes(db, fee_calculator, scheduled, node_channel_ids)
+    if scheduler is not None:
+        scheduler.record(fee_updater.results)
+
+    if not initial:
+        # 更新に失敗・先送りしたチャネルと Debug_mode で送信しなかったチャネルは次回も再評価するため記録しない
+        failed_ids = {result.channel.channel_id for result in fee_updater.results
+                      if not result.success or result.dry_run}
+        failed_ids |= deferred_ids
+        last_dates = {}
+        for channel in channels:
+            if channel.channel_id in last_date_map and channel.channel_id not in failed_ids:
+                last_dates[channel.channel_id] = last_date_map[channel.channel_id]
+        with profiler.span('mark_evaluated'):
+            db.mark_channels_evaluated(last_dates)
 
-        #debug fixed_fee, latest_data.local_fee, inbound_fee, latest_data.local_infee
-        #print(f"fixed_fee={fixed_fee}, latest_data.local_fee={latest_data.local_fee}, inbound_fee={inboundFee_base}, latest_data.local_infee={latest_data.local_infee}")
+    metrics.inc('fee_manager_runs_total', mode='initial' if initial else 'regular')
+    return RunSummary(getattr(fee_calculator.config, 'node_name', None),
+                      channel_count, changes, fee_updater.success_count(), fee_updater.failure_count())
 
-        if fixed_fee == latest_data.local_fee and inboundFee_base == latest_data.local_infee:
-            # Skip if fees are already set
-            # print(f"Fees are already set for channel {channel.channel_name}")
-            return
+def policy_coalescer(fee_calculator, node_channel_ids):
+    """
+    Function grouping policy changes into PolicyBatch records for the configured apply_mode
 
-        print(f"Set fixed fee={fixed_fee} & inbound fee={inboundFee_base} for channel {channel.channel_name}")
-        fee_calculator.set_fee_api(channel, fixed_fee, inboundFee_base, latest_data.local_balance)
-        
-        return
-    
-    if channel.channel_id in control_channels:
-        # For non-fixed channels, get the latest data
-        local_balance_ratio = latest_data.local_balance / channel.capacity
-        
-        # Calculate ratio index (0-4)
-        ratio_index = min(int(local_balance_ratio * 5), 4)
-        
-        # Set inbound fee based on ratio
-        if latest_data.amboss_fee is not None:
-            if latest_data.amboss_fee > 5000:
-                latest_data.amboss_fee = 5000
-
-            inbound_fee = int(inboundFee_base + (latest_data.amboss_fee * inboundFee_ratio[ratio_index]))
-
-            if inbound_fee > 0:
-                inbound_fee = 0
-        
-        # Set local fee based on amboss fee and ratio
-        if latest_data.amboss_fee is not None:
-            if latest_data.amboss_fee > 5000:
-                latest_data.amboss_fee = 5000
-
-            local_fee = int(latest_data.amboss_fee * LocalFee_ratio[ratio_index]) - inboundFee_base
-        
-        if local_fee == latest_data.local_fee and inbound_fee == latest_data.local_infee:
-            # Skip if fees are already set
-            # print(f"Fees are already set for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
-            return
-        
-        print(f"Set initial local fee {local_fee} and inbound fee {inbound_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
-        fee_calculator.set_fee_api(channel, local_fee, inbound_fee, latest_data.local_balance)
+    Args:
+        fee_calculator: FeeCalculator whose apply_mode is used
+        node_channel_ids: IDs of every channel of the node (for apply_mode = global)
 
-def process_channel_regular_mode(channel, db, fee_calculator, data_analyzer, fixed_channels, control_channels):
-    """Process a channel in regular analysis mode"""
-    #print(f"Processing channel {channel.channel_id}...")
-    channel_data = db.get_recent_channel_data(channel.channel_id, data_period)
+    Returns:
+        callable: changes -> list of PolicyBatch, or None for apply_mode = per_channel
+    """
+    if fee_calculator.apply_mode not in (APPLY_COALESCED, APPLY_GLOBAL):
+        return None
+    # 同一ポリシーをまとめ、全チャネル共通なら global 指定の1回の呼び出しにする
+    scope_ids = node_channel_ids if fee_calculator.apply_mode == APPLY_GLOBAL else None
+    return lambda changes: coalesce_policy_changes(changes, scope_ids)
 
-    if len(channel_data) == 0:
-        print(f"No data available for channel {channel.channel_id}")
-        return
+def apply_policy_changes(db, fee_calculator, changes, node_channel_ids):
+    """
+    Send policy changes on the worker pool and log the results
 
-    latest_data = channel_data[-1]
+    Args:
+        db: Connected Database (receives the fee_updates audit rows)
+        fee_calculator: FeeCalculator used to send the updates
+        changes: PolicyChange records to send
+        node_channel_ids: IDs of every channel of the node (for apply_mode = global)
 
-    if latest_data.active == 0:
-        # Skip inactive channels
-        # print(f"Skipping inactive channel {channel.channel_name}")
-        return
+    Returns:
+        FeeUpdateExecutor: Executor holding the update results
+    """
+    coalesce = policy_coalescer(fee_calculator, node_channel_ids)
+    with profiler.span('apply'):
+        fee_updater = FeeUpdateExecutor(fee_calculator)
+        if coalesce is not None:
+            batches = coalesce(changes)
+            print(f"Coalesced {len(changes)} policy changes into {count_update_calls(batches)} update calls...")
+            for batch in batches:
+                fee_updater.submit_batch(batch)
+        else:
+            for change in changes:
+                fee_updater.submit_change(change)
+        fee_updater.shutdown()
+    with profiler.span('audit_log'):
+        # 実行中の全更新を1回のコミットで記録する
+        FeeUpdateLog(db.conn).record_results(fee_updater.results, fee_calculator)
+    fee_updater.print_summary()
+    profiler.count('updates.succeeded', fee_updater.success_count())
+    profiler.count('updates.failed', fee_updater.failure_count())
+    return fee_updater
+
+def run_restore(db, fee_calculator, timestamp, plan_output=None):
+    """
+    Restore the channel policies recorded at a past time
 
-    if channel.channel_id in fixed_channels:
-        # Set fixed fee for this channel
-        fixed_fee = int(fixed_channels[channel.channel_id]) - inboundFee_base
+    The latest snapshot of each channel at or before timestamp is compared
+    with the live state fetched from LND, and only the channels whose policy
+    differs are updated.
 
-        #debug fixed_fee, latest_data.local_fee, inbound_fee, latest_data.local_infee
-        #print(f"fixed_fee={fixed_fee}, latest_data.local_fee={latest_data.local_fee}, inbound_fee={inboundFee_base}, latest_data.local_infee={latest_data.local_infee}")
+    Args:
+        db: Connected Database
+        fee_calculator: FeeCalculator used to fetch the live state and send the updates
+        timestamp: Restore point ('YYYY-MM-DD HH:MM:SS')
+        plan_output: If set, only export the plan to this JSON/CSV file (no updates)
 
-        if fixed_fee == latest_data.local_fee and inboundFee_base == latest_data.local_infee:
-            # Skip if fees are already set
-            # print(f"Fees are already set for channel {channel.channel_name}")
-            return
+    Returns:
+        RunSummary: Planned PolicyChange records and update results, or None if
+                    the live state could not be fetched
+    """
+    node_name = getattr(fee_calculator.config, 'node_name', None)
+    with profiler.span('get_channels'):
+        channels = db.get_channels()
+    with profiler.span('load_history'):
+        snapshots = db.get_channel_data_as_of(timestamp)
+    print(f"Restoring the policies of {len(channels)} channels as of {timestamp}...")
+
+    with profiler.span('live_state'):
+        live_states = fetch_live_state(fee_calculator)
+    if live_states is None:
+        print("エラー: LND から現在のチャネル状態を取得できないため復元できません")
+        return None
+
+    with profiler.span('plan'):
+        changes = plan_restore(channels, snapshots, live_states, fee_calculator.basefee_msat)
+
+    if plan_output:
+        with profiler.span('export_plan'):
+            export_plan(changes, plan_output)
+        return RunSummary(node_name, len(channels), changes, 0, 0)
+
+    fee_updater = apply_policy_changes(db, fee_calculator, changes, [channel.channel_id for channel in channels])
+    metrics.inc('fee_manager_runs_total', mode='restore')
+    return RunSummary(node_name, len(channels), changes, fee_updater.success_count(), fee_updater.failure_count())
+
+def run_daemon(config_loader, db, summary=False, live=False):
+    """
+    Keep the database, configuration and HTTP session alive and run the
+    regular analysis on a schedule until interrupted
 
-        print(f"Set fixed fee={fixed_fee} & inbound fee={inboundFee_base} for channel {channel.channel_name}")
-        fee_calculator.set_fee_api(channel, fixed_fee, inboundFee_base, latest_data.local_balance)
-        return
+    Args:
+        config_loader: ConfigLoader instance
+        db: Connected Database
+        summary: Use the rolling ChannelSummaryStore summaries for the analysis
+        live: Fetch the current channel state from LND before every run
+    """
+    state = {
+        'config_loader': config_loader,
+        'db': db,
+        'fee_calculator': FeeCalculator(config=config_loader, db_connection=db.conn),
+        'data_analyzer': DataAnalyzer(db_connection=db.conn, config=config_loader),
+        'fee_policy': FeePolicy.from_config(config_loader),
+        'fixed_channels': load_channel_list(db, 'fixed', config_loader.get_fixed_channel_list()),
+        'control_channels': load_channel_list(db, 'control', config_loader.get_control_channel_list()),
+        'full': True,
+    }
+
+    def watched_files():
+        current = state['config_loader']
+        return [current.config_file, current.get_fixed_channel_list(), current.get_control_channel_list()]
+
+    def reload(changed_files):
+        current = state['config_loader']
+        if current.config_file in changed_files:
+            new_db = state['db']
+            new_fee_calculator = None
+            try:
+                new_config = ConfigLoader(current.config_file)
+                if current.node_name:
+                    new_config = new_config.for_node(current.node_name)
+                if new_config.get_database_file() != current.get_database_file():
+                    new_db = Database(new_config.get_database_file(), new_config.get_database_pragmas())
+                    if not new_db.connect() or new_db.migrate() is None:
+                        raise sqlite3.Error(f"cannot open {new_config.get_database_file()}")
+                new_fee_calculator = FeeCalculator(config=new_config, db_connection=new_db.conn)
+                new_data_analyzer = DataAnalyzer(db_connection=new_db.conn, config=new_config)
+                new_fee_policy = FeePolicy.from_config(new_config)
+            except Exception as e:
+                # 書きかけの設定ファイルなど。前の設定のまま動き続ける
+                if new_fee_calculator is not None:
+                    new_fee_calculator.close()
+                if new_db is not state['db']:
+                    new_db.close()
+                print(f"エラー: {current.config_file} を読み込めないため、前の設定を使い続けます: {e}")
+                return
+            if new_db is not state['db']:
+                state['db'].close()
+                state['db'] = new_db
+            state['fee_calculator'].close()
+            state['config_loader'] = new_config
+            state['fee_calculator'] = new_fee_calculator
+            state['data_analyzer'] = new_data_analyzer
+            state['fee_policy'] = new_fee_policy
+            print(f"Reloaded configuration from {new_config.config_file}")
+
+        # 設定変更でリストのパスが変わった場合も含めて読み直す
+        current = state['config_loader']
+        state['fixed_channels'] = load_channel_list(state['db'], 'fixed', current.get_fixed_channel_list())
+        state['control_channels'] = load_channel_list(state['db'], 'control', current.get_control_channel_list())
+        print(f"Loaded {len(state['fixed_channels'])} fixed channels...")
+        print(f"Loaded {len(state['control_channels'])} control channels...")
+        # 設定やリストが変わったので次回は全チャネルを評価し直す
+        state['full'] = True
+
+    def run_cycle():
+        run_fee_cycle(state['db'], state['fee_calculator'], state['data_analyzer'], state['fee_policy'],
+                      state['fixed_channels'], state['control_channels'], False, state['full'], summary=summary,
+                      live=live or state['config_loader'].get_api_live_state(),
+                      scheduler=create_update_scheduler(state['db'].conn, state['config_loader']))
+        state['full'] = False
+
+    # スクレイプ用の /metrics エンドポイント（設定で有効な場合のみ）
+    metrics_server = None
+    if config_loader.get_metrics_enabled():
+        metrics.enable()
+        metrics_server = MetricsServer(metrics, config_loader.get_metrics_host(), config_loader.get_metrics_port())
+        metrics_server.start()
+
+    daemon = FeeManagerDaemon(
+        run_cycle=run_cycle,
+        snapshot_marker=lambda: state['db'].get_snapshot_marker(),
+        watched_files=watched_files,
+        reload=reload,
+        interval=config_loader.get_daemon_interval(),
+        poll_interval=config_loader.get_daemon_poll_interval(),
+        run_on_new_data=config_loader.get_daemon_run_on_new_data(),
+    )
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        print("Daemon stopped")
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+        state['fee_calculator'].close()
+        state['db'].close()
+
+def run_event_stream(config_loader, db):
+    """
+    Follow LND's event streams and update a channel's fees as soon as its
+    local balance moves to another range, until interrupted
 
-    if channel.channel_id in control_channels:
+    Args:
+        config_loader: ConfigLoader instance
+        db: Connected Database
+    """
+    fee_calculator = FeeCalculator(config=config_loader, db_connection=db.conn)
+    fixed_channels = load_channel_list(db, 'fixed', config_loader.get_fixed_channel_list())
+    control_channels = load_channel_list(db, 'control', config_loader.get_control_channel_list())
+    print(f"Loaded {len(fixed_channels)} fixed channels...")
+    print(f"Loaded {len(control_channels)} control channels...")
+    planner = PolicyPlanner(FeePolicy.from_config(config_loader), None, fixed_channels, control_channels)
+
+    runner = EventStreamRunner(
+        fee_calculator, db, planner,
+        debounce=config_loader.get_stream_debounce(),
+        min_update_interval=config_loader.get_stream_min_update_interval(),
+        resync_interval=config_loader.get_stream_resync_interval(),
+        scheduler=create_update_scheduler(db.conn, config_loader),
+    )
+    try:
+        runner.run_forever()
+    except KeyboardInterrupt:
+        print("Event stream stopped")
+    finally:
+        runner.stop()
+        fee_calculator.close()
+        db.close()
 
-        if len(channel_data) < data_period:
-            # print(f"Skipping channel {channel.channel_name}: insufficient data ({len(channel_data)}/{data_period})")
-            return
-        
-        local_balance_ratio = latest_data.local_balance / channel.capacity
-        within_tolerance = data_analyzer.is_within_tolerance(channel_data, channel.capacity)
-        within_tolerance_1 = data_analyzer.is_within_tolerance_1(channel_data, channel.capacity)        
-        same_localfee = data_analyzer.is_same_localfee(channel_data, channel.capacity)
-
-        # Regular mode: analyze data and adjust fees
-        if local_balance_ratio >= fee_decreasing_threshold and within_tolerance and same_localfee:
-
-            new_inbound_fee = latest_data.local_infee
-            new_local_fee = int((latest_data.local_fee + inboundFee_base) * 0.9 - inboundFee_base)
-
-            if new_local_fee < -inboundFee_base:
-                new_local_fee = -inboundFee_base
-                
-            print(f"Decreasing local fee {latest_data.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
-            fee_calculator.set_fee_api(channel, new_local_fee, new_inbound_fee, latest_data.local_balance)
-
-        elif not within_tolerance_1:
-            ratio_index = min(int(local_balance_ratio * 5), 4)
-            
-            # Set inbound fee based on ratio
-            if latest_data.amboss_fee is not None:
-                if latest_data.amboss_fee > 5000:
-                    latest_data.amboss_fee = 5000
-                
-                new_inbound_fee = int(inboundFee_base + (latest_data.amboss_fee * inboundFee_ratio[ratio_index]))
-        
-            if new_inbound_fee > 0:
-                new_inbound_fee = 0
-
-            # Set local fee based on amboss fee and ratio
-            if latest_data.amboss_fee is not None:
-                if latest_data.amboss_fee > 5000:
-                    latest_data.amboss_fee = 5000
-
-                new_local_fee = int(latest_data.amboss_fee * LocalFee_ratio[ratio_index]) - inboundFee_base
-
-            print(f"Ratio changed: local fee {latest_data.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
-            fee_calculator.set_fee_api(channel, new_local_fee, new_inbound_fee, latest_data.local_balance)
-
-def download_all_channels(channels):
+def download_all_channels(db, output_file="data/all_channel_list.csv", compress=False):
     """
-    すべてのチャネル情報をCSVに出力する
-    
+    すべてのチャネル情報を最新のスナップショットと合わせてCSVに出力する
+
+    カーソルから1行ずつ書き出すため、チャネル数が多くてもメモリ使用量は一定です。
+    先頭3列 (channel_name, channel_id, fee) は固定・制御チャネルリストと同じ形式です。
+
     Args:
-        channels: チャネルのリスト
+        db: Connected Database
+        output_file: 出力先のCSVファイル
+        compress: True の場合は gzip 圧縮して出力する（拡張子 .gz を付与）
+
+    Returns:
+        str: 出力したファイルのパス
+        int: 出力したチャネル数
     """
-    os.makedirs("data", exist_ok=True)
-    output_file = "data/all_channel_list.csv"
-    
-    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+    if compress and not output_file.endswith('.gz'):
+        output_file += '.gz'
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(output_file, mode='wt', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         # ヘッダー行を書き込む
-        writer.writerow(["channel_name", "channel_id", "fee"])
-        
+        writer.writerow(["channel_name", "channel_id", "fee", "channel_point", "capacity", "date",
+                         "local_balance", "local_balance_ratio", "local_fee", "local_infee",
+                         "amboss_fee", "active"])
+
         # 各チャネルの情報を書き込む
-        for channel in channels:
-            # 現在のfeeは0として出力（この値は後で手動で編集可能）
-            writer.writerow([channel.channel_name, channel.channel_id, 0])
-    
+        for (channel_name, channel_id, channel_point, capacity, date, local_balance,
+             local_fee, local_infee, amboss_fee, active) in db.iter_channels_with_latest_data():
+            ratio = None
+            if local_balance is not None and capacity:
+                ratio = f"{local_balance / capacity:.4f}"
+            # fee 列は0として出力（この値は後で手動で編集可能）
+            writer.writerow([channel_name, channel_id, 0, channel_point, capacity, date,
+                             local_balance, ratio, local_fee, local_infee, amboss_fee, active])
+            count += 1
+
     print(f"チャネル情報を {output_file} に出力しました。")
+    return output_file, count
 
-def load_channel_list(filename):
+def load_channel_list(db, list_name, filename):
     """
-    Load channel list from CSV file
-    
+    Load a channel list through the SQLite channel list store
+
+    The CSV file is parsed, validated and imported only when it has changed
+    since the last run; otherwise the stored rows are used.
+
     Args:
+        db: Connected Database
+        list_name: Name of the list ('fixed' or 'control')
         filename: CSV filename
-        
+
     Returns:
-        dict: Dictionary with channel IDs as keys and fees as values
+        dict: Dictionary with channel IDs as keys and fees (int) as values
     """
-    channels = {}
-    try:
-        # UTF-8エンコーディングを明示的に指定
-        with open(filename, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader)  # ヘッダー行をスキップ
-            for row in reader:
-                if len(row) >= 3:
-                    channels[row[1]] = row[2]  # channel_id をキーとして fee を値として保存
-    except FileNotFoundError:
-        print(f"Warning: Channel list file {filename} not found")
-    except Exception as e:
-        print(f"Error loading channel list: {e}")
-    
-    return channels
+    return ChannelListStore(db.conn).load(list_name, filename)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # PyInstaller で固めた実行ファイルでは、--sweep のワーカープロセスがここで main() を実行せず初期化関数へ進む
+    multiprocessing.freeze_support()
+    main()
@@ -1,4 +1,6 @@
 class Channel:
+    __slots__ = ('id', 'channel_name', 'channel_id', 'channel_point', 'capacity')
+
     def __init__(self, id, channel_name, channel_id, channel_point, capacity):
         self.id = id
         self.channel_name = channel_name
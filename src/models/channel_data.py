@@ -1,4 +1,9 @@
 class ChannelData:
+    __slots__ = (
+        'channel_id', 'date', 'local_balance', 'local_fee', 'local_infee', 'remote_balance',
+        'remote_fee', 'remote_infee', 'num_updates', 'amboss_fee', 'active',
+    )
+
     def __init__(self, channel_id, date, local_balance, local_fee, local_infee, remote_balance, remote_fee, remote_infee, num_updates, amboss_fee, active):
         self.channel_id = channel_id
         self.date = date
@@ -7,7 +12,7 @@ class ChannelData:
         self.local_infee = local_infee
         self.remote_balance = remote_balance
         self.remote_fee = remote_fee
-        self.remote_fee = remote_infee
+        self.remote_infee = remote_infee
         self.amboss_fee = amboss_fee
         self.num_updates = num_updates
         self.active = active
@@ -0,0 +1,163 @@
+from array import array
+from models.channel_data import ChannelData
+
+# 整数列で NULL を表す値（int64 の最小値）
+NULL = -(2 ** 63)
+
+INT_COLUMNS = (
+    'local_balance', 'local_fee', 'local_infee', 'remote_balance',
+    'remote_fee', 'remote_infee', 'num_updates', 'amboss_fee',
+)
+
+
+def _restore_float(value):
+    """
+    Convert a value read from a float64 column back to None / int / float
+    """
+    if value == NULL:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class ChannelHistory:
+    __slots__ = ('channel_id', 'dates', 'active') + INT_COLUMNS
+
+    def __init__(self, channel_id):
+        """
+        Struct-of-arrays snapshot history of one channel, oldest first
+
+        Numeric columns are stored in typed int64 arrays (float64 once a
+        fractional value is stored) instead of one ChannelData object per row. Indexing or iterating returns ChannelData
+        row views built on demand, so existing analysis code keeps working.
+
+        Args:
+            channel_id: The channel ID
+        """
+        self.channel_id = channel_id
+        self.dates = []
+        self.active = bytearray()
+        for column in INT_COLUMNS:
+            setattr(self, column, array('q'))
+
+    def append(self, date, local_balance, local_fee, local_infee, remote_balance, remote_fee,
+               remote_infee, num_updates, amboss_fee, active):
+        """
+        Append one snapshot (in the channel_datas column order after channel_id)
+
+        REAL values stored by SQLite that are integral (e.g. 500000.0) are
+        stored as int. A fractional value (e.g. 1234.5) switches its column to
+        a float64 array so the value is kept as is.
+        """
+        self.dates.append(date)
+        try:
+            self.local_balance.append(NULL if local_balance is None else local_balance)
+            self.local_fee.append(NULL if local_fee is None else local_fee)
+            self.local_infee.append(NULL if local_infee is None else local_infee)
+            self.remote_balance.append(NULL if remote_balance is None else remote_balance)
+            self.remote_fee.append(NULL if remote_fee is None else remote_fee)
+            self.remote_infee.append(NULL if remote_infee is None else remote_infee)
+            self.num_updates.append(NULL if num_updates is None else num_updates)
+            self.amboss_fee.append(NULL if amboss_fee is None else amboss_fee)
+        except TypeError:
+            # int64 列に float が来た場合は途中まで追加した値を戻して1列ずつ入れ直す
+            size = len(self.dates) - 1
+            values = (local_balance, local_fee, local_infee, remote_balance, remote_fee,
+                      remote_infee, num_updates, amboss_fee)
+            for column, value in zip(INT_COLUMNS, values):
+                del getattr(self, column)[size:]
+                self._append_value(column, NULL if value is None else value)
+        self.active.append(1 if active else 0)
+
+    def set_latest(self, local_balance=None, local_fee=None, local_infee=None, active=None):
+        """
+        Overwrite columns of the latest snapshot (e.g. with live values from LND)
+
+        Arguments left as None keep the stored value.
+        """
+        if not self.dates:
+            raise IndexError("ChannelHistory is empty")
+        if local_balance is not None:
+            self._set_value('local_balance', -1, local_balance)
+        if local_fee is not None:
+            self._set_value('local_fee', -1, local_fee)
+        if local_infee is not None:
+            self._set_value('local_infee', -1, local_infee)
+        if active is not None:
+            self.active[-1] = 1 if active else 0
+
+    def _writable_column(self, name, value):
+        """
+        Get the array to store value in, switching an int64 column to float64
+        when value is a fractional float
+
+        Returns:
+            tuple: (array, value converted for that array)
+        """
+        column = getattr(self, name)
+        if column.typecode == 'q' and isinstance(value, float):
+            if value.is_integer():
+                return column, int(value)
+            column = array('d', column)
+            setattr(self, name, column)
+        return column, value
+
+    def _append_value(self, name, value):
+        column, value = self._writable_column(name, value)
+        column.append(value)
+
+    def _set_value(self, name, index, value):
+        column, value = self._writable_column(name, value)
+        column[index] = value
+
+    def column(self, name):
+        """
+        Get a numeric column as a list with NULLs restored to None
+
+        Args:
+            name: Column name (e.g. 'local_balance')
+        """
+        column = getattr(self, name)
+        if column.typecode == 'd':
+            return [_restore_float(value) for value in column]
+        return [None if value == NULL else value for value in column]
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ChannelHistory index out of range")
+
+        values = []
+        for name in INT_COLUMNS:
+            column = getattr(self, name)
+            value = column[index]
+            if column.typecode == 'd':
+                values.append(_restore_float(value))
+            else:
+                values.append(None if value == NULL else value)
+        return ChannelData(
+            channel_id=self.channel_id,
+            date=self.dates[index],
+            local_balance=values[0],
+            local_fee=values[1],
+            local_infee=values[2],
+            remote_balance=values[3],
+            remote_fee=values[4],
+            remote_infee=values[5],
+            num_updates=values[6],
+            amboss_fee=values[7],
+            active=bool(self.active[index])
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self):
+        return f"ChannelHistory(channel_id='{self.channel_id}', rows={len(self)})"
@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from services.fee_policy import get_range_flags as get_ratio_range_flags
+
+
+def get_range_flags(local_balance, capacity):
+    """
+    Balance range bit of a snapshot (0 if the ratio is unknown or out of range)
+
+    Args:
+        local_balance: Local balance, or None
+        capacity: Channel capacity
+    """
+    if local_balance is None or not capacity:
+        return 0
+    return get_ratio_range_flags(local_balance / capacity)
+
+
+@dataclass(frozen=True)
+class ChannelSummary:
+    """
+    Rolling summary of one channel's snapshots, oldest to latest
+
+    The latest snapshot is kept together with the run lengths of its balance
+    range and local fee, so the regular mode checks over the last N snapshots
+    are answered without reading the N rows.
+    """
+    channel_id: str
+    capacity: int
+    row_count: int
+    last_date: str
+    local_balance: int
+    local_fee: int
+    local_infee: int
+    amboss_fee: int
+    active: bool
+    range_flags: int
+    range_run: int
+    fee_run: int
+
+    def append(self, date, local_balance, local_fee, local_infee, amboss_fee, active):
+        """
+        Return the summary after one newer snapshot
+
+        Args:
+            date, local_balance, local_fee, local_infee, amboss_fee, active: channel_datas columns
+        """
+        range_flags = get_range_flags(local_balance, self.capacity)
+        # 直前と同じ区間・同じ手数料なら連続数を伸ばし、変わったら1から数え直す
+        range_run = self.range_run + 1 if self.row_count and range_flags == self.range_flags else 1
+        fee_run = self.fee_run + 1 if self.row_count and local_fee == self.local_fee else 1
+        # バックテストでは1行ごとに呼ばれるため dataclasses.replace() を使わず直接作る
+        return ChannelSummary(self.channel_id, self.capacity, self.row_count + 1, date, local_balance,
+                              local_fee, local_infee, amboss_fee, bool(active), range_flags, range_run, fee_run)
+
+    def window_size(self, data_period):
+        """Number of snapshots in the last data_period window"""
+        return min(self.row_count, data_period)
+
+    def is_within_tolerance(self, data_period):
+        """Same as DataAnalyzer.is_within_tolerance over the last data_period snapshots"""
+        window = self.window_size(data_period)
+        return window > 0 and self.range_flags != 0 and self.range_run >= window
+
+    def is_within_tolerance_1(self, data_period):
+        """Same as DataAnalyzer.is_within_tolerance_1 over the last data_period snapshots"""
+        return self.window_size(data_period) >= 2 and self.range_flags != 0 and self.range_run >= 2
+
+    def is_same_localfee(self, data_period):
+        """Same as DataAnalyzer.is_same_localfee over the last data_period snapshots"""
+        window = self.window_size(data_period)
+        return window > 1 and self.fee_run >= window
+
+    @classmethod
+    def empty(cls, channel_id, capacity):
+        """Summary of a channel without snapshots"""
+        return cls(channel_id=channel_id, capacity=capacity, row_count=0, last_date=None,
+                   local_balance=None, local_fee=None, local_infee=None, amboss_fee=None,
+                   active=False, range_flags=0, range_run=0, fee_run=0)
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class FeeUpdateRecord:
+    """
+    One row of the fee_updates audit log
+
+    success is the result of the UpdateChannelPolicy call and error the
+    exception message if the call raised.
+    """
+    channel_id: str
+    timestamp: str
+    old_local_fee: int
+    new_local_fee: int
+    old_inbound_fee: int
+    new_inbound_fee: int
+    max_htlc_msat: int
+    reason: str
+    ratio: float
+    success: bool
+    error: str = None
@@ -0,0 +1,181 @@
+import contextlib
+import csv
+import gzip
+import os
+from dataclasses import dataclass
+from models.channel_summary import ChannelSummary
+from services.policy_planner import PolicyPlanner
+
+TRAJECTORY_COLUMNS = (
+    'date', 'channel_id', 'local_balance_ratio', 'recorded_local_fee', 'recorded_inbound_fee',
+    'local_fee', 'inbound_fee', 'reason',
+)
+
+
+@dataclass(frozen=True)
+class BacktestResult:
+    """
+    Outcome of replaying one FeePolicy over the stored history
+
+    reasons counts the simulated policy updates by decision branch and
+    channel_updates by channel ID. bucket_snapshots counts the snapshots in
+    each local balance range (ratio index 0-4) and bucket_mean_fees holds the
+    mean simulated local fee while in that range.
+    """
+    rows: int
+    channels: int
+    updates: int
+    reasons: dict
+    channel_updates: dict
+    bucket_snapshots: tuple = ()
+    bucket_mean_fees: tuple = ()
+
+
+class Backtester:
+    def __init__(self, policy, fixed_channels, control_channels):
+        """
+        Replay the fee decisions over the full channel_datas history
+
+        Every channel keeps a ChannelSummary as its sliding window (the run
+        lengths answer the checks over the last data_period snapshots), so
+        memory stays proportional to the number of channels however many
+        rows are replayed. The first snapshot of a channel gets the initial
+        mode decision and every later one the regular mode decision. The fees
+        in the windows are the simulated ones: a change decided at a snapshot
+        is in effect from the next snapshot on.
+
+        Args:
+            policy: FeePolicy to replay
+            fixed_channels: Fixed channel list (channel_id -> fee)
+            control_channels: Control channel list (channel_id -> fee)
+        """
+        self.policy = policy
+        self.planner = PolicyPlanner(policy, None, fixed_channels, control_channels)
+
+    def run(self, channels, rows, trajectory=None):
+        """
+        Replay the decisions over the snapshots
+
+        Args:
+            channels: Dictionary with channel IDs as keys and Channel objects as values
+            rows: Iterable of (channel_id, date, local_balance, local_fee, local_infee,
+                  amboss_fee, active) in date order
+            trajectory: Optional csv.writer receiving one TRAJECTORY_COLUMNS row per snapshot
+
+        Returns:
+            BacktestResult: Update counts
+        """
+        planner = self.planner
+        policy = self.policy
+        # channel_id -> (要約, シミュレーション上の手数料, インバウンド手数料)
+        states = {}
+        reasons = {}
+        channel_updates = {}
+        row_count = 0
+        bucket_snapshots = [0] * 5
+        bucket_fee_sums = [0] * 5
+        bucket_fee_counts = [0] * 5
+
+        # 判定ごとの表示は行数分になるため捨てる
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for channel_id, date, local_balance, local_fee, local_infee, amboss_fee, active in rows:
+                channel = channels.get(channel_id)
+                if channel is None:
+                    continue
+                row_count += 1
+
+                state = states.get(channel_id)
+                if state is None:
+                    # 最初の行は記録されている手数料から始めて初期設定モードで判定する
+                    summary = ChannelSummary.empty(channel_id, channel.capacity)
+                    summary = summary.append(date, local_balance, local_fee, local_infee, amboss_fee, active)
+                    plan_channel = planner.plan_channel_initial_mode
+                    # 初期設定モードは最新の1行だけを参照する（要約が同じ属性を持つ）
+                    window = [summary]
+                else:
+                    summary, current_fee, current_infee = state
+                    summary = summary.append(date, local_balance, current_fee, current_infee, amboss_fee, active)
+                    plan_channel = planner.plan_channel_regular_mode_summary
+                    window = summary
+
+                change = None
+                if local_balance is not None and channel.capacity:
+                    change = plan_channel(channel, window)
+
+                new_fee, new_infee = summary.local_fee, summary.local_infee
+                if change is not None:
+                    new_fee, new_infee = change.new_local_fee, change.new_inbound_fee
+                    reasons[change.reason] = reasons.get(change.reason, 0) + 1
+                    channel_updates[channel_id] = channel_updates.get(channel_id, 0) + 1
+                states[channel_id] = (summary, new_fee, new_infee)
+
+                ratio = None
+                if local_balance is not None and channel.capacity:
+                    ratio = local_balance / channel.capacity
+                    ratio_index = policy.get_ratio_index(ratio)
+                    bucket_snapshots[ratio_index] += 1
+                    if new_fee is not None:
+                        bucket_fee_sums[ratio_index] += new_fee
+                        bucket_fee_counts[ratio_index] += 1
+
+                if trajectory is not None:
+                    if ratio is not None:
+                        ratio = f"{ratio:.4f}"
+                    trajectory.writerow([date, channel_id, ratio, local_fee, local_infee, new_fee, new_infee,
+                                         '' if change is None else change.reason])
+
+        return BacktestResult(
+            rows=row_count,
+            channels=len(states),
+            updates=sum(reasons.values()),
+            reasons=reasons,
+            channel_updates=channel_updates,
+            bucket_snapshots=tuple(bucket_snapshots),
+            bucket_mean_fees=tuple(total / count if count else None
+                                   for total, count in zip(bucket_fee_sums, bucket_fee_counts)),
+        )
+
+
+def run_backtest(db, policy, fixed_channels, control_channels, output_file=None):
+    """
+    Stream the whole channel_datas history of the database through a Backtester
+
+    Args:
+        db: Connected Database
+        policy: FeePolicy to replay
+        fixed_channels: Fixed channel list (channel_id -> fee)
+        control_channels: Control channel list (channel_id -> fee)
+        output_file: Optional trajectory CSV (gzip-compressed if it ends with .gz)
+
+    Returns:
+        BacktestResult: Update counts
+    """
+    channels = {channel.channel_id: channel for channel in db.get_channels()}
+    backtester = Backtester(policy, fixed_channels, control_channels)
+
+    if not output_file:
+        return backtester.run(channels, db.iter_channel_history())
+
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    opener = gzip.open if output_file.endswith('.gz') else open
+    with opener(output_file, mode='wt', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(TRAJECTORY_COLUMNS)
+        result = backtester.run(channels, db.iter_channel_history(), writer)
+    print(f"Wrote fee trajectory of {result.rows} snapshots to {output_file}")
+    return result
+
+
+def print_backtest_result(result, policy):
+    """Print the parameters and update counts of a backtest"""
+    print("Backtest parameters:")
+    for name, value in policy.parameters().items():
+        print(f"  {name} = {value}")
+    print(f"Replayed {result.rows} snapshots of {result.channels} channels")
+    reasons = ', '.join(f"{reason}: {count}" for reason, count in sorted(result.reasons.items()))
+    print(f"Simulated {result.updates} policy updates" + (f" ({reasons})" if reasons else ""))
+    if result.channel_updates:
+        busiest = sorted(result.channel_updates.items(), key=lambda item: (-item[1], item[0]))[:5]
+        print("Most updated channels: " + ', '.join(f"{channel_id} ({count})" for channel_id, count in busiest))
@@ -1,6 +1,39 @@
 import os
 import configparser
 
+# [node:名前] セクションで上書きできる設定（オプション名 → 元のセクション）
+NODE_SECTION_PREFIX = 'node:'
+NODE_OPTIONS = {
+    'database_file': 'database',
+    'mmap_size': 'database',
+    'cache_size': 'database',
+    'fixed_channel_list': 'channels',
+    'control_channel_list': 'channels',
+    'api_url': 'api',
+    'macaroon_path': 'api',
+    'tls_path': 'api',
+    'timeout': 'api',
+    'max_workers': 'api',
+    'max_retries': 'api',
+    'retry_backoff': 'api',
+    'apply_mode': 'api',
+    'live_state': 'api',
+    'min_interval': 'scheduler',
+    'budget': 'scheduler',
+    'window': 'scheduler',
+    'debounce': 'stream',
+    'min_update_interval': 'stream',
+    'resync_interval': 'stream',
+    'basefee_msat': 'fees',
+    'time_lock_delta': 'fees',
+    'inboundfee_base': 'fees',
+    'inboundfee_ratio': 'fees',
+    'localfee_ratio': 'fees',
+    'fee_decreasing_threshold': 'fees',
+    'data_period': 'analysis',
+    'debug_mode': 'debug',
+}
+
 class ConfigLoader:
     def __init__(self, config_file=None):
         self.config = configparser.ConfigParser()
@@ -11,6 +44,10 @@ class ConfigLoader:
             root_dir = self._find_project_root()
             config_file = os.path.join(root_dir, "ln-fee-manager.conf")
         
+        self.config_file = config_file
+        # 複数ノード構成で for_node() が返した設定の場合はノード名
+        self.node_name = None
+
         # 設定ファイルの読み込み
         if os.path.exists(config_file):
             self.config.read(config_file, encoding='utf-8')
@@ -23,9 +60,61 @@ class ConfigLoader:
         # services ディレクトリの親（src）、さらにその親がプロジェクトルート
         return os.path.abspath(os.path.join(current_dir, "..", ".."))
     
+    # ノード関連
+    def get_node_names(self):
+        """Names of the [node:NAME] sections, in file order"""
+        return [section[len(NODE_SECTION_PREFIX):].strip()
+                for section in self.config.sections() if section.startswith(NODE_SECTION_PREFIX)]
+
+    def for_node(self, node_name):
+        """
+        Get the configuration of one node
+
+        Options set in [node:NAME] override the same option of the global
+        sections; everything else falls back to the global settings.
+
+        Args:
+            node_name: Name of the node section
+
+        Returns:
+            ConfigLoader: Configuration of the node
+        """
+        section = NODE_SECTION_PREFIX + node_name
+        if not self.config.has_section(section):
+            raise ValueError(f"ノード '{node_name}' の設定 [{section}] が見つかりません")
+
+        node_config = ConfigLoader.__new__(ConfigLoader)
+        node_config.config_file = self.config_file
+        node_config.node_name = node_name
+        node_config.config = configparser.ConfigParser()
+        node_config.config.read_dict({
+            name: dict(self.config.items(name, raw=True))
+            for name in self.config.sections() if not name.startswith(NODE_SECTION_PREFIX)
+        })
+        for option, value in self.config.items(section, raw=True):
+            if option not in NODE_OPTIONS:
+                print(f"Warning: [{section}] の '{option}' はノードごとに設定できないため無視します")
+                continue
+            if not node_config.config.has_section(NODE_OPTIONS[option]):
+                node_config.config.add_section(NODE_OPTIONS[option])
+            node_config.config.set(NODE_OPTIONS[option], option, value)
+        return node_config
+
+    def get_nodes_max_parallel(self):
+        # 0 の場合は全ノードを同時に処理する
+        return self.config.getint('nodes', 'max_parallel', fallback=0)
+
     # データベース関連
     def get_database_file(self):
         return self.config.get('database', 'database_file')
+
+    def get_database_pragmas(self):
+        """PRAGMA settings of the read-only analysis connection"""
+        return {
+            'mmap_size': self.config.getint('database', 'mmap_size', fallback=256 * 1024 * 1024),
+            'cache_size': self.config.getint('database', 'cache_size', fallback=-64 * 1024),
+            'temp_store': 'MEMORY',
+        }
     
     # パス関連
     def get_fixed_channel_list(self):
@@ -43,6 +132,24 @@ class ConfigLoader:
     
     def get_tls_path(self):
         return self.config.get('api', 'tls_path')
+
+    def get_api_timeout(self):
+        return self.config.getfloat('api', 'timeout', fallback=10.0)
+
+    def get_api_max_workers(self):
+        return self.config.getint('api', 'max_workers', fallback=8)
+
+    def get_api_max_retries(self):
+        return self.config.getint('api', 'max_retries', fallback=3)
+
+    def get_api_retry_backoff(self):
+        return self.config.getfloat('api', 'retry_backoff', fallback=0.5)
+
+    def get_api_apply_mode(self):
+        return self.config.get('api', 'apply_mode', fallback='per_channel').strip().lower()
+
+    def get_api_live_state(self):
+        return self.config.getboolean('api', 'live_state', fallback=False)
     
     # 手数料関連
     def get_basefee_msat(self):
@@ -69,6 +176,53 @@ class ConfigLoader:
     def get_data_period(self):
         return self.config.getint('analysis', 'data_period')
     
+    # バックテスト関連
+    def get_backtest_overrides(self):
+        """[backtest] options overriding the fee parameters in backtest runs (NAME -> raw value)"""
+        if not self.config.has_section('backtest'):
+            return []
+        return self.config.items('backtest')
+
+    # デーモン関連
+    def get_daemon_interval(self):
+        return self.config.getfloat('daemon', 'interval', fallback=3600.0)
+
+    def get_daemon_poll_interval(self):
+        return self.config.getfloat('daemon', 'poll_interval', fallback=30.0)
+
+    def get_daemon_run_on_new_data(self):
+        return self.config.getboolean('daemon', 'run_on_new_data', fallback=True)
+
+    # 更新スケジューラ関連
+    def get_scheduler_min_interval(self):
+        return self.config.getfloat('scheduler', 'min_interval', fallback=0.0)
+
+    def get_scheduler_budget(self):
+        return self.config.getint('scheduler', 'budget', fallback=0)
+
+    def get_scheduler_window(self):
+        return self.config.getfloat('scheduler', 'window', fallback=3600.0)
+
+    # イベントストリーム関連
+    def get_stream_debounce(self):
+        return self.config.getfloat('stream', 'debounce', fallback=5.0)
+
+    def get_stream_min_update_interval(self):
+        return self.config.getfloat('stream', 'min_update_interval', fallback=60.0)
+
+    def get_stream_resync_interval(self):
+        return self.config.getfloat('stream', 'resync_interval', fallback=600.0)
+
+    # メトリクス関連
+    def get_metrics_enabled(self):
+        return self.config.getboolean('metrics', 'enabled', fallback=False)
+
+    def get_metrics_host(self):
+        return self.config.get('metrics', 'host', fallback='127.0.0.1')
+
+    def get_metrics_port(self):
+        return self.config.getint('metrics', 'port', fallback=9108)
+
     # デバッグ関連
     def get_debug_mode(self):
         return self.config.getboolean('debug', 'Debug_mode')
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import ssl
+import threading
+from requests.adapters import HTTPAdapter
+
+
+class CredentialProvider:
+    def __init__(self, macaroon_path, tls_path):
+        """
+        Load the LND macaroon and TLS certificate once and cache them
+
+        The files are re-read only when their modification time changes,
+        e.g. after LND regenerates tls.cert or the macaroon is baked again.
+
+        Args:
+            macaroon_path: Path to the admin macaroon
+            tls_path: Path to LND's tls.cert
+        """
+        self.macaroon_path = macaroon_path
+        self.tls_path = tls_path
+        self._lock = threading.Lock()
+        self._headers = None
+        self._macaroon_mtime = None
+        self._ssl_context = None
+        self._tls_mtime = None
+
+    def _get_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def get_headers(self):
+        """
+        Get the request headers carrying the hex-encoded macaroon
+
+        Returns:
+            dict: Headers for lightning-api requests
+        """
+        mtime = self._get_mtime(self.macaroon_path)
+        if self._headers is not None and mtime == self._macaroon_mtime:
+            return self._headers
+
+        with self._lock:
+            if self._headers is None or mtime != self._macaroon_mtime:
+                with open(self.macaroon_path, 'rb') as file:
+                    macaroon = file.read().hex()
+                self._headers = {'Grpc-Metadata-macaroon': macaroon}
+                self._macaroon_mtime = mtime
+        return self._headers
+
+    def get_ssl_context(self):
+        """
+        Get an SSL context that trusts LND's certificate
+
+        Returns:
+            ssl.SSLContext: Cached context, or None if no tls_path is configured
+        """
+        if not self.tls_path:
+            return None
+
+        mtime = self._get_mtime(self.tls_path)
+        if self._ssl_context is not None and mtime == self._tls_mtime:
+            return self._ssl_context
+
+        with self._lock:
+            if self._ssl_context is None or mtime != self._tls_mtime:
+                self._ssl_context = ssl.create_default_context(cafile=self.tls_path)
+                self._tls_mtime = mtime
+        return self._ssl_context
+
+
+class TLSContextAdapter(HTTPAdapter):
+    def __init__(self, ssl_context=None, **kwargs):
+        """
+        HTTPAdapter whose connection pools reuse a prepared SSL context
+
+        Args:
+            ssl_context: SSL context used for every HTTPS connection
+        """
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
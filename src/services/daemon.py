@@ -0,0 +1,97 @@
+import os
+import time
+
+
+class FeeManagerDaemon:
+    def __init__(self, run_cycle, snapshot_marker, watched_files, reload,
+                 interval=3600.0, poll_interval=30.0, run_on_new_data=True):
+        """
+        In-process scheduler that replaces re-launching main.py from cron
+
+        Args:
+            run_cycle: Callable that evaluates all channels once
+            snapshot_marker: Callable returning a value that changes when new snapshots arrive
+            watched_files: Callable returning the paths to watch for hot-reload
+            reload: Callable receiving the set of changed paths
+            interval: Seconds between scheduled evaluations
+            poll_interval: Seconds between checks for file changes and new snapshots
+            run_on_new_data: Also evaluate as soon as new snapshot rows appear
+        """
+        self.run_cycle = run_cycle
+        self.snapshot_marker = snapshot_marker
+        self.watched_files = watched_files
+        self.reload = reload
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.run_on_new_data = run_on_new_data
+        self.file_mtimes = {}
+        self.last_marker = None
+        self.next_run = 0.0
+        self.cycles = 0
+        self.failures = 0
+
+    def _get_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def _changed_files(self):
+        changed = set()
+        for path in self.watched_files():
+            mtime = self._get_mtime(path)
+            if path in self.file_mtimes and self.file_mtimes[path] != mtime:
+                changed.add(path)
+            self.file_mtimes[path] = mtime
+        return changed
+
+    def poll(self, now=None):
+        """
+        Run one scheduler step: hot-reload changed files and evaluate if due
+
+        Args:
+            now: Current monotonic time (for testing)
+
+        Errors from reload and run_cycle are logged and do not stop the
+        daemon; a failed cycle is retried at the next scheduled time.
+
+        Returns:
+            bool: True if an evaluation cycle was run successfully
+        """
+        now = time.monotonic() if now is None else now
+
+        changed = self._changed_files()
+        if changed:
+            print(f"Detected changes in {', '.join(sorted(changed))}")
+            try:
+                self.reload(changed)
+            except Exception as e:
+                # 書きかけのファイルなど。次に変更されたときに読み直す
+                print(f"Error reloading {', '.join(sorted(changed))}: {type(e).__name__}: {e}")
+            # 監視対象のパスが変わった可能性があるため記録し直す
+            self._changed_files()
+
+        marker = self.snapshot_marker()
+        new_data = self.run_on_new_data and marker != self.last_marker
+
+        if now < self.next_run and not new_data:
+            return False
+
+        self.last_marker = marker
+        self.next_run = now + self.interval
+        self.cycles += 1
+        try:
+            self.run_cycle()
+        except Exception as e:
+            # データベースのロックなど一時的なエラーでデーモンを止めない
+            self.failures += 1
+            print(f"Error in evaluation cycle {self.cycles}: {type(e).__name__}: {e}")
+            return False
+        return True
+
+    def run_forever(self):
+        """Poll until interrupted with KeyboardInterrupt"""
+        print(f"Daemon started (interval: {self.interval:g}s, poll: {self.poll_interval:g}s)")
+        while True:
+            self.poll()
+            time.sleep(self.poll_interval)
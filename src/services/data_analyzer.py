@@ -1,3 +1,7 @@
+from models.channel_history import ChannelHistory
+from services.fee_policy import get_range_flags
+
+
 class DataAnalyzer:
     def __init__(self, db_connection, config):
         """
@@ -54,8 +58,8 @@ class DataAnalyzer:
             
         # Calculate range for each data point (as bit flags)
         ranges = []
-        for data in channel_data:
-            local_ratio = data.local_balance / capacity
+        for local_balance in self._get_column(channel_data, 'local_balance'):
+            local_ratio = local_balance / capacity
             range_flags = self._get_range_flags(local_ratio)
             ranges.append(range_flags)
         
@@ -83,8 +87,8 @@ class DataAnalyzer:
             
         # Calculate range for each data point (as bit flags)
         ranges = []
-        for data in channel_data:
-            local_ratio = data.local_balance / capacity
+        for local_balance in self._get_column(channel_data, 'local_balance')[-2:]:
+            local_ratio = local_balance / capacity
             range_flags = self._get_range_flags(local_ratio)
             ranges.append(range_flags)
         
@@ -97,6 +101,15 @@ class DataAnalyzer:
             
         return common_range > 0
 
+    def _get_column(self, channel_data, name):
+        """
+        Get one attribute of every data point, reading the typed column directly
+        when channel_data is a ChannelHistory instead of building row views
+        """
+        if isinstance(channel_data, ChannelHistory):
+            return channel_data.column(name)
+        return [getattr(data, name) for data in channel_data]
+
     def _get_range_flags(self, ratio):
         """
         Convert a ratio to a binary flag representation of which range it belongs to.
@@ -107,20 +120,7 @@ class DataAnalyzer:
         Returns:
             int: Binary representation of ranges (e.g. 00100)
         """
-        flags = 0
-        
-        if 0.8 <= ratio <= 1.0:
-            flags |= 0b10000
-        if 0.6 <= ratio < 0.8:
-            flags |= 0b01000
-        if 0.4 <= ratio < 0.6:
-            flags |= 0b00100
-        if 0.2 <= ratio < 0.4:
-            flags |= 0b00010
-        if 0.0 <= ratio < 0.2:
-            flags |= 0b00001
-            
-        return flags
+        return get_range_flags(ratio)
 
     def is_same_localfee(self, channel_data, capacity):
         """
@@ -137,11 +137,13 @@ class DataAnalyzer:
         if len(channel_data) <= 1:
             return False
         
+        local_fees = self._get_column(channel_data, 'local_fee')
+
         # 最初のfee値を基準にする
-        base_fee = channel_data[0].local_fee
+        base_fee = local_fees[0]
         
         # 全てのfeeが同じかチェック
-        all_fees_same = all(data.local_fee == base_fee for data in channel_data)
+        all_fees_same = all(local_fee == base_fee for local_fee in local_fees)
         
         # もし全てのfeeが同じでなければ、条件を満たさない
         if not all_fees_same:
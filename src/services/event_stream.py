@@ -0,0 +1,430 @@
+import base64
+import queue
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime
+import requests
+from db.fee_update_log import FeeUpdateLog
+from models.channel_data import ChannelData
+from services.live_state import fetch_live_state, is_live_noop, parse_live_state
+from services.metrics import metrics
+from services.update_executor import FeeUpdateResult
+from utils.profiling import profiler
+
+CHANNEL_EVENTS_PATH = '/v1/channels/subscribe'
+HTLC_EVENTS_PATH = '/v2/router/htlcevents'
+# ストリームが切れた後の再接続待ち（秒、失敗が続くと倍にしていく）
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+# 再同期に失敗した場合の再試行間隔（秒）
+RESYNC_RETRY_DELAY = 5.0
+# ポリシー更新に失敗したチャネルを再評価するまでの間隔（秒）
+UPDATE_RETRY_DELAY = 30.0
+# stop() を確認するためのイベント待ちの上限（秒）
+POLL_INTERVAL = 1.0
+
+
+def channel_point_from_proto(point):
+    """
+    'txid:index' string of a ChannelPoint message
+
+    Args:
+        point: ChannelPoint with funding_txid_str or base64 funding_txid_bytes
+
+    Returns:
+        str: Channel point, or None if the message has no txid
+    """
+    txid = point.get('funding_txid_str')
+    if not txid:
+        raw = point.get('funding_txid_bytes')
+        if not raw:
+            return None
+        # バイト列の txid は表示形式と逆順
+        txid = base64.b64decode(raw)[::-1].hex()
+    return f"{txid}:{int(point.get('output_index', 0))}"
+
+
+class ChannelBalanceTracker:
+    def __init__(self, policy):
+        """
+        In-memory local balance of every channel, updated from LND events
+
+        Balances are reset from ListChannels and then moved by the settled
+        HTLCs of the HTLC event stream. The amounts of an HTLC are taken from
+        its forward event and applied when it settles; HTLCs whose amounts were
+        not seen (e.g. received payments) are left to the next reset.
+
+        Args:
+            policy: FeePolicy whose ratio index defines the balance buckets
+        """
+        self.policy = policy
+        # channel_point -> LiveChannelState（残高は balances_msat が正）
+        self.states = {}
+        self.balances_msat = {}
+        # chan_id -> channel_point（HTLC イベントは chan_id で届く）
+        self.points = {}
+        # (incoming_channel_id, incoming_htlc_id, outgoing_channel_id, outgoing_htlc_id) -> (入金額, 出金額)
+        self.pending_htlcs = {}
+
+    def reset(self, live_states):
+        """
+        Replace every balance and policy with the result of fetch_live_state()
+
+        In-flight HTLCs are forgotten: ListChannels already reflects them.
+        """
+        self.states = dict(live_states)
+        self.balances_msat = {point: state.local_balance * 1000 for point, state in live_states.items()}
+        self.points = {state.chan_id: point for point, state in live_states.items()}
+        self.pending_htlcs.clear()
+
+    def local_balance(self, channel_point):
+        """Local balance of a channel in sat, or None if unknown"""
+        balance = self.balances_msat.get(channel_point)
+        return None if balance is None else balance // 1000
+
+    def bucket(self, channel_point):
+        """Ratio index (0-4) of the current local balance, or None if unknown"""
+        state = self.states.get(channel_point)
+        balance = self.balances_msat.get(channel_point)
+        if state is None or balance is None or not state.capacity:
+            return None
+        return self.policy.get_ratio_index(balance / 1000 / state.capacity)
+
+    def set_policy(self, channel_point, fee_per_mil, inbound_fee_per_mil, base_fee_msat):
+        """Record a policy that was successfully sent to LND"""
+        state = self.states.get(channel_point)
+        if state is None:
+            return
+        self.states[channel_point] = replace(
+            state, base_fee_msat=base_fee_msat, fee_per_mil=fee_per_mil,
+            inbound_base_fee_msat=0, inbound_fee_per_mil=inbound_fee_per_mil,
+        )
+
+    def apply_htlc_event(self, event):
+        """
+        Apply one HtlcEvent of GET /v2/router/htlcevents
+
+        Returns:
+            list: Channel points whose balance changed
+        """
+        key = (
+            str(event.get('incoming_channel_id', '0')), str(event.get('incoming_htlc_id', '0')),
+            str(event.get('outgoing_channel_id', '0')), str(event.get('outgoing_htlc_id', '0')),
+        )
+        if 'forward_event' in event:
+            info = event['forward_event'].get('info') or {}
+            self.pending_htlcs[key] = (int(info.get('incoming_amt_msat', 0)), int(info.get('outgoing_amt_msat', 0)))
+            return []
+        if 'forward_fail_event' in event or 'link_fail_event' in event:
+            self.pending_htlcs.pop(key, None)
+            return []
+        if 'settle_event' not in event:
+            return []
+
+        amounts = self.pending_htlcs.pop(key, None)
+        if amounts is None:
+            return []
+        changed = []
+        # chan_id 0 は自ノードの送金・受取側
+        for chan_id, delta in ((key[0], amounts[0]), (key[2], -amounts[1])):
+            point = self.points.get(chan_id)
+            if chan_id == '0' or point not in self.balances_msat:
+                continue
+            self.balances_msat[point] += delta
+            changed.append(point)
+        return changed
+
+    def apply_channel_event(self, event):
+        """
+        Apply one ChannelEventUpdate of GET /v1/channels/subscribe
+
+        Returns:
+            list: Channel points whose state changed
+        """
+        event_type = event.get('type')
+        if event_type == 'OPEN_CHANNEL':
+            opened = parse_live_state([event.get('open_channel') or {}], [])
+            for point, state in opened.items():
+                self.states[point] = state
+                self.balances_msat[point] = state.local_balance * 1000
+                self.points[state.chan_id] = point
+            return list(opened)
+
+        if event_type == 'CLOSED_CHANNEL':
+            point = (event.get('closed_channel') or {}).get('channel_point')
+            state = self.states.pop(point, None)
+            self.balances_msat.pop(point, None)
+            if state is not None:
+                self.points.pop(state.chan_id, None)
+            return []
+
+        if event_type in ('ACTIVE_CHANNEL', 'INACTIVE_CHANNEL'):
+            field = 'active_channel' if event_type == 'ACTIVE_CHANNEL' else 'inactive_channel'
+            point = channel_point_from_proto(event.get(field) or {})
+            state = self.states.get(point)
+            if state is None:
+                return []
+            self.states[point] = replace(state, active=event_type == 'ACTIVE_CHANNEL')
+            return [point]
+        return []
+
+
+class EventStreamRunner:
+    def __init__(self, fee_calculator, db, planner, debounce=5.0, min_update_interval=60.0,
+                 resync_interval=600.0, clock=time.monotonic, scheduler=None):
+        """
+        Adjust fees as soon as a channel's balance moves to another bucket
+
+        The channel and HTLC event streams of LND are read on background
+        threads; the main loop keeps a ChannelBalanceTracker up to date and,
+        when a channel's ratio index differs from the one it was last
+        evaluated at, plans only that channel with
+        PolicyPlanner.plan_channel_bucket_change(). Evaluations are delayed by
+        debounce seconds so a burst of HTLCs triggers one update, and at most
+        one update per min_update_interval is sent per channel to stay within
+        LND's channel update rate limit. With a scheduler, each update also
+        goes through its persistent cooldown and update budget, shared with
+        the regular runs; a deferred channel is evaluated again after
+        UPDATE_RETRY_DELAY. Balances are reset from ListChannels every
+        resync_interval seconds and after a stream reconnects.
+
+        Args:
+            fee_calculator: FeeCalculator used for the streams and policy updates
+            db: Connected Database (channel list and latest amboss fee)
+            planner: PolicyPlanner with the fee policy and channel lists
+            debounce: Delay between a bucket change and its evaluation (seconds)
+            min_update_interval: Minimum time between two updates of a channel (seconds)
+            resync_interval: Time between balance resets from ListChannels (seconds)
+            clock: Monotonic clock (overridable for tests)
+            scheduler: Optional UpdateScheduler ([scheduler] section)
+        """
+        self.fee_calculator = fee_calculator
+        self.db = db
+        self.planner = planner
+        self.debounce = debounce
+        self.min_update_interval = min_update_interval
+        self.resync_interval = resync_interval
+        self.clock = clock
+        self.scheduler = scheduler
+        self.tracker = ChannelBalanceTracker(planner.policy)
+        # channel_point -> Channel（DB に登録されているチャネルのみ評価する）
+        self.channels = {}
+        # channel_point -> 最後に評価した時点の区間
+        self.buckets = {}
+        # channel_point -> 評価予定時刻
+        self.due = {}
+        self.last_update = {}
+        self.next_resync = 0.0
+        self.events = queue.Queue()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def resync(self, now):
+        """
+        Reload the channel list and reset the balances from LND
+
+        Returns:
+            bool: True if the live state was fetched
+        """
+        self.channels = {channel.channel_point: channel for channel in self.db.get_channels()}
+        with profiler.span('live_state'):
+            live_states = fetch_live_state(self.fee_calculator)
+        if live_states is None:
+            print("Warning: could not fetch the live channel state from LND")
+            self.next_resync = now + RESYNC_RETRY_DELAY
+            return False
+
+        self.tracker.reset(live_states)
+        self.next_resync = now + self.resync_interval
+        for channel_point in self.channels:
+            self._check(channel_point, now)
+        return True
+
+    def handle_event(self, path, event, now):
+        """
+        Apply one stream message and schedule the channels whose bucket changed
+
+        Args:
+            path: Stream the message came from
+            event: 'result' object of the message, or None when the stream was reconnected
+            now: Current clock value
+        """
+        if event is None:
+            # 切断中のイベントは失われているため残高を取り直す
+            self.next_resync = now
+            return
+        if path == HTLC_EVENTS_PATH:
+            changed = self.tracker.apply_htlc_event(event)
+        else:
+            changed = self.tracker.apply_channel_event(event)
+        for channel_point in changed:
+            self._check(channel_point, now)
+
+    def _check(self, channel_point, now):
+        if channel_point not in self.channels:
+            return
+        bucket = self.tracker.bucket(channel_point)
+        if bucket is None:
+            return
+        if channel_point not in self.buckets:
+            # 初めて見るチャネルは現在の区間を基準にする
+            self.buckets[channel_point] = bucket
+            return
+        if bucket != self.buckets[channel_point] and channel_point not in self.due:
+            last_update = self.last_update.get(channel_point)
+            due = now + self.debounce
+            if last_update is not None:
+                due = max(due, last_update + self.min_update_interval)
+            self.due[channel_point] = due
+
+    def run_due(self, now):
+        """
+        Evaluate the channels whose debounce delay has passed
+
+        A channel whose update failed or was deferred by the scheduler keeps
+        its previous bucket and is evaluated again after UPDATE_RETRY_DELAY.
+
+        Returns:
+            int: Number of policy updates sent
+        """
+        updated = 0
+        for channel_point, due in list(self.due.items()):
+            if due > now:
+                continue
+            del self.due[channel_point]
+            bucket = self.tracker.bucket(channel_point)
+            if bucket is None or bucket == self.buckets.get(channel_point):
+                # 待っている間に元の区間へ戻った
+                profiler.count('skipped.debounced')
+                metrics.inc('fee_manager_skipped_total', reason='debounced')
+                continue
+            try:
+                result = self.evaluate(channel_point, now)
+            except Exception as e:
+                # DB エラーなどでストリーム全体を止めない
+                print(f"Error evaluating channel {channel_point}: {e}")
+                result = None
+            if result is None:
+                self.due[channel_point] = now + UPDATE_RETRY_DELAY
+                continue
+            # 更新できたか、更新が不要だった場合だけ区間を進める
+            self.buckets[channel_point] = bucket
+            if result:
+                updated += 1
+        return updated
+
+    def evaluate(self, channel_point, now):
+        """
+        Plan and send the policy of one channel from its live balance
+
+        Returns:
+            bool: True if a policy update was sent successfully, False if
+                no update was needed or Debug_mode did not send it, None if
+                the update failed or was deferred by the scheduler
+        """
+        channel = self.channels.get(channel_point)
+        state = self.tracker.states.get(channel_point)
+        if channel is None or state is None:
+            return False
+
+        # Amboss の手数料は最新のスナップショットの値を使う
+        history = self.db.get_recent_channel_data(channel.channel_id, 1)
+        amboss_fee = history[-1].amboss_fee if len(history) else None
+        local_balance = self.tracker.local_balance(channel_point)
+        latest_data = ChannelData(
+            channel_id=channel.channel_id,
+            date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            local_balance=local_balance,
+            local_fee=state.fee_per_mil,
+            local_infee=state.inbound_fee_per_mil,
+            remote_balance=state.capacity - local_balance,
+            remote_fee=None,
+            remote_infee=None,
+            num_updates=None,
+            amboss_fee=amboss_fee,
+            active=state.active,
+        )
+        change = self.planner.plan_channel_bucket_change(channel, latest_data)
+        if change is None:
+            return False
+        basefee_msat = self.fee_calculator.basefee_msat
+        if is_live_noop(change, state, basefee_msat):
+            profiler.count('skipped.live_unchanged')
+            metrics.inc('fee_manager_skipped_total', reason='live_unchanged')
+            return False
+
+        if self.scheduler is not None:
+            # 定期実行と同じクールダウン・更新予算に従う
+            _, deferred = self.scheduler.schedule((change,), self.fee_calculator.is_dry_run())
+            if deferred:
+                return None
+
+        success = self.fee_calculator.set_fee_api(change, change.new_local_fee, change.new_inbound_fee,
+                                                  change.local_balance)
+        result = FeeUpdateResult.from_status(change, success, change.local_balance)
+        FeeUpdateLog(self.db.conn).record_results([result], self.fee_calculator)
+        if self.scheduler is not None:
+            self.scheduler.record([result])
+        if not success:
+            return None
+        if getattr(success, 'dry_run', False):
+            # Debug_mode では LND のポリシーは変わっていない
+            return False
+        self.tracker.set_policy(channel_point, change.new_local_fee, change.new_inbound_fee, basefee_msat)
+        self.last_update[channel_point] = now
+        return True
+
+    def _read_stream(self, path):
+        delay = RECONNECT_DELAY
+        while not self.stop_event.is_set():
+            try:
+                for message in self.fee_calculator.subscribe(path):
+                    delay = RECONNECT_DELAY
+                    self.events.put((path, message))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Event stream {path} failed: {e}")
+            if self.stop_event.wait(delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            self.events.put((path, None))
+
+    def start_streams(self):
+        """Start one reader thread per event stream"""
+        for path in (CHANNEL_EVENTS_PATH, HTLC_EVENTS_PATH):
+            thread = threading.Thread(target=self._read_stream, args=(path,), name=f"stream{path}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def step(self, now):
+        """
+        Wait for the next stream message or deadline and process it
+
+        Args:
+            now: Current clock value
+        """
+        deadline = min([self.next_resync, *self.due.values()])
+        try:
+            path, event = self.events.get(timeout=min(max(deadline - now, 0.0), POLL_INTERVAL))
+        except queue.Empty:
+            pass
+        else:
+            self.handle_event(path, event, self.clock())
+
+        now = self.clock()
+        if now >= self.next_resync:
+            self.resync(now)
+        self.run_due(now)
+
+    def run_forever(self):
+        """Read the event streams and adjust fees until stop() is called"""
+        self.start_streams()
+        print(f"Listening to LND channel and HTLC events (debounce {self.debounce:g}s, "
+              f"min update interval {self.min_update_interval:g}s)...")
+        self.resync(self.clock())
+        while not self.stop_event.is_set():
+            self.step(self.clock())
+
+    def stop(self):
+        """Stop the main loop and the stream readers after their current message"""
+        self.stop_event.set()
@@ -1,7 +1,37 @@
 import requests
-import codecs
 import json
 import os
+import threading
+from urllib3.util.retry import Retry
+from services.credentials import CredentialProvider, TLSContextAdapter
+from services.metrics import metrics
+from utils.profiling import profiler
+
+
+class PolicySendResult:
+    __slots__ = ('success', 'dry_run', 'error')
+
+    def __init__(self, success, dry_run=False, error=None):
+        """
+        Outcome of one UpdateChannelPolicy call
+
+        Truthy when the call succeeded, so callers can keep treating it as a bool.
+
+        Args:
+            success: True if LND accepted the update (or the dry run finished)
+            dry_run: True if Debug_mode only printed the request without sending it
+            error: Reason of a failed call (HTTP status and response body, or exception)
+        """
+        self.success = success
+        self.dry_run = dry_run
+        self.error = error
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"PolicySendResult(success={self.success}, dry_run={self.dry_run}, error={self.error!r})"
+
 
 class FeeCalculator:
     def __init__(self, config, db_connection):
@@ -20,6 +50,66 @@ class FeeCalculator:
         self.tls_path = config.get_tls_path() if config else None
         self.basefee_msat = config.get_basefee_msat() if config else 0
         self.time_lock_delta = config.get_time_lock_delta() if config else 0
+        self.timeout = config.get_api_timeout() if config else 10.0
+        self.max_workers = config.get_api_max_workers() if config else 8
+        self.max_retries = config.get_api_max_retries() if config else 3
+        self.retry_backoff = config.get_api_retry_backoff() if config else 0.5
+        self.apply_mode = config.get_api_apply_mode() if config else 'per_channel'
+        # macaroonとTLS証明書は一度だけ読み込み、ファイル更新時のみ再読み込みする
+        self.credentials = CredentialProvider(self.macaroon_path, self.tls_path)
+        self._session_lock = threading.Lock()
+        self._ssl_context = None
+        self.session = self._create_session()
+
+    def _create_session(self):
+        """
+        Create a shared HTTP session with keep-alive connection pooling and retries
+
+        Returns:
+            requests.Session: Session used for all lightning-api calls
+        """
+        # SSLコンテキストは最初のリクエスト時に get_session() で読み込む
+        session = requests.Session()
+        self._mount_adapters(session, None)
+        return session
+
+    def _mount_adapters(self, session, ssl_context):
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False,
+        )
+        # ワーカー数分のコネクションを保持してTLSハンドシェイクを使い回す
+        adapter = TLSContextAdapter(
+            ssl_context=ssl_context, pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry
+        )
+        previous = session.adapters.get('https://')
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if previous is not None:
+            # 古い SSL コンテキストに紐づいたコネクションプールを解放する
+            previous.close()
+        self._ssl_context = ssl_context
+
+    def get_session(self):
+        """
+        Get the shared session, re-mounting the adapters if tls.cert has changed
+
+        Returns:
+            requests.Session: Session used for all lightning-api calls
+        """
+        ssl_context = self.credentials.get_ssl_context()
+        if ssl_context is not self._ssl_context:
+            with self._session_lock:
+                if ssl_context is not self._ssl_context:
+                    self._mount_adapters(self.session, ssl_context)
+        return self.session
+
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self.session.close()
 
     def get_latest_data(self, channel_id):
         # This method should retrieve the latest data for the given channel_id from the database
@@ -30,26 +120,15 @@ class FeeCalculator:
         Set local fee & inbound fee for a channel using lightning-api.
         
         Args:
-            channel_id: Channel ID
+            channel: Channel (or PolicyChange) with channel_name, channel_id and channel_point
             fee: Fee amount
             infee: Inbound fee amount
+            local_balance: Local balance used to derive max_htlc_msat
         """
 
         if infee > 0:
             print(f"parameter error infee={infee}")
-            return False
-
-        max_htlc_msat = int(local_balance / 3 * 2 * 1000)
-
-        # グローバル変数ではなくインスタンス変数を使用
-        url = f'{self.api_url}/v1/chanpolicy'
-        macaroon = codecs.encode(open(self.macaroon_path, 'rb').read(), 'hex')
-        headers = {'Grpc-Metadata-macaroon': macaroon}
-
-        inboundFee = {
-            'base_fee_msat': 0,
-            'fee_rate_ppm': infee
-        }
+            return PolicySendResult(False, error=f"parameter error infee={infee}")
 
         funding_txid_str = channel.channel_point.split(':')[0]
         output_index = int(channel.channel_point.split(':')[1])
@@ -61,31 +140,160 @@ class FeeCalculator:
 
         data = {
             'chan_point': channelPoint, #<ChannelPoint>
+            **self._build_policy_data(fee, infee, local_balance),
+        }
+
+        return self._send_policy(data, f"channel {channel.channel_name}", channel.channel_id)
+
+    def set_global_fee_api(self, fee, infee, channel_count=None):
+        """
+        Set the same local fee & inbound fee for every channel of the node with
+        a single UpdateChannelPolicy call (global scope).
+
+        max_htlc_msat is omitted, so LND keeps each channel's current value.
+
+        Args:
+            fee: Fee amount
+            infee: Inbound fee amount
+            channel_count: Number of channels covered (for logging)
+        """
+        if infee > 0:
+            print(f"parameter error infee={infee}")
+            return PolicySendResult(False, error=f"parameter error infee={infee}")
+
+        data = {
+            'global': True,
+            **self._build_policy_data(fee, infee, None),
+        }
+
+        label = "all channels" if channel_count is None else f"all {channel_count} channels"
+        return self._send_policy(data, label, "global")
+
+    def list_channels(self):
+        """
+        Get every open channel of the node with one ListChannels call
+
+        Returns:
+            list: Channel dictionaries of GET /v1/channels, or None on error
+        """
+        response = self._get_json('/v1/channels', 'http.channels')
+        return None if response is None else response.get('channels', [])
+
+    def get_fee_report(self):
+        """
+        Get the current policy of every channel with one FeeReport call
+
+        Returns:
+            list: channel_fees dictionaries of GET /v1/feereport, or None on error
+        """
+        response = self._get_json('/v1/feereport', 'http.feereport')
+        return None if response is None else response.get('channel_fees', [])
+
+    def subscribe(self, path):
+        """
+        Open a REST streaming endpoint and yield its messages until it ends
+
+        Args:
+            path: Streaming endpoint (e.g. '/v2/router/htlcevents')
+
+        Yields:
+            dict: 'result' object of each newline-delimited JSON message
+
+        Raises:
+            requests.exceptions.RequestException: On connection errors
+            ValueError: On malformed messages or an error message from LND
+        """
+        url = f'{self.api_url}{path}'
+        headers = self.credentials.get_headers()
+        # 接続のみタイムアウトを設定し、イベント待ちの読み込みは無期限にする
+        response = self.get_session().get(url, headers=headers, stream=True, timeout=(self.timeout, None))
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                if 'error' in message:
+                    raise ValueError(f"{path}: {message['error']}")
+                yield message.get('result', message)
+        finally:
+            response.close()
+
+    def _get_json(self, path, timer_name):
+        url = f'{self.api_url}{path}'
+        try:
+            headers = self.credentials.get_headers()
+            with profiler.timer(timer_name):
+                response = self.get_session().get(url, headers=headers, timeout=self.timeout)
+            profiler.count('api.requests')
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            print(f"Error fetching {path}: {e}")
+            profiler.count('api.failures')
+            return None
+
+    def is_dry_run(self):
+        """True if Debug_mode only prints the policy updates instead of sending them"""
+        # Debug_modeもconfigから取得
+        return self.config.get_debug_mode() if hasattr(self.config, 'get_debug_mode') else False
+
+    def get_max_htlc_msat(self, local_balance):
+        """max_htlc_msat is set to 2/3 of the local balance"""
+        return int(local_balance / 3 * 2 * 1000)
+
+    def _build_policy_data(self, fee, infee, local_balance):
+        inboundFee = {
+            'base_fee_msat': 0,
+            'fee_rate_ppm': infee
+        }
+
+        data = {
             'base_fee_msat': self.basefee_msat,  #<int64>
             'fee_rate_ppm':  fee,           #<uint32>
             'time_lock_delta': self.time_lock_delta, #<uint32>
-            'max_htlc_msat': max_htlc_msat,     #<uint64>
             'inbound_fee': inboundFee,           #<InboundFee>
         }
+        # 残高が分からない場合は max_htlc_msat を送らず、LND の現在の値を維持する
+        if local_balance is not None:
+            data['max_htlc_msat'] = self.get_max_htlc_msat(local_balance)     #<uint64>
+        return data
 
-        # Debug_modeもconfigから取得
-        debug_mode = self.config.get_debug_mode() if hasattr(self.config, 'get_debug_mode') else False
-        
-        if debug_mode:
+    def _send_policy(self, data, label, target_id):
+        # グローバル変数ではなくインスタンス変数を使用
+        url = f'{self.api_url}/v1/chanpolicy'
+
+        if self.is_dry_run():
             #print data
-            print(f"Setting done for channel {channel.channel_name}: {channel.channel_id}")
+            print(f"Setting done for {label}: {target_id}")
             print("#### data ####")
             print(data)
             print("##############")
-            return True
+            # 送信していないため、適用済みの更新とは区別して返す
+            return PolicySendResult(True, dry_run=True)
 
         # 既存のreturnを削除し、APIリクエストを実装
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(data), verify=self.tls_path)
+            headers = self.credentials.get_headers()
+            with profiler.timer('http.chanpolicy'), metrics.timer('fee_manager_lnd_request_duration_seconds'):
+                response = self.get_session().post(url, headers=headers, data=json.dumps(data), timeout=self.timeout)
+            profiler.count('api.requests')
             response.raise_for_status()
-            print(f"Setting done for channel {channel.channel_name}: {channel.channel_id}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error setting fee for channel {channel.channel_name} ({channel.channel_id}): {e}")
-            return False
+            print(f"Setting done for {label}: {target_id}")
+        except (requests.exceptions.RequestException, OSError) as e:
+            print(f"Error setting fee for {label} ({target_id}): {e}")
+            profiler.count('api.failures')
+            metrics.inc('fee_manager_lnd_requests_total', result='failure')
+            return PolicySendResult(False, error=_describe_error(e))
+
+        metrics.inc('fee_manager_lnd_requests_total', result='success')
+        return PolicySendResult(True)
+
 
-        return True
+def _describe_error(error):
+    # HTTP エラーはステータスと LND が返したエラー本文を監査ログに残す
+    response = getattr(error, 'response', None)
+    if response is None:
+        return str(error)
+    body = (response.text or '').strip()
+    return f"HTTP {response.status_code}: {body}" if body else f"HTTP {response.status_code}"
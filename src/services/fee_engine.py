@@ -0,0 +1,138 @@
+import json
+import numpy as np
+import pandas as pd
+from services.fee_policy import RANGE_BITS
+from utils.profiling import profiler
+
+
+class VectorizedFeeEngine:
+    def __init__(self, policy):
+        """
+        Columnar counterpart of the per-channel analysis in DataAnalyzer and main.py
+
+        All channels' recent windows are evaluated in one pass over NumPy arrays.
+        The per-object path stays the reference implementation; both must agree.
+
+        Args:
+            policy: FeePolicy holding the fee parameters
+        """
+        self.policy = policy
+
+    @profiler.timed('sql.load_window')
+    def load_window(self, db_connection, channel_ids=None):
+        """
+        Load the most recent data_period snapshots of every channel into a DataFrame
+
+        Args:
+            db_connection: sqlite3 connection
+            channel_ids: Optional list of channel IDs to restrict the query to
+
+        Returns:
+            pandas.DataFrame: One row per snapshot, sorted by channel_id and date
+        """
+        if channel_ids is None:
+            channel_filter = ""
+            params = (self.policy.data_period,)
+        else:
+            channel_filter = "WHERE channel_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(channel_ids)), self.policy.data_period)
+
+        query = f"""
+            SELECT w.channel_id, w.date, w.local_balance, w.local_fee, w.local_infee,
+                   w.amboss_fee, w.active, l.capacity
+            FROM (
+                SELECT channel_id, date, local_balance, local_fee, local_infee, amboss_fee, active,
+                       ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY date DESC) AS rn
+                FROM channel_datas
+                {channel_filter}
+            ) w
+            JOIN channel_lists l ON l.channel_id = w.channel_id
+            WHERE w.rn <= ?
+            ORDER BY w.channel_id, w.date ASC
+        """
+        return pd.read_sql_query(query, db_connection, params=params)
+
+    def get_range_flags(self, ratios):
+        """Vectorized DataAnalyzer._get_range_flags"""
+        flags = np.zeros(len(ratios), dtype=np.int64)
+        for lower, upper, include_upper, bit in RANGE_BITS:
+            upper_ok = ratios <= upper if include_upper else ratios < upper
+            flags |= np.where((ratios >= lower) & upper_ok, bit, 0)
+        return flags
+
+    def evaluate(self, frame):
+        """
+        Compute the analysis values and candidate fees for every channel
+
+        Args:
+            frame: Snapshots as returned by load_window()
+
+        Returns:
+            pandas.DataFrame: One row per channel (indexed by channel_id) with
+                the range flags, tolerance / same-fee checks, ratio_index,
+                clamped amboss fee and the new local / inbound fees
+        """
+        policy = self.policy
+        frame = frame.sort_values(['channel_id', 'date'], kind='stable').reset_index(drop=True)
+        channel_ids = frame['channel_id'].to_numpy()
+
+        ratios = frame['local_balance'].to_numpy(dtype=float) / frame['capacity'].to_numpy(dtype=float)
+        flags = self.get_range_flags(ratios)
+
+        # 全データ点に共通する区間（ビットごとに全行で立っているか）
+        bits = np.array([bit for _, _, _, bit in RANGE_BITS], dtype=np.int64)
+        has_bit = pd.DataFrame((flags[:, None] & bits) > 0)
+        has_bit['channel_id'] = channel_ids
+        common_flags = has_bit.groupby('channel_id', sort=True).all().to_numpy() @ bits
+
+        by_channel = frame.groupby('channel_id', sort=True)
+        latest = by_channel.tail(1).set_index('channel_id')
+        result = pd.DataFrame(index=latest.index)
+        result['n_rows'] = by_channel.size()
+        result['date'] = latest['date']
+
+        flag_series = pd.Series(flags, index=frame.index)
+        latest_flags = flag_series.groupby(channel_ids).last()
+        previous_flags = flag_series.groupby(channel_ids).shift(1).groupby(channel_ids).last()
+
+        result['range_flags'] = latest_flags.to_numpy()
+        result['common_range_flags'] = common_flags
+        result['within_tolerance'] = common_flags > 0
+        result['within_tolerance_1'] = (
+            (result['n_rows'] >= 2).to_numpy()
+            & ((latest_flags.to_numpy() & previous_flags.fillna(0).to_numpy(dtype=np.int64)) > 0)
+        )
+        result['same_localfee'] = (
+            (result['n_rows'] > 1).to_numpy()
+            & (by_channel['local_fee'].nunique(dropna=False) == 1).to_numpy()
+        )
+
+        for column in ('local_balance', 'local_fee', 'local_infee', 'amboss_fee', 'capacity'):
+            result[column] = latest[column].to_numpy(dtype=float)
+        result['active'] = latest['active'].fillna(0).to_numpy(dtype=np.int64) != 0
+
+        local_balance_ratio = result['local_balance'].to_numpy() / result['capacity'].to_numpy()
+        result['local_balance_ratio'] = local_balance_ratio
+        ratio_index = np.minimum(np.trunc(np.nan_to_num(local_balance_ratio) * 5), 4).astype(np.int64)
+        result['ratio_index'] = ratio_index
+
+        amboss_fee = result['amboss_fee'].to_numpy()
+        clamped = np.minimum(amboss_fee, policy.max_amboss_fee)
+        result['has_amboss_fee'] = ~np.isnan(amboss_fee)
+        result['amboss_fee_clamped'] = clamped
+
+        local_ratio = np.asarray(policy.LocalFee_ratio, dtype=float)[ratio_index]
+        inbound_ratio = np.asarray(policy.inboundFee_ratio, dtype=float)[ratio_index]
+        result['new_local_fee'] = np.trunc(clamped * local_ratio) - policy.inboundFee_base
+        result['new_inbound_fee'] = np.minimum(np.trunc(policy.inboundFee_base + clamped * inbound_ratio), 0)
+
+        local_fee = result['local_fee'].to_numpy()
+        decreased = np.trunc((local_fee + policy.inboundFee_base) * policy.decay_factor - policy.inboundFee_base)
+        result['decreased_local_fee'] = np.maximum(decreased, -policy.inboundFee_base)
+
+        result['decrease'] = (
+            (local_balance_ratio >= policy.fee_decreasing_threshold)
+            & result['within_tolerance'].to_numpy()
+            & result['same_localfee'].to_numpy()
+        )
+        return result
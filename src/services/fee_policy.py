@@ -0,0 +1,158 @@
+def _parse_ratios(value):
+    if isinstance(value, str):
+        value = value.split(',')
+    return [float(x) for x in value]
+
+
+# 残高比率の区間（下限, 上限, 上限を含むか, ビット）。
+# DataAnalyzer・ChannelSummary・VectorizedFeeEngine はすべてこの表を使う
+RANGE_BITS = (
+    (0.8, 1.0, True, 0b10000),
+    (0.6, 0.8, False, 0b01000),
+    (0.4, 0.6, False, 0b00100),
+    (0.2, 0.4, False, 0b00010),
+    (0.0, 0.2, False, 0b00001),
+)
+
+
+def get_range_flags(ratio):
+    """
+    Convert a ratio to a binary flag representation of which range it belongs to.
+
+    Args:
+        ratio: Local balance ratio (0-1)
+
+    Returns:
+        int: Binary representation of ranges (e.g. 00100), 0 if out of range
+    """
+    for lower, upper, include_upper, bit in RANGE_BITS:
+        if lower <= ratio and (ratio <= upper if include_upper else ratio < upper):
+            return bit
+    return 0
+
+
+# バックテストやパラメータ探索で上書きできる値（名前 → 変換関数）
+POLICY_PARAMETERS = {
+    'inboundFee_ratio': _parse_ratios,
+    'LocalFee_ratio': _parse_ratios,
+    'fee_decreasing_threshold': float,
+    'decay_factor': float,
+    'data_period': int,
+    'max_amboss_fee': int,
+}
+
+
+class FeePolicy:
+    def __init__(self, inboundFee_base, inboundFee_ratio, LocalFee_ratio, fee_decreasing_threshold,
+                 data_period, decay_factor=0.9, max_amboss_fee=5000):
+        """
+        Fee formulas shared by the per-channel and vectorized decision paths
+
+        Args:
+            inboundFee_base: Base inbound fee (ppm, usually negative)
+            inboundFee_ratio: Inbound fee ratios for the 5 balance ranges
+            LocalFee_ratio: Local fee ratios for the 5 balance ranges
+            fee_decreasing_threshold: Minimum local balance ratio for decreasing the fee
+            data_period: Number of snapshots used for the analysis
+            decay_factor: Multiplier applied when decreasing the local fee
+            max_amboss_fee: Upper bound applied to the amboss fee
+        """
+        self.inboundFee_base = inboundFee_base
+        self.inboundFee_ratio = list(inboundFee_ratio)
+        self.LocalFee_ratio = list(LocalFee_ratio)
+        self.fee_decreasing_threshold = fee_decreasing_threshold
+        self.data_period = data_period
+        self.decay_factor = decay_factor
+        self.max_amboss_fee = max_amboss_fee
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            inboundFee_base=config.get_inboundFee_base(),
+            inboundFee_ratio=config.get_inboundFee_ratio(),
+            LocalFee_ratio=config.get_LocalFee_ratio(),
+            fee_decreasing_threshold=config.get_fee_decreasing_threshold(),
+            data_period=config.get_data_period(),
+        )
+
+    def replace(self, **changes):
+        """
+        Get a copy of the policy with some parameters changed
+
+        Args:
+            changes: Parameter values by name (see POLICY_PARAMETERS); strings are parsed
+
+        Returns:
+            FeePolicy: New policy
+        """
+        values = {
+            'inboundFee_base': self.inboundFee_base,
+            'inboundFee_ratio': self.inboundFee_ratio,
+            'LocalFee_ratio': self.LocalFee_ratio,
+            'fee_decreasing_threshold': self.fee_decreasing_threshold,
+            'data_period': self.data_period,
+            'decay_factor': self.decay_factor,
+            'max_amboss_fee': self.max_amboss_fee,
+        }
+        for name, value in changes.items():
+            values[name] = POLICY_PARAMETERS[name](value)
+        return FeePolicy(**values)
+
+    def parameters(self):
+        """Values of the POLICY_PARAMETERS (e.g. for reports)"""
+        return {name: getattr(self, name) for name in POLICY_PARAMETERS}
+
+    def get_ratio_index(self, local_balance_ratio):
+        """Map a local balance ratio to the range index (0-4)"""
+        return min(int(local_balance_ratio * 5), 4)
+
+    def clamp_amboss_fee(self, amboss_fee):
+        return min(amboss_fee, self.max_amboss_fee)
+
+    def calculate_fixed_fee(self, fee):
+        return fee - self.inboundFee_base
+
+    def calculate_local_fee(self, amboss_fee, ratio_index):
+        amboss_fee = self.clamp_amboss_fee(amboss_fee)
+        return int(amboss_fee * self.LocalFee_ratio[ratio_index]) - self.inboundFee_base
+
+    def calculate_inbound_fee(self, amboss_fee, ratio_index):
+        amboss_fee = self.clamp_amboss_fee(amboss_fee)
+        inbound_fee = int(self.inboundFee_base + (amboss_fee * self.inboundFee_ratio[ratio_index]))
+        # インバウンド手数料は正の値にしない
+        return min(inbound_fee, 0)
+
+    def calculate_decreased_fee(self, local_fee):
+        new_local_fee = int((local_fee + self.inboundFee_base) * self.decay_factor - self.inboundFee_base)
+        # インバウンド割引分を下回らないようにする
+        return max(new_local_fee, -self.inboundFee_base)
+
+
+def parse_policy_overrides(items):
+    """
+    Parse NAME=VALUE strings (e.g. from the command line) into policy parameters
+
+    Names are matched case-insensitively, like the configuration options.
+
+    Args:
+        items: Iterable of 'NAME=VALUE' strings or (name, value) pairs
+
+    Returns:
+        dict: Parameter values by POLICY_PARAMETERS name
+
+    Raises:
+        ValueError: If a name is unknown or a value cannot be parsed
+    """
+    names = {name.lower(): name for name in POLICY_PARAMETERS}
+    overrides = {}
+    for item in items:
+        if isinstance(item, str):
+            if '=' not in item:
+                raise ValueError(f"パラメータは NAME=VALUE の形式で指定してください: '{item}'")
+            item = item.split('=', 1)
+        name, value = item[0].strip(), item[1]
+        if name.lower() not in names:
+            raise ValueError(f"不明なパラメータ '{name}'（{', '.join(POLICY_PARAMETERS)}）")
+        name = names[name.lower()]
+        overrides[name] = POLICY_PARAMETERS[name](value)
+    return overrides
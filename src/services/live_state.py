@@ -0,0 +1,195 @@
+from dataclasses import dataclass, replace
+from services.metrics import metrics
+from utils.profiling import profiler
+
+
+@dataclass(frozen=True)
+class LiveChannelState:
+    """
+    Current state and policy of one channel as reported by LND
+
+    The REST API encodes 64-bit integers as strings; they are converted to
+    int here. fee_per_mil is None for channels missing from the fee report.
+    """
+    channel_point: str
+    chan_id: str
+    active: bool
+    capacity: int
+    local_balance: int
+    base_fee_msat: int = None
+    fee_per_mil: int = None
+    inbound_base_fee_msat: int = None
+    inbound_fee_per_mil: int = None
+
+
+def _to_int(value, default=None):
+    return default if value is None or value == '' else int(value)
+
+
+def parse_live_state(channels, channel_fees):
+    """
+    Join the ListChannels and FeeReport responses by channel_point
+
+    Args:
+        channels: 'channels' list of GET /v1/channels
+        channel_fees: 'channel_fees' list of GET /v1/feereport
+
+    Returns:
+        dict: Dictionary with channel points as keys and LiveChannelState as values
+    """
+    states = {}
+    for channel in channels:
+        channel_point = channel.get('channel_point')
+        if not channel_point:
+            continue
+        # proto3 の JSON では既定値（false / 0）のフィールドが省略されることがある
+        states[channel_point] = LiveChannelState(
+            channel_point=channel_point,
+            chan_id=str(channel.get('chan_id', '')),
+            active=bool(channel.get('active', False)),
+            capacity=_to_int(channel.get('capacity'), 0),
+            local_balance=_to_int(channel.get('local_balance'), 0),
+        )
+
+    for fee in channel_fees:
+        state = states.get(fee.get('channel_point'))
+        if state is None:
+            continue
+        states[state.channel_point] = replace(
+            state,
+            base_fee_msat=_to_int(fee.get('base_fee_msat'), 0),
+            fee_per_mil=_to_int(fee.get('fee_per_mil'), 0),
+            inbound_base_fee_msat=_to_int(fee.get('inbound_base_fee_msat'), 0),
+            inbound_fee_per_mil=_to_int(fee.get('inbound_fee_per_mil'), 0),
+        )
+    return states
+
+
+def fetch_live_state(fee_calculator):
+    """
+    Fetch the state of every channel from LND with two bulk calls
+
+    Args:
+        fee_calculator: FeeCalculator whose pooled session and credentials are used
+
+    Returns:
+        dict: Dictionary with channel points as keys and LiveChannelState as values,
+              or None if either call failed
+    """
+    channels = fee_calculator.list_channels()
+    if channels is None:
+        return None
+    channel_fees = fee_calculator.get_fee_report()
+    if channel_fees is None:
+        return None
+    return parse_live_state(channels, channel_fees)
+
+
+def merge_live_state(channels, channel_data_map, live_states):
+    """
+    Overwrite the latest snapshot of each channel with the live LND values
+
+    The balance, active flag and (if reported) local / inbound fee of the
+    latest in-memory row are replaced; the stored history is left unchanged.
+
+    Args:
+        channels: List of Channel objects
+        channel_data_map: Dictionary with channel IDs as keys and ChannelHistory as values
+        live_states: Result of fetch_live_state()
+
+    Returns:
+        int: Number of channels merged
+    """
+    merged = 0
+    for channel in channels:
+        history = channel_data_map.get(channel.channel_id)
+        state = live_states.get(channel.channel_point)
+        if state is None or not history:
+            continue
+        history.set_latest(
+            local_balance=state.local_balance,
+            local_fee=state.fee_per_mil,
+            local_infee=state.inbound_fee_per_mil,
+            active=state.active,
+        )
+        merged += 1
+    return merged
+
+
+def merge_live_state_frame(frame, channels, live_states):
+    """
+    Overwrite the latest snapshot of each channel in a VectorizedFeeEngine window
+
+    Same as merge_live_state() for the DataFrame returned by
+    VectorizedFeeEngine.load_window(); the frame is modified in place.
+
+    Args:
+        frame: Snapshots sorted by channel_id and date
+        channels: List of Channel objects
+        live_states: Result of fetch_live_state()
+
+    Returns:
+        int: Number of channels merged
+    """
+    states = {}
+    for channel in channels:
+        state = live_states.get(channel.channel_point)
+        if state is not None:
+            states[channel.channel_id] = state
+    if frame.empty or not states:
+        return 0
+
+    merged = 0
+    latest_rows = frame.groupby('channel_id', sort=False).tail(1)
+    for index, channel_id in zip(latest_rows.index, latest_rows['channel_id']):
+        state = states.get(channel_id)
+        if state is None:
+            continue
+        frame.at[index, 'local_balance'] = state.local_balance
+        if state.fee_per_mil is not None:
+            frame.at[index, 'local_fee'] = state.fee_per_mil
+        if state.inbound_fee_per_mil is not None:
+            frame.at[index, 'local_infee'] = state.inbound_fee_per_mil
+        frame.at[index, 'active'] = 1 if state.active else 0
+        merged += 1
+    return merged
+
+
+def is_live_noop(change, state, basefee_msat):
+    """
+    True if LND already has exactly the policy a PolicyChange would set
+
+    Args:
+        change: PolicyChange
+        state: LiveChannelState of the channel, or None
+        basefee_msat: Base fee the update would send
+    """
+    return (
+        state is not None
+        and state.fee_per_mil is not None
+        and state.fee_per_mil == change.new_local_fee
+        and state.inbound_fee_per_mil == change.new_inbound_fee
+        and state.base_fee_msat == basefee_msat
+    )
+
+
+def drop_live_noops(changes, live_states, basefee_msat):
+    """
+    Remove the planned changes whose policy is already set in LND
+
+    Args:
+        changes: PolicyChange records
+        live_states: Result of fetch_live_state()
+        basefee_msat: Base fee the updates would send
+
+    Returns:
+        tuple: PolicyChange records that still need an update
+    """
+    kept = tuple(change for change in changes
+                 if not is_live_noop(change, live_states.get(change.channel_point), basefee_msat))
+    dropped = len(changes) - len(kept)
+    if dropped:
+        profiler.count('skipped.live_unchanged', dropped)
+        metrics.inc('fee_manager_skipped_total', dropped, reason='live_unchanged')
+        print(f"Skipping {dropped} updates already set in LND...")
+    return kept
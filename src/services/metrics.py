@@ -0,0 +1,291 @@
+import bisect
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.profiling import current_node
+
+# LND 呼び出しのレイテンシ用バケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def _key(name, labels):
+    # node_scope() の中で記録した値にはノード名のラベルを付ける
+    node = current_node.get()
+    if node is not None and 'node' not in labels:
+        labels['node'] = node
+    return name, tuple(sorted(labels.items()))
+
+
+class _Shard:
+    # 1スレッド専用の書き込み先（他のスレッドは読み取りのみ）
+    __slots__ = ('thread', 'counters', 'gauges', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Counters, gauges and histograms exported in the Prometheus text format
+
+        Every thread records into its own shard, so updates never take a lock
+        and a scrape never blocks a fee run; the shards are merged on scrape.
+        Like the profiler, all recording is a no-op until enable() is called.
+
+        Args:
+            buckets: Upper bounds of the histogram buckets (seconds)
+        """
+        self.enabled = False
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        # 終了したスレッドのシャードをまとめたもの
+        self._retired = _Shard(None)
+        # ゲージはシャードをまたいで最後に書かれた値を採用する
+        self._sequence = itertools.count()
+        self._descriptions = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def describe(self, name, kind, help_text):
+        """
+        Register the TYPE and HELP lines of a metric
+
+        Args:
+            name: Metric name
+            kind: 'counter', 'gauge' or 'histogram'
+            help_text: Description
+        """
+        self._descriptions[name] = (kind, help_text)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        counters = self._shard().counters
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        self._shard().gauges[key] = (next(self._sequence), value)
+
+    def observe(self, name, value, **labels):
+        """Record a value (e.g. a latency in seconds) in a histogram"""
+        if not self.enabled:
+            return
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # [バケットごとの件数（累積ではない）, 合計, 件数]
+            histogram = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def timer(self, name, **labels):
+        """Time a block and record the duration in a histogram"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(name, labels)
+
+    @contextmanager
+    def _timed(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _merge(self, target, shard):
+        for key, value in list(shard.counters.items()):
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, value in list(shard.gauges.items()):
+            if key not in target.gauges or target.gauges[key][0] < value[0]:
+                target.gauges[key] = value
+        for key, (counts, total, count) in list(shard.histograms.items()):
+            histogram = target.histograms.get(key)
+            if histogram is None:
+                histogram = target.histograms[key] = [[0] * len(counts), 0.0, 0]
+            for index, bucket_count in enumerate(counts):
+                histogram[0][index] += bucket_count
+            histogram[1] += total
+            histogram[2] += count
+
+    def collect(self):
+        """
+        Merge all shards into one snapshot
+
+        Returns:
+            _Shard: Merged counters, gauges and histograms
+        """
+        with self._shards_lock:
+            # 終了したスレッドはもう書き込まないので退避先にまとめてシャード数を抑える
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            merged = _Shard(None)
+            self._merge(merged, self._retired)
+            shards = list(alive)
+        for shard in shards:
+            self._merge(merged, shard)
+        return merged
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        merged = self.collect()
+        series = {}
+        for (name, labels), value in sorted(merged.counters.items()):
+            series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (_, value) in sorted(merged.gauges.items()):
+            series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (counts, total, count) in sorted(merged.histograms.items()):
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        output = []
+        for name in sorted(series):
+            if name in self._descriptions:
+                kind, help_text = self._descriptions[name]
+                output.append(f"# HELP {name} {help_text}")
+                output.append(f"# TYPE {name} {kind}")
+            output.extend(series[name])
+        return '\n'.join(output) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricsServer:
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        """
+        Embedded HTTP server exposing the registry at /metrics
+
+        Args:
+            registry: MetricsRegistry to export
+            host: Listen address
+            port: Listen port (0 picks a free port)
+        """
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        print(f"Serving metrics at {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+
+# アプリケーション全体で共有するインスタンス
+metrics = MetricsRegistry()
+metrics.describe('fee_manager_decisions_total', 'counter', 'Planned policy changes by decision branch')
+metrics.describe('fee_manager_skipped_total', 'counter', 'Channels left unchanged by reason')
+metrics.describe('fee_manager_deferred_total', 'counter', 'Planned policy changes deferred by the scheduler by reason')
+metrics.describe('fee_manager_channel_local_fee_ppm', 'gauge', 'Current local fee rate of the channel')
+metrics.describe('fee_manager_channel_inbound_fee_ppm', 'gauge', 'Current inbound fee rate of the channel')
+metrics.describe('fee_manager_channel_local_balance_ratio', 'gauge', 'Local balance / capacity of the channel')
+metrics.describe('fee_manager_lnd_requests_total', 'counter', 'UpdateChannelPolicy calls by result')
+metrics.describe('fee_manager_lnd_request_duration_seconds', 'histogram', 'UpdateChannelPolicy call latency')
+metrics.describe('fee_manager_runs_total', 'counter', 'Completed fee runs')
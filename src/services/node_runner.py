@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from utils.profiling import node_scope
+
+
+@dataclass(frozen=True)
+class RunSummary:
+    """
+    Outcome of one fee run (one node)
+
+    changes holds the planned PolicyChange records; succeeded / failed count
+    the UpdateChannelPolicy results per channel (both 0 for --plan).
+    """
+    node_name: str
+    channels: int
+    changes: tuple
+    succeeded: int
+    failed: int
+    seconds: float = 0.0
+    error: str = None
+
+
+def run_nodes(node_configs, run_node, max_parallel=0):
+    """
+    Run every node concurrently on a thread pool
+
+    Each call of run_node opens its own database connection and HTTP session
+    inside its worker thread, so the nodes share nothing but the process.
+    The work is dominated by SQLite and LND I/O, which release the GIL.
+    Profiler spans and metrics recorded by a node are tagged with its name.
+
+    Args:
+        node_configs: ConfigLoader of each node (from ConfigLoader.for_node)
+        run_node: Callable taking a node ConfigLoader and returning a RunSummary
+        max_parallel: Maximum number of nodes processed at once (0: all)
+
+    Returns:
+        list: RunSummary of each node, in the order of node_configs
+    """
+    if not node_configs:
+        return []
+
+    max_workers = max_parallel if max_parallel > 0 else len(node_configs)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='node') as pool:
+        futures = [pool.submit(_run_node, run_node, config) for config in node_configs]
+        return [future.result() for future in futures]
+
+
+def _run_node(run_node, config):
+    start = time.perf_counter()
+    try:
+        with node_scope(config.node_name):
+            summary = run_node(config)
+    except Exception as e:
+        # 1つのノードの失敗で他のノードを止めない
+        print(f"Error running node {config.node_name}: {e}")
+        return RunSummary(config.node_name, 0, (), 0, 0, time.perf_counter() - start, str(e))
+    return replace(summary, node_name=config.node_name, seconds=time.perf_counter() - start)
+
+
+def print_node_summary(summaries):
+    """Print one line per node and the totals over all nodes"""
+    print("Node summary:")
+    print(f"  {'node':<20}{'channels':>10}{'changes':>10}{'succeeded':>11}{'failed':>8}{'seconds':>10}")
+    for summary in summaries:
+        line = (f"  {summary.node_name:<20}{summary.channels:>10}{len(summary.changes):>10}"
+                f"{summary.succeeded:>11}{summary.failed:>8}{summary.seconds:>10.1f}")
+        if summary.error:
+            line += f"  error: {summary.error}"
+        print(line)
+    print(f"  {'total':<20}{sum(s.channels for s in summaries):>10}"
+          f"{sum(len(s.changes) for s in summaries):>10}{sum(s.succeeded for s in summaries):>11}"
+          f"{sum(s.failed for s in summaries):>8}{max((s.seconds for s in summaries), default=0.0):>10.1f}")
@@ -0,0 +1,361 @@
+import csv
+import itertools
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+import numpy as np
+from models.channel import Channel
+from services.backtest import Backtester
+from services.fee_policy import parse_policy_overrides
+
+# 整数列で NULL を表す値（ChannelHistory と同じ）
+NULL = -(2 ** 63)
+
+# 列ファイル名 → dtype（1列1ファイルの .npy をメモリマップで共有する）
+HISTORY_COLUMNS = {
+    'channel': np.int32,
+    'local_balance': np.int64,
+    'local_fee': np.int64,
+    'local_infee': np.int64,
+    'amboss_fee': np.int64,
+    'active': np.uint8,
+}
+NULLABLE_COLUMNS = ('local_balance', 'local_fee', 'local_infee', 'amboss_fee')
+
+EXPORT_CHUNK = 65536
+REPLAY_CHUNK = 65536
+
+# 順位付けの指標（名前 → (並び順の符号, 説明)）
+RANK_METRICS = {
+    'updates': (1, 'fewest simulated policy updates'),
+    'fee_spread': (-1, 'largest mean fee gap between the lowest and highest balance range'),
+}
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    """One evaluated parameter combination and its BacktestResult"""
+    parameters: dict
+    result: object
+
+    @property
+    def fee_spread(self):
+        """Mean local fee in the lowest balance range minus the one in the highest"""
+        fees = self.result.bucket_mean_fees
+        if not fees or fees[0] is None or fees[-1] is None:
+            return None
+        return fees[0] - fees[-1]
+
+
+def parse_grid(items):
+    """
+    Parse NAME=V1|V2|... strings into the candidate values of each parameter
+
+    Args:
+        items: Iterable of strings; list values use commas (e.g. LocalFee_ratio=1,1,1,1,1|1.2,1,0.8,0.6,0.4)
+
+    Returns:
+        dict: Candidate values by POLICY_PARAMETERS name
+
+    Raises:
+        ValueError: If a name is unknown or a value cannot be parsed
+    """
+    grid = {}
+    for item in items:
+        if '=' not in item:
+            raise ValueError(f"パラメータは NAME=V1|V2 の形式で指定してください: '{item}'")
+        name, values = item.split('=', 1)
+        candidates = [parse_policy_overrides([(name, value)]) for value in values.split('|')]
+        canonical = next(iter(candidates[0]))
+        grid[canonical] = [candidate[canonical] for candidate in candidates]
+    return grid
+
+
+def expand_grid(grid, samples=None, seed=None):
+    """
+    Enumerate the parameter combinations of a grid
+
+    Args:
+        grid: Candidate values by parameter name (from parse_grid)
+        samples: If set, pick this many combinations at random instead of all
+        seed: Random seed for the sampling
+
+    Returns:
+        list: Parameter dictionaries
+    """
+    names = list(grid)
+    combinations = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if samples is not None and samples < len(combinations):
+        combinations = random.Random(seed).sample(combinations, samples)
+    return combinations
+
+
+def export_history(db, directory):
+    """
+    Write the channel_datas history as memory-mappable column files (.npy)
+
+    The rows are streamed from the database in time order and written in
+    chunks, so the export needs no more memory than one chunk.
+
+    Args:
+        db: Connected Database
+        directory: Output directory
+
+    Returns:
+        int: Number of exported snapshots
+    """
+    os.makedirs(directory, exist_ok=True)
+    channels = db.get_channels()
+    channel_index = {channel.channel_id: index for index, channel in enumerate(channels)}
+
+    total = db.read_conn.execute(
+        "SELECT COUNT(*) FROM channel_datas WHERE channel_id IN (SELECT channel_id FROM channel_lists)"
+    ).fetchone()[0]
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(total,))
+        for name, dtype in HISTORY_COLUMNS.items()
+    }
+
+    count = 0
+    chunk = []
+
+    def flush():
+        end = count + len(chunk)
+        values = list(zip(*chunk))
+        columns['channel'][count:end] = values[0]
+        for offset, name in enumerate(NULLABLE_COLUMNS, start=1):
+            columns[name][count:end] = [NULL if value is None else value for value in values[offset]]
+        columns['active'][count:end] = [1 if value else 0 for value in values[-1]]
+        return end
+
+    for channel_id, _, local_balance, local_fee, local_infee, amboss_fee, active in db.iter_channel_history():
+        index = channel_index.get(channel_id)
+        # 書き込み中に収集プロセスが追加した行は件数に含まれていないため読まない
+        if index is None or count + len(chunk) >= total:
+            continue
+        chunk.append((index, local_balance, local_fee, local_infee, amboss_fee, active))
+        if len(chunk) >= EXPORT_CHUNK:
+            count = flush()
+            chunk = []
+    if chunk:
+        count = flush()
+
+    for column in columns.values():
+        column.flush()
+
+    # 件数を数えた後に行が削除された場合に備えて、実際に書き込んだ行数を記録する
+    with open(os.path.join(directory, 'history.json'), 'w', encoding='utf-8') as file:
+        json.dump({
+            'rows': count,
+            'channels': [[channel.channel_id, channel.channel_name, channel.channel_point, channel.capacity]
+                         for channel in channels],
+        }, file)
+    return count
+
+
+def load_history(directory):
+    """
+    Open the exported history read-only via memory maps
+
+    Returns:
+        tuple: (list of Channel, dict of column arrays)
+    """
+    with open(os.path.join(directory, 'history.json'), encoding='utf-8') as file:
+        metadata = json.load(file)
+    channels = [Channel(id=index, channel_name=name, channel_id=channel_id, channel_point=point, capacity=capacity)
+                for index, (channel_id, name, point, capacity) in enumerate(metadata['channels'])]
+    columns = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')[:metadata['rows']]
+               for name in HISTORY_COLUMNS}
+    return channels, columns
+
+
+def iter_history_rows(channels, columns):
+    """
+    Yield the exported snapshots in the row format of Backtester.run()
+
+    The columns are converted chunk by chunk, so only one chunk of Python
+    objects exists at a time (the date is not needed for the replay).
+    """
+    channel_ids = [channel.channel_id for channel in channels]
+    total = len(columns['channel'])
+    for start in range(0, total, REPLAY_CHUNK):
+        end = min(start + REPLAY_CHUNK, total)
+        values = [columns[name][start:end].tolist() for name in NULLABLE_COLUMNS]
+        values = [[None if value == NULL else value for value in column] for column in values]
+        yield from zip(
+            [channel_ids[index] for index in columns['channel'][start:end].tolist()],
+            itertools.repeat(None),
+            *values,
+            columns['active'][start:end].tolist(),
+        )
+
+
+# ワーカープロセスごとに1回だけ開くメモリマップと固定・制御チャネルリスト
+_worker_state = {}
+
+
+def _init_worker(directory, fixed_channels, control_channels):
+    channels, columns = load_history(directory)
+    _worker_state.update(
+        channels=channels,
+        channel_map={channel.channel_id: channel for channel in channels},
+        columns=columns,
+        fixed_channels=fixed_channels,
+        control_channels=control_channels,
+    )
+
+
+def _evaluate(policy, parameters):
+    state = _worker_state
+    backtester = Backtester(policy.replace(**parameters), state['fixed_channels'], state['control_channels'])
+    result = backtester.run(state['channel_map'], iter_history_rows(state['channels'], state['columns']))
+    return SweepResult(parameters, result)
+
+
+def run_sweep(directory, policy, combinations, fixed_channels, control_channels, max_workers=None):
+    """
+    Backtest every parameter combination on a process pool
+
+    Each worker memory-maps the exported columns once, so the history is
+    shared through the page cache instead of being copied into every process.
+
+    Args:
+        directory: Directory written by export_history()
+        policy: Base FeePolicy; each combination overrides some of its parameters
+        combinations: Parameter dictionaries (from expand_grid)
+        fixed_channels: Fixed channel list (channel_id -> fee)
+        control_channels: Control channel list (channel_id -> fee)
+        max_workers: Number of worker processes (default: all CPU cores)
+
+    Returns:
+        list: SweepResult of each combination, in completion order
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    results = []
+    with ProcessPoolExecutor(max_workers=min(max_workers, max(len(combinations), 1)), initializer=_init_worker,
+                             initargs=(directory, fixed_channels, control_channels)) as executor:
+        futures = [executor.submit(_evaluate, policy, parameters) for parameters in combinations]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(combinations)}] {_format_parameters(result.parameters)}: "
+                  f"{result.result.updates} updates")
+    return results
+
+
+def run_parameter_sweep(db, policy, combinations, fixed_channels, control_channels, output_file=None,
+                        max_workers=None, rank_by='updates'):
+    """
+    Export the history once, backtest every combination in parallel and rank them
+
+    Args:
+        db: Connected Database
+        policy: Base FeePolicy
+        combinations: Parameter dictionaries (from expand_grid)
+        fixed_channels: Fixed channel list (channel_id -> fee)
+        control_channels: Control channel list (channel_id -> fee)
+        output_file: Optional CSV file for the ranked results
+        max_workers: Number of worker processes (default: all CPU cores)
+        rank_by: RANK_METRICS name
+
+    Returns:
+        list: SweepResult records, best first
+    """
+    with tempfile.TemporaryDirectory(prefix='fee_sweep_') as directory:
+        rows = export_history(db, directory)
+        print(f"Exported {rows} snapshots to memory-mapped columns")
+        results = run_sweep(directory, policy, combinations, fixed_channels, control_channels, max_workers)
+
+    results = rank_results(results, rank_by)
+    if output_file:
+        export_sweep(results, output_file)
+    print_sweep_results(results)
+    return results
+
+
+def rank_results(results, rank_by='updates'):
+    """
+    Sort sweep results by a RANK_METRICS metric (ties broken by the other one)
+
+    Args:
+        results: SweepResult records
+        rank_by: Metric name
+
+    Returns:
+        list: SweepResult records, best first
+    """
+    if rank_by not in RANK_METRICS:
+        raise ValueError(f"不明な指標 '{rank_by}'（{', '.join(RANK_METRICS)}）")
+
+    def metric(result, name):
+        sign = RANK_METRICS[name][0]
+        value = result.result.updates if name == 'updates' else result.fee_spread
+        # 値がない組み合わせは最後にする
+        return (value is None, 0 if value is None else sign * value)
+
+    others = [name for name in RANK_METRICS if name != rank_by]
+    return sorted(results, key=lambda result: [metric(result, rank_by)] + [metric(result, name) for name in others])
+
+
+def export_sweep(results, output_file):
+    """
+    Write ranked sweep results to a CSV file
+
+    Args:
+        results: SweepResult records, best first
+        output_file: Output path
+    """
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    names = sorted({name for result in results for name in result.parameters})
+    reasons = sorted({reason for result in results for reason in result.result.reasons})
+    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['rank'] + names + ['updates'] + [f'updates_{reason}' for reason in reasons]
+                        + ['fee_spread']
+                        + [f'bucket{index}_snapshots' for index in range(5)]
+                        + [f'bucket{index}_mean_fee' for index in range(5)])
+        for rank, result in enumerate(results, start=1):
+            backtest = result.result
+            writer.writerow(
+                [rank] + [_format_value(result.parameters.get(name)) for name in names] + [backtest.updates]
+                + [backtest.reasons.get(reason, 0) for reason in reasons]
+                + [_round(result.fee_spread)]
+                + list(backtest.bucket_snapshots)
+                + [_round(fee) for fee in backtest.bucket_mean_fees]
+            )
+    print(f"Wrote {len(results)} ranked parameter combinations to {output_file}")
+
+
+def print_sweep_results(results, limit=10):
+    """Print the best parameter combinations"""
+    if not results:
+        return
+    snapshots = results[0].result.bucket_snapshots
+    total = sum(snapshots)
+    if total:
+        # 残高は履歴の値を再生するため区間ごとの滞在時間はどの組み合わせでも同じ
+        print("Time in balance ranges (ratio index 0-4): "
+              + ', '.join(f"{count / total:.1%}" for count in snapshots))
+    for rank, result in enumerate(results[:limit], start=1):
+        print(f"{rank:>3}. updates={result.result.updates} fee_spread={_round(result.fee_spread)} "
+              f"{_format_parameters(result.parameters)}")
+
+
+def _format_value(value):
+    if isinstance(value, list):
+        return ','.join(f"{item:g}" for item in value)
+    return value
+
+
+def _format_parameters(parameters):
+    return ' '.join(f"{name}={_format_value(value)}" for name, value in parameters.items())
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
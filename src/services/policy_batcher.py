@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+
+# 適用モード
+APPLY_PER_CHANNEL = 'per_channel'
+APPLY_COALESCED = 'coalesced'
+# coalesced に加えて、全チャネル共通のポリシーを global 指定の1回の呼び出しで送る
+APPLY_GLOBAL = 'global'
+
+
+@dataclass(frozen=True)
+class PolicyBatch:
+    """
+    PolicyChange records that share an identical policy
+
+    LND's UpdateChannelPolicy takes either one chan_point or the global scope,
+    so a batch is sent as one global call only when it covers every channel
+    of the node; otherwise each channel still gets its own call. max_htlc_msat
+    depends on each channel's balance, so the global call leaves it unchanged.
+    """
+    new_local_fee: int
+    new_inbound_fee: int
+    changes: tuple
+    is_global: bool
+
+
+def coalesce_policy_changes(changes, node_channel_ids=None):
+    """
+    Group PolicyChange records by identical (fee_rate, inbound_fee)
+
+    base_fee_msat and time_lock_delta come from the configuration and are the
+    same for every channel. max_htlc_msat is not part of the key: it differs
+    per channel and is only sent with per-channel calls. Changes that would
+    not modify the fees are dropped.
+
+    Args:
+        changes: PolicyChange records
+        node_channel_ids: IDs of every channel of the node, to detect the global case
+                          (None disables the global scope)
+
+    Returns:
+        list: PolicyBatch records
+    """
+    groups = {}
+    for change in changes:
+        if change.new_local_fee == change.old_local_fee and change.new_inbound_fee == change.old_inbound_fee:
+            # 手数料が変わらない更新はゴシップを増やすだけなので送らない
+            continue
+        key = (change.new_local_fee, change.new_inbound_fee)
+        groups.setdefault(key, {})[change.channel_id] = change
+
+    node_channel_ids = None if node_channel_ids is None else set(node_channel_ids)
+    batches = []
+    for (new_local_fee, new_inbound_fee), group in groups.items():
+        is_global = node_channel_ids is not None and len(group) > 1 and set(group) == node_channel_ids
+        batches.append(PolicyBatch(
+            new_local_fee=new_local_fee,
+            new_inbound_fee=new_inbound_fee,
+            changes=tuple(group.values()),
+            is_global=is_global,
+        ))
+    return batches
+
+
+def count_update_calls(batches):
+    """Number of UpdateChannelPolicy calls needed to apply the batches"""
+    return sum(1 if batch.is_global else len(batch.changes) for batch in batches)
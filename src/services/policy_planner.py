@@ -0,0 +1,453 @@
+import csv
+import json
+import os
+from dataclasses import dataclass, asdict, fields
+from services.metrics import metrics
+from utils.profiling import profiler
+
+# 変更理由（判定の分岐）
+REASON_FIXED = 'fixed'
+REASON_INITIAL = 'initial'
+REASON_DECREASE = 'decrease'
+REASON_RATIO_CHANGE = 'ratio_change'
+
+
+@dataclass(frozen=True)
+class PolicyChange:
+    """
+    One planned channel policy update
+
+    channel_name, channel_id and channel_point match the Channel attributes,
+    so a PolicyChange can be passed to FeeCalculator.set_fee_api directly.
+    """
+    channel_id: str
+    channel_name: str
+    channel_point: str
+    old_local_fee: int
+    new_local_fee: int
+    old_inbound_fee: int
+    new_inbound_fee: int
+    local_balance: int
+    reason: str
+    ratio: float
+
+
+class PolicyPlanner:
+    def __init__(self, policy, data_analyzer, fixed_channels, control_channels):
+        """
+        Turn the channel set into a list of PolicyChange records without calling LND
+
+        Args:
+            policy: FeePolicy holding the fee parameters
+            data_analyzer: DataAnalyzer used for the regular mode checks
+            fixed_channels: Fixed channel list (channel_id -> fee)
+            control_channels: Control channel list (channel_id -> fee)
+        """
+        self.policy = policy
+        self.data_analyzer = data_analyzer
+        self.fixed_channels = fixed_channels
+        self.control_channels = control_channels
+
+    def _make_change(self, channel, old_local_fee, new_local_fee, old_inbound_fee, new_inbound_fee,
+                     local_balance, reason):
+        profiler.count(f"planned.{reason}")
+        metrics.inc('fee_manager_decisions_total', reason=reason)
+        return PolicyChange(
+            channel_id=channel.channel_id,
+            channel_name=channel.channel_name,
+            channel_point=channel.channel_point,
+            old_local_fee=old_local_fee,
+            new_local_fee=new_local_fee,
+            old_inbound_fee=old_inbound_fee,
+            new_inbound_fee=new_inbound_fee,
+            local_balance=local_balance,
+            reason=reason,
+            ratio=local_balance / channel.capacity,
+        )
+
+    def _plan_fixed(self, channel, local_balance, local_fee, local_infee):
+        inboundFee_base = self.policy.inboundFee_base
+
+        # Set fixed fee for this channel
+        fixed_fee = self.policy.calculate_fixed_fee(self.fixed_channels[channel.channel_id])
+
+        if fixed_fee == local_fee and inboundFee_base == local_infee:
+            # Skip if fees are already set
+            _record_skip('unchanged')
+            return None
+
+        print(f"Set fixed fee={fixed_fee} & inbound fee={inboundFee_base} for channel {channel.channel_name}")
+        return self._make_change(channel, local_fee, fixed_fee, local_infee, inboundFee_base,
+                                 local_balance, REASON_FIXED)
+
+    def plan_channel_initial_mode(self, channel, channel_data):
+        """Plan the policy of a channel in initial setup mode"""
+        if len(channel_data) == 0:
+            print(f"No data available for channel {channel.channel_id}")
+            _record_skip('no_data')
+            return None
+
+        latest_data = channel_data[-1]
+
+        if latest_data.active == 0:
+            # Skip inactive channels
+            _record_skip('inactive')
+            return None
+
+        if channel.channel_id in self.fixed_channels:
+            return self._plan_fixed(channel, latest_data.local_balance, latest_data.local_fee,
+                                    latest_data.local_infee)
+
+        if channel.channel_id in self.control_channels:
+            if latest_data.amboss_fee is None:
+                print(f"No amboss fee available for channel {channel.channel_name}")
+                _record_skip('no_amboss_fee')
+                return None
+
+            local_balance_ratio = latest_data.local_balance / channel.capacity
+
+            # Calculate ratio index (0-4)
+            ratio_index = self.policy.get_ratio_index(local_balance_ratio)
+
+            # Set inbound fee and local fee based on amboss fee and ratio
+            inbound_fee = self.policy.calculate_inbound_fee(latest_data.amboss_fee, ratio_index)
+            local_fee = self.policy.calculate_local_fee(latest_data.amboss_fee, ratio_index)
+
+            if local_fee == latest_data.local_fee and inbound_fee == latest_data.local_infee:
+                # Skip if fees are already set
+                _record_skip('unchanged')
+                return None
+
+            print(f"Set initial local fee {local_fee} and inbound fee {inbound_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+            return self._make_change(channel, latest_data.local_fee, local_fee, latest_data.local_infee,
+                                     inbound_fee, latest_data.local_balance, REASON_INITIAL)
+
+        _record_skip('not_listed')
+        return None
+
+    def plan_channel_regular_mode(self, channel, channel_data):
+        """Plan the policy of a channel in regular analysis mode"""
+        if len(channel_data) == 0:
+            print(f"No data available for channel {channel.channel_id}")
+            _record_skip('no_data')
+            return None
+
+        latest_data = channel_data[-1]
+
+        if latest_data.active == 0:
+            # Skip inactive channels
+            _record_skip('inactive')
+            return None
+
+        if channel.channel_id in self.fixed_channels:
+            return self._plan_fixed(channel, latest_data.local_balance, latest_data.local_fee,
+                                    latest_data.local_infee)
+
+        if channel.channel_id in self.control_channels:
+
+            if len(channel_data) < self.policy.data_period:
+                # insufficient data
+                _record_skip('insufficient_data')
+                return None
+
+            local_balance_ratio = latest_data.local_balance / channel.capacity
+            within_tolerance = self.data_analyzer.is_within_tolerance(channel_data, channel.capacity)
+            within_tolerance_1 = self.data_analyzer.is_within_tolerance_1(channel_data, channel.capacity)
+            same_localfee = self.data_analyzer.is_same_localfee(channel_data, channel.capacity)
+
+            # Regular mode: analyze data and adjust fees
+            if local_balance_ratio >= self.policy.fee_decreasing_threshold and within_tolerance and same_localfee:
+                new_local_fee = self.policy.calculate_decreased_fee(latest_data.local_fee)
+
+                print(f"Decreasing local fee {latest_data.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, latest_data.local_fee, new_local_fee, latest_data.local_infee,
+                                         latest_data.local_infee, latest_data.local_balance, REASON_DECREASE)
+
+            if not within_tolerance_1:
+                if latest_data.amboss_fee is None:
+                    print(f"No amboss fee available for channel {channel.channel_name}")
+                    _record_skip('no_amboss_fee')
+                    return None
+
+                ratio_index = self.policy.get_ratio_index(local_balance_ratio)
+
+                # Set inbound fee and local fee based on amboss fee and ratio
+                new_inbound_fee = self.policy.calculate_inbound_fee(latest_data.amboss_fee, ratio_index)
+                new_local_fee = self.policy.calculate_local_fee(latest_data.amboss_fee, ratio_index)
+
+                print(f"Ratio changed: local fee {latest_data.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, latest_data.local_fee, new_local_fee, latest_data.local_infee,
+                                         new_inbound_fee, latest_data.local_balance, REASON_RATIO_CHANGE)
+
+            _record_skip('within_tolerance')
+            return None
+
+        _record_skip('not_listed')
+        return None
+
+    def plan_channel_bucket_change(self, channel, latest_data):
+        """
+        Plan the policy of a channel whose balance moved to another range
+
+        Used by the event stream mode: the fees for the new range are derived
+        from the amboss fee as in the ratio change branch of the regular mode,
+        without waiting for data_period snapshots.
+
+        Args:
+            channel: Channel
+            latest_data: ChannelData with the live balance and policy
+        """
+        if latest_data.active == 0:
+            _record_skip('inactive')
+            return None
+
+        if channel.channel_id in self.fixed_channels:
+            return self._plan_fixed(channel, latest_data.local_balance, latest_data.local_fee,
+                                    latest_data.local_infee)
+
+        if channel.channel_id in self.control_channels:
+            if latest_data.amboss_fee is None:
+                print(f"No amboss fee available for channel {channel.channel_name}")
+                _record_skip('no_amboss_fee')
+                return None
+
+            local_balance_ratio = latest_data.local_balance / channel.capacity
+            ratio_index = self.policy.get_ratio_index(local_balance_ratio)
+            new_inbound_fee = self.policy.calculate_inbound_fee(latest_data.amboss_fee, ratio_index)
+            new_local_fee = self.policy.calculate_local_fee(latest_data.amboss_fee, ratio_index)
+
+            if new_local_fee == latest_data.local_fee and new_inbound_fee == latest_data.local_infee:
+                _record_skip('unchanged')
+                return None
+
+            print(f"Balance range changed: local fee {latest_data.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+            return self._make_change(channel, latest_data.local_fee, new_local_fee, latest_data.local_infee,
+                                     new_inbound_fee, latest_data.local_balance, REASON_RATIO_CHANGE)
+
+        _record_skip('not_listed')
+        return None
+
+    def plan_channel_regular_mode_vectorized(self, channel, analysis):
+        """
+        Plan the policy of a channel in regular analysis mode using the
+        precomputed row of VectorizedFeeEngine.evaluate()
+        """
+        if analysis is None:
+            print(f"No data available for channel {channel.channel_id}")
+            _record_skip('no_data')
+            return None
+
+        if not analysis.active:
+            _record_skip('inactive')
+            return None
+
+        local_balance = _to_number(analysis.local_balance)
+        local_fee = _to_int(analysis.local_fee)
+        local_infee = _to_int(analysis.local_infee)
+
+        if channel.channel_id in self.fixed_channels:
+            return self._plan_fixed(channel, local_balance, local_fee, local_infee)
+
+        if channel.channel_id in self.control_channels:
+
+            if analysis.n_rows < self.policy.data_period:
+                _record_skip('insufficient_data')
+                return None
+
+            local_balance_ratio = analysis.local_balance_ratio
+
+            if analysis.decrease:
+                new_local_fee = int(analysis.decreased_local_fee)
+                print(f"Decreasing local fee {local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, local_fee, new_local_fee, local_infee, local_infee,
+                                         local_balance, REASON_DECREASE)
+
+            if not analysis.within_tolerance_1:
+                if not analysis.has_amboss_fee:
+                    print(f"No amboss fee available for channel {channel.channel_name}")
+                    _record_skip('no_amboss_fee')
+                    return None
+
+                new_local_fee = int(analysis.new_local_fee)
+                print(f"Ratio changed: local fee {local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, local_fee, new_local_fee, local_infee,
+                                         int(analysis.new_inbound_fee), local_balance, REASON_RATIO_CHANGE)
+
+            _record_skip('within_tolerance')
+            return None
+
+        _record_skip('not_listed')
+        return None
+
+    def plan_channel_regular_mode_summary(self, channel, summary):
+        """
+        Plan the policy of a channel in regular analysis mode from its
+        ChannelSummary (O(1) regardless of data_period)
+        """
+        if summary is None or summary.row_count == 0:
+            print(f"No data available for channel {channel.channel_id}")
+            _record_skip('no_data')
+            return None
+
+        if not summary.active:
+            _record_skip('inactive')
+            return None
+
+        if channel.channel_id in self.fixed_channels:
+            return self._plan_fixed(channel, summary.local_balance, summary.local_fee, summary.local_infee)
+
+        if channel.channel_id in self.control_channels:
+
+            data_period = self.policy.data_period
+            if summary.window_size(data_period) < data_period:
+                _record_skip('insufficient_data')
+                return None
+
+            local_balance_ratio = summary.local_balance / channel.capacity
+
+            if (local_balance_ratio >= self.policy.fee_decreasing_threshold
+                    and summary.is_within_tolerance(data_period) and summary.is_same_localfee(data_period)):
+                new_local_fee = self.policy.calculate_decreased_fee(summary.local_fee)
+                print(f"Decreasing local fee {summary.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, summary.local_fee, new_local_fee, summary.local_infee,
+                                         summary.local_infee, summary.local_balance, REASON_DECREASE)
+
+            if not summary.is_within_tolerance_1(data_period):
+                if summary.amboss_fee is None:
+                    print(f"No amboss fee available for channel {channel.channel_name}")
+                    _record_skip('no_amboss_fee')
+                    return None
+
+                ratio_index = self.policy.get_ratio_index(local_balance_ratio)
+                new_inbound_fee = self.policy.calculate_inbound_fee(summary.amboss_fee, ratio_index)
+                new_local_fee = self.policy.calculate_local_fee(summary.amboss_fee, ratio_index)
+                print(f"Ratio changed: local fee {summary.local_fee} --> {new_local_fee} for channel {channel.channel_name} (ratio: {local_balance_ratio:.2f})")
+                return self._make_change(channel, summary.local_fee, new_local_fee, summary.local_infee,
+                                         new_inbound_fee, summary.local_balance, REASON_RATIO_CHANGE)
+
+            _record_skip('within_tolerance')
+            return None
+
+        _record_skip('not_listed')
+        return None
+
+    def plan(self, channels, channel_data_map, initial):
+        """
+        Plan the policy changes for all channels
+
+        Args:
+            channels: List of Channel objects
+            channel_data_map: Dictionary with channel IDs as keys and histories as values
+            initial: True for initial setup mode, False for regular analysis
+
+        Returns:
+            tuple: PolicyChange records, at most one per channel
+        """
+        plan_channel = self.plan_channel_initial_mode if initial else self.plan_channel_regular_mode
+        changes = {}
+        for channel in channels:
+            channel_data = channel_data_map.get(channel.channel_id, [])
+            if metrics.enabled and len(channel_data) > 0:
+                latest_data = channel_data[-1]
+                _record_channel_state(channel, latest_data.local_fee, latest_data.local_infee,
+                                      latest_data.local_balance)
+            change = plan_channel(channel, channel_data)
+            if change is not None:
+                changes[change.channel_id] = change
+        return tuple(changes.values())
+
+    def plan_vectorized(self, channels, analysis_map):
+        """
+        Plan the regular mode policy changes from VectorizedFeeEngine results
+
+        Args:
+            channels: List of Channel objects
+            analysis_map: Dictionary with channel IDs as keys and evaluate() rows as values
+
+        Returns:
+            tuple: PolicyChange records, at most one per channel
+        """
+        changes = {}
+        for channel in channels:
+            analysis = analysis_map.get(channel.channel_id)
+            if metrics.enabled and analysis is not None:
+                _record_channel_state(channel, _to_int(analysis.local_fee), _to_int(analysis.local_infee),
+                                      analysis.local_balance)
+            change = self.plan_channel_regular_mode_vectorized(channel, analysis)
+            if change is not None:
+                changes[change.channel_id] = change
+        return tuple(changes.values())
+
+    def plan_summary(self, channels, summary_map):
+        """
+        Plan the regular mode policy changes from ChannelSummaryStore summaries
+
+        Args:
+            channels: List of Channel objects
+            summary_map: Dictionary with channel IDs as keys and ChannelSummary as values
+
+        Returns:
+            tuple: PolicyChange records, at most one per channel
+        """
+        changes = {}
+        for channel in channels:
+            summary = summary_map.get(channel.channel_id)
+            if metrics.enabled and summary is not None:
+                _record_channel_state(channel, summary.local_fee, summary.local_infee, summary.local_balance)
+            change = self.plan_channel_regular_mode_summary(channel, summary)
+            if change is not None:
+                changes[change.channel_id] = change
+        return tuple(changes.values())
+
+def _record_skip(reason):
+    profiler.count(f"skipped.{reason}")
+    metrics.inc('fee_manager_skipped_total', reason=reason)
+
+
+def _record_channel_state(channel, local_fee, local_infee, local_balance):
+    # 適用前の現在値（更新に成功したら FeeUpdateExecutor が新しい手数料で上書きする）
+    labels = {'channel_id': channel.channel_id, 'channel_name': channel.channel_name}
+    if local_fee is not None:
+        metrics.set('fee_manager_channel_local_fee_ppm', local_fee, **labels)
+    if local_infee is not None:
+        metrics.set('fee_manager_channel_inbound_fee_ppm', local_infee, **labels)
+    if local_balance is not None and channel.capacity:
+        metrics.set('fee_manager_channel_local_balance_ratio', local_balance / channel.capacity, **labels)
+
+
+def _to_int(value):
+    # pandas の欠損値 (NaN) は None に戻す
+    return None if value != value else int(value)
+
+
+def _to_number(value):
+    # 端数のない値は int に、端数のある REAL 値はそのまま float で返す
+    if value != value:
+        return None
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def export_plan(changes, output_file):
+    """
+    Write the planned policy changes to a JSON or CSV file (by extension)
+
+    Args:
+        changes: PolicyChange records
+        output_file: Output path ending with .json or .csv
+    """
+    directory = os.path.dirname(output_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if output_file.lower().endswith('.csv'):
+        with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow([field.name for field in fields(PolicyChange)])
+            for change in changes:
+                writer.writerow([getattr(change, field.name) for field in fields(PolicyChange)])
+    else:
+        with open(output_file, mode='w', encoding='utf-8') as file:
+            json.dump([asdict(change) for change in changes], file, ensure_ascii=False, indent=2)
+
+    print(f"Wrote {len(changes)} planned policy changes to {output_file}")
@@ -0,0 +1,85 @@
+from datetime import datetime
+from services.live_state import is_live_noop
+from services.metrics import metrics
+from services.policy_planner import PolicyChange
+from utils.profiling import profiler
+
+REASON_RESTORE = 'restore'
+
+
+def parse_restore_time(value):
+    """
+    Normalize a --restore argument to the channel_datas date format
+
+    Args:
+        value: 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]' or ISO 8601 with 'T'
+
+    Returns:
+        str: 'YYYY-MM-DD HH:MM:SS'
+
+    Raises:
+        ValueError: If the value is not a valid date
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"--restore: invalid timestamp '{value}' (expected YYYY-MM-DD[ HH:MM:SS])")
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def plan_restore(channels, snapshots, live_states, basefee_msat):
+    """
+    Plan the updates that bring LND back to the fees of stored snapshots
+
+    Only channels whose live policy differs from the snapshot (local fee,
+    inbound fee or base fee) get a PolicyChange. max_htlc_msat is derived
+    from the live balance.
+
+    Args:
+        channels: List of Channel objects
+        snapshots: Result of Database.get_channel_data_as_of()
+        live_states: Result of fetch_live_state()
+        basefee_msat: Base fee the updates would send
+
+    Returns:
+        tuple: PolicyChange records
+    """
+    changes = []
+    skipped = {'no_snapshot': 0, 'not_in_lnd': 0, 'unchanged': 0}
+    for channel in channels:
+        snapshot = snapshots.get(channel.channel_id)
+        if snapshot is None or snapshot.local_fee is None or snapshot.local_infee is None:
+            skipped['no_snapshot'] += 1
+            continue
+        state = live_states.get(channel.channel_point)
+        if state is None:
+            # 閉じられたチャネルなど
+            skipped['not_in_lnd'] += 1
+            continue
+
+        change = PolicyChange(
+            channel_id=channel.channel_id,
+            channel_name=channel.channel_name,
+            channel_point=channel.channel_point,
+            old_local_fee=state.fee_per_mil,
+            new_local_fee=snapshot.local_fee,
+            old_inbound_fee=state.inbound_fee_per_mil,
+            new_inbound_fee=snapshot.local_infee,
+            local_balance=state.local_balance,
+            reason=REASON_RESTORE,
+            ratio=state.local_balance / channel.capacity if channel.capacity else 0.0,
+        )
+        if is_live_noop(change, state, basefee_msat):
+            skipped['unchanged'] += 1
+            continue
+        changes.append(change)
+
+    profiler.count(f"planned.{REASON_RESTORE}", len(changes))
+    metrics.inc('fee_manager_decisions_total', len(changes), reason=REASON_RESTORE)
+    for reason, count in skipped.items():
+        if count:
+            profiler.count(f"skipped.{reason}", count)
+            metrics.inc('fee_manager_skipped_total', count, reason=reason)
+    print(f"Restore: {len(changes)} channels differ from LND, {skipped['unchanged']} already match, "
+          f"{skipped['no_snapshot']} without a snapshot, {skipped['not_in_lnd']} not open in LND")
+    return tuple(changes)
@@ -0,0 +1,156 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from services.metrics import metrics
+
+
+class FeeUpdateResult:
+    def __init__(self, channel, success, error=None, local_balance=None, dry_run=False):
+        self.channel = channel
+        self.success = success
+        self.error = error
+        # max_htlc_msat の計算に使ったローカル残高（max_htlc_msat を送らない global 指定では None）
+        self.local_balance = local_balance
+        # Debug_mode で LND へ送信しなかった更新
+        self.dry_run = dry_run
+
+    @classmethod
+    def from_status(cls, channel, status, local_balance=None):
+        """
+        Build a result from the return value of set_fee_api / set_global_fee_api
+
+        Args:
+            channel: Channel or PolicyChange
+            status: PolicySendResult (or a plain bool)
+            local_balance: Local balance used to derive max_htlc_msat
+        """
+        return cls(channel, bool(status), getattr(status, 'error', None), local_balance,
+                   getattr(status, 'dry_run', False))
+
+    def __repr__(self):
+        return (f"FeeUpdateResult(channel_id='{self.channel.channel_id}', success={self.success}, "
+                f"dry_run={self.dry_run}, error={self.error!r})")
+
+
+class FeeUpdateExecutor:
+    def __init__(self, fee_calculator, max_workers=None):
+        """
+        Run fee updates concurrently on a bounded worker pool
+
+        Args:
+            fee_calculator: FeeCalculator whose pooled session sends the requests
+            max_workers: Maximum number of concurrent requests (default: fee_calculator.max_workers)
+        """
+        self.fee_calculator = fee_calculator
+        self.max_workers = max_workers or fee_calculator.max_workers
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fee-update')
+        self.futures = []
+        self.results = []
+
+    def submit(self, channel, fee, infee, local_balance=None):
+        """
+        Queue a fee update for a channel
+
+        Args:
+            channel: Channel object
+            fee: Local fee rate (ppm)
+            infee: Inbound fee rate (ppm)
+            local_balance: Local balance used to derive max_htlc_msat
+        """
+        # 呼び出し元のノード名（node_scope）をワーカースレッドへ引き継ぐ
+        future = self.pool.submit(contextvars.copy_context().run, self._run, channel, fee, infee, local_balance)
+        self.futures.append(future)
+        return future
+
+    def submit_change(self, change):
+        """
+        Queue the update described by a PolicyChange record
+
+        Args:
+            change: PolicyChange (carries the channel attributes set_fee_api needs)
+        """
+        return self.submit(change, change.new_local_fee, change.new_inbound_fee, change.local_balance)
+
+    def submit_batch(self, batch):
+        """
+        Queue the updates of a PolicyBatch (one global call or one call per channel)
+
+        Args:
+            batch: PolicyBatch
+        """
+        if not batch.is_global:
+            return [self.submit_change(change) for change in batch.changes]
+
+        future = self.pool.submit(contextvars.copy_context().run, self._run_global, batch)
+        self.futures.append(future)
+        return [future]
+
+    def _run_global(self, batch):
+        try:
+            success = self.fee_calculator.set_global_fee_api(
+                batch.new_local_fee, batch.new_inbound_fee, len(batch.changes)
+            )
+            if success:
+                for change in batch.changes:
+                    _record_fees(change, batch.new_local_fee, batch.new_inbound_fee)
+            return [FeeUpdateResult.from_status(change, success) for change in batch.changes]
+        except Exception as e:
+            print(f"Error setting global fee: {e}")
+            return [FeeUpdateResult(change, False, str(e)) for change in batch.changes]
+
+    def _run(self, channel, fee, infee, local_balance):
+        try:
+            success = self.fee_calculator.set_fee_api(channel, fee, infee, local_balance)
+            if success:
+                _record_fees(channel, fee, infee)
+            return FeeUpdateResult.from_status(channel, success, local_balance)
+        except Exception as e:
+            print(f"Error setting fee for channel {channel.channel_name} ({channel.channel_id}): {e}")
+            return FeeUpdateResult(channel, False, str(e), local_balance)
+
+    def wait(self):
+        """
+        Wait for all queued updates to finish
+
+        Returns:
+            list: FeeUpdateResult for every update submitted since the last wait()
+        """
+        futures, self.futures = self.futures, []
+        results = []
+        for future in futures:
+            result = future.result()
+            # global 指定の呼び出しは対象チャネル分の結果をまとめて返す
+            if isinstance(result, list):
+                results.extend(result)
+            else:
+                results.append(result)
+        self.results.extend(results)
+        return results
+
+    def success_count(self):
+        return sum(1 for result in self.results if result.success and not result.dry_run)
+
+    def failure_count(self):
+        return sum(1 for result in self.results if not result.success)
+
+    def dry_run_count(self):
+        return sum(1 for result in self.results if result.dry_run)
+
+    def print_summary(self):
+        summary = f"Fee updates: {self.success_count()} succeeded, {self.failure_count()} failed"
+        if self.dry_run_count():
+            summary += f", {self.dry_run_count()} not sent (Debug_mode)"
+        print(summary)
+
+    def shutdown(self):
+        """Wait for pending updates and stop the worker pool"""
+        self.wait()
+        self.pool.shutdown(wait=True)
+
+
+def _record_fees(channel, fee, infee):
+    # 更新に成功したチャネルの現在の手数料を公開する
+    if not metrics.enabled:
+        return
+    labels = {'channel_id': channel.channel_id, 'channel_name': channel.channel_name}
+    metrics.set('fee_manager_channel_local_fee_ppm', fee, **labels)
+    metrics.set('fee_manager_channel_inbound_fee_ppm', infee, **labels)
@@ -0,0 +1,189 @@
+import heapq
+import time
+from db.update_state_store import UpdateStateStore
+from services.metrics import metrics
+from utils.profiling import profiler
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_rate, tokens=None, updated_at=0.0):
+        """
+        Token bucket limiting the number of updates per time window
+
+        Args:
+            capacity: Maximum number of tokens (burst size)
+            refill_rate: Tokens added per second
+            tokens: Current tokens (default: full)
+            updated_at: Time the tokens were last refilled
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity if tokens is None else min(tokens, capacity)
+        self.updated_at = updated_at
+
+    def refill(self, now):
+        """Add the tokens accumulated since the last refill"""
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+            self.updated_at = now
+
+    def take(self, now, count=1):
+        """
+        Take tokens if enough are available
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        self.refill(now)
+        if self.tokens < count:
+            return False
+        self.tokens -= count
+        return True
+
+
+def fee_distance(change):
+    """How far a channel's current fees are from the planned ones (ppm)"""
+    return (abs(change.new_local_fee - (change.old_local_fee or 0))
+            + abs(change.new_inbound_fee - (change.old_inbound_fee or 0)))
+
+
+class UpdateScheduler:
+    def __init__(self, store, min_interval=0.0, budget=0, window=3600.0, clock=time.time):
+        """
+        Decide which planned policy changes are sent in this run
+
+        A channel updated less than min_interval seconds ago is deferred.
+        The remaining changes are taken from a priority queue, largest
+        fee_distance() first, as long as the token bucket (budget updates per
+        window seconds) has tokens; the rest are deferred. Deferred channels
+        are planned again in the next run.
+
+        Args:
+            store: UpdateStateStore holding the last updates and the bucket
+            min_interval: Minimum time between two updates of a channel (seconds, 0 = no cooldown)
+            budget: Updates allowed per window (0 = unlimited)
+            window: Budget window (seconds)
+            clock: Wall clock (overridable for tests)
+        """
+        self.store = store
+        self.min_interval = min_interval
+        self.budget = budget
+        self.window = window
+        self.clock = clock
+
+    def _load_bucket(self, now):
+        bucket = TokenBucket(self.budget, self.budget / self.window, updated_at=now)
+        stored = self.store.load_budget()
+        if stored is not None:
+            bucket.tokens = min(stored[0], bucket.capacity)
+            bucket.updated_at = stored[1]
+        return bucket
+
+    def schedule(self, changes, dry_run=False, coalesce=None):
+        """
+        Split the planned changes into the ones to send now and the deferred ones
+
+        One token is charged per UpdateChannelPolicy call: with coalesce, the
+        changes of a global batch share one token and changes that would not
+        modify the fees are dropped without being charged.
+
+        Args:
+            changes: PolicyChange records
+            dry_run: True if the changes will not be sent (Debug_mode); the
+                     budget is then not spent
+            coalesce: Optional function grouping changes into PolicyBatch records
+                      the way they will be applied (apply_mode coalesced / global)
+
+        Returns:
+            tuple: (changes to send, deferred changes); with a budget the changes
+                   to send are ordered by priority
+        """
+        now = self.clock()
+        ready = []
+        deferred = []
+
+        if coalesce is not None:
+            # 送られない更新（手数料が変わらないもの）は先送りも課金もしない
+            changes = [change for batch in coalesce(changes) for change in batch.changes]
+
+        if self.min_interval > 0:
+            last_updates = self.store.load_last_updates(change.channel_id for change in changes)
+            for change in changes:
+                last_update = last_updates.get(change.channel_id)
+                if last_update is not None and now - last_update < self.min_interval:
+                    deferred.append(change)
+                else:
+                    ready.append(change)
+            _record_deferred('cooldown', len(deferred))
+        else:
+            ready = list(changes)
+
+        if self.budget <= 0:
+            return tuple(ready), tuple(deferred)
+
+        # 1回の呼び出しで送られる変更をまとめて1トークンとして扱う
+        if coalesce is None:
+            calls = [(change,) for change in ready]
+        else:
+            calls = []
+            for batch in coalesce(ready):
+                if batch.is_global:
+                    calls.append(batch.changes)
+                else:
+                    calls.extend((change,) for change in batch.changes)
+
+        # 手数料が目標から遠いチャネルほど優先する（同順位は計画順）
+        queue = [(-max(fee_distance(change) for change in call), index, call) for index, call in enumerate(calls)]
+        heapq.heapify(queue)
+        bucket = self._load_bucket(now)
+        selected = []
+        while queue and bucket.take(now):
+            selected.extend(heapq.heappop(queue)[2])
+        if not dry_run:
+            self.store.save_budget(bucket.tokens, bucket.updated_at)
+
+        over_budget = [change for _, _, call in sorted(queue) for change in call]
+        _record_deferred('budget', len(over_budget))
+        return tuple(selected), tuple(deferred + over_budget)
+
+    def record(self, results):
+        """
+        Start the cooldown of the channels whose update succeeded
+
+        Dry runs (Debug_mode) did not reach LND and start no cooldown.
+
+        Args:
+            results: FeeUpdateResult records of the run
+        """
+        now = self.clock()
+        self.store.save_last_updates({
+            result.channel.channel_id: now for result in results
+            if result.success and not getattr(result, 'dry_run', False)
+        })
+
+
+def _record_deferred(reason, count):
+    if not count:
+        return
+    profiler.count(f"deferred.{reason}", count)
+    metrics.inc('fee_manager_deferred_total', count, reason=reason)
+    label = 'in their cooldown' if reason == 'cooldown' else 'over the update budget'
+    print(f"Deferring {count} updates {label}...")
+
+
+def create_update_scheduler(conn, config):
+    """
+    Build the UpdateScheduler configured in [scheduler]
+
+    Args:
+        conn: Read-write sqlite3 connection
+        config: ConfigLoader
+
+    Returns:
+        UpdateScheduler: Scheduler, or None if neither a cooldown nor a budget is configured
+    """
+    min_interval = config.get_scheduler_min_interval()
+    budget = config.get_scheduler_budget()
+    if min_interval <= 0 and budget <= 0:
+        return None
+    return UpdateScheduler(UpdateStateStore(conn), min_interval, budget, config.get_scheduler_window())
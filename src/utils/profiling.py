@@ -0,0 +1,230 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# ヒストグラムのバケット上限（ミリ秒）
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 複数ノードを並列に処理する場合の処理中のノード名（ワーカースレッドへは contextvars で引き継ぐ）
+current_node = contextvars.ContextVar('current_node', default=None)
+
+
+@contextmanager
+def node_scope(node_name):
+    """
+    Tag the profiler spans and the metrics recorded in this context with a node
+
+    Args:
+        node_name: Node name (from [node:NAME])
+    """
+    token = current_node.set(node_name)
+    try:
+        yield
+    finally:
+        current_node.reset(token)
+
+
+class _NullContext:
+    # 無効時に返す何もしないコンテキスト（毎回の生成を避けるため共有する）
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Process-wide stage timers, counters and latency histograms
+
+        Everything is a no-op until enable() is called, so the instrumentation
+        can stay in the hot paths. Recording is thread-safe because the HTTP
+        calls run on the FeeUpdateExecutor worker pool. Values recorded inside
+        node_scope() are also kept per node.
+        """
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.spans = {}
+        self.counters = {}
+        self.samples = {}
+        self.nodes = {}
+        self.started_at = None
+
+    def enable(self):
+        self.reset()
+        self.started_at = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        """
+        Time a stage of the run (accumulated per name)
+
+        Args:
+            name: Stage name (e.g. 'plan')
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed('spans', name)
+
+    def timer(self, name):
+        """
+        Time one call and record it in the latency histogram of the name
+
+        Args:
+            name: Histogram name (e.g. 'sql.get_channels', 'http.chanpolicy')
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed('samples', name)
+
+    def timed(self, name):
+        """
+        Decorator form of timer() for functions and methods
+
+        Args:
+            name: Histogram name
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._timed('samples', name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def _timed(self, kind, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._append(kind, name, time.perf_counter() - start)
+
+    def _append(self, kind, name, seconds):
+        node = current_node.get()
+        with self._lock:
+            getattr(self, kind).setdefault(name, []).append(seconds)
+            if node is not None:
+                self._node(node)[kind].setdefault(name, []).append(seconds)
+
+    def _node(self, node):
+        data = self.nodes.get(node)
+        if data is None:
+            data = self.nodes[node] = {'spans': {}, 'counters': {}, 'samples': {}}
+        return data
+
+    def count(self, name, value=1):
+        """
+        Increment a counter
+
+        Args:
+            name: Counter name (e.g. 'skipped.inactive')
+            value: Amount to add
+        """
+        if not self.enabled:
+            return
+        node = current_node.get()
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if node is not None:
+                counters = self._node(node)['counters']
+                counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Record a latency measured elsewhere in the histogram of the name"""
+        if not self.enabled:
+            return
+        self._append('samples', name, seconds)
+
+    def report(self):
+        """
+        Build the timing report
+
+        Returns:
+            dict: Spans, counters and histograms (times in milliseconds), and
+                  the same per node under 'nodes' for multi-node runs
+        """
+        with self._lock:
+            report = _summarize_all(self.spans, self.counters, self.samples)
+            nodes = {node: _summarize_all(data['spans'], data['counters'], data['samples'])
+                     for node, data in self.nodes.items()}
+
+        wall_time = None if self.started_at is None else time.perf_counter() - self.started_at
+        report = {'wall_time_ms': None if wall_time is None else wall_time * 1000, **report}
+        if nodes:
+            report['nodes'] = nodes
+        return report
+
+    def write_report(self, output_file):
+        """
+        Write the timing report to a JSON file
+
+        Args:
+            output_file: Output path
+        """
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output_file, mode='w', encoding='utf-8') as file:
+            json.dump(self.report(), file, ensure_ascii=False, indent=2)
+        print(f"Wrote profile report to {output_file}")
+
+
+def _summarize_all(spans, counters, samples):
+    return {
+        'spans': {name: _summarize(values) for name, values in spans.items()},
+        'counters': dict(counters),
+        'histograms': {name: _summarize(values, histogram=True) for name, values in samples.items()},
+    }
+
+
+def _percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _summarize(values, histogram=False):
+    values_ms = sorted(value * 1000 for value in values)
+    summary = {
+        'count': len(values_ms),
+        'total_ms': sum(values_ms),
+        'min_ms': values_ms[0],
+        'max_ms': values_ms[-1],
+        'mean_ms': sum(values_ms) / len(values_ms),
+    }
+    if histogram:
+        summary['p50_ms'] = _percentile(values_ms, 0.50)
+        summary['p95_ms'] = _percentile(values_ms, 0.95)
+        summary['p99_ms'] = _percentile(values_ms, 0.99)
+        # 累積バケット（Prometheus と同じく le 以下の件数）
+        buckets = {}
+        index = 0
+        for bound in HISTOGRAM_BUCKETS_MS:
+            while index < len(values_ms) and values_ms[index] <= bound:
+                index += 1
+            buckets[str(bound)] = index
+        buckets['+Inf'] = len(values_ms)
+        summary['buckets'] = buckets
+    return summary
+
+
+# アプリケーション全体で共有するインスタンス
+profiler = Profiler()
@@ -0,0 +1,133 @@
+import contextlib
+import csv
+import gzip
+import io
+import os
+import random
+import tempfile
+import unittest
+from collections import deque
+from db.database import Database
+from models.channel import Channel
+from models.channel_data import ChannelData
+from services.backtest import Backtester, TRAJECTORY_COLUMNS, run_backtest
+from services.data_analyzer import DataAnalyzer
+from services.fee_policy import FeePolicy, parse_policy_overrides
+from services.policy_planner import PolicyPlanner
+
+CAPACITY = 1000000
+
+
+class TestBacktest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=4,
+        )
+        rng = random.Random(3)
+        self.channels = {
+            f'chan_{i}': Channel(id=i, channel_name=f'chan_{i}', channel_id=f'chan_{i}',
+                                 channel_point=f'chan_{i}:0', capacity=CAPACITY)
+            for i in range(8)
+        }
+        self.fixed_channels = {'chan_0': 300}
+        self.control_channels = {f'chan_{i}': 0 for i in range(1, 7)}
+
+        # 残高はゆっくり動くランダムウォーク（一部のチャネルは途中から記録が始まる）
+        self.rows = []
+        balances = {channel_id: rng.randrange(CAPACITY) for channel_id in self.channels}
+        for hour in range(60):
+            for channel_id in self.channels:
+                if channel_id == 'chan_5' and hour < 20:
+                    continue
+                balances[channel_id] = min(max(balances[channel_id] + rng.randint(-80000, 80000), 0), CAPACITY)
+                self.rows.append((channel_id, f'2024-01-{1 + hour // 24:02d} {hour % 24:02d}:00:00',
+                                  balances[channel_id], 1500, -1000, rng.choice([600, 800, None]),
+                                  0 if rng.random() < 0.05 else 1))
+
+    def _reference(self, policy):
+        # data_period 行の deque を窓にして従来のチャネルごとの判定を呼ぶ実装
+        planner = PolicyPlanner(policy, DataAnalyzer(db_connection=None, config=None),
+                                self.fixed_channels, self.control_channels)
+        windows, fees, trajectory = {}, {}, []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for channel_id, date, balance, local_fee, local_infee, amboss_fee, active in self.rows:
+                channel = self.channels[channel_id]
+                if channel_id not in windows:
+                    windows[channel_id] = deque(maxlen=policy.data_period)
+                    fees[channel_id] = (local_fee, local_infee)
+                    plan_channel = planner.plan_channel_initial_mode
+                else:
+                    plan_channel = planner.plan_channel_regular_mode
+                windows[channel_id].append(ChannelData(channel_id, date, balance, fees[channel_id][0],
+                                                       fees[channel_id][1], 0, 0, 0, 0, amboss_fee, active))
+                change = plan_channel(channel, list(windows[channel_id]))
+                if change is not None:
+                    fees[channel_id] = (change.new_local_fee, change.new_inbound_fee)
+                trajectory.append((date, channel_id) + fees[channel_id] + ('' if change is None else change.reason,))
+        return trajectory
+
+    def _run(self, policy):
+        output = io.StringIO()
+        result = Backtester(policy, self.fixed_channels, self.control_channels).run(
+            self.channels, iter(self.rows), csv.writer(output))
+        rows = list(csv.reader(io.StringIO(output.getvalue())))
+        trajectory = [(row[0], row[1], int(row[5]), int(row[6]), row[7]) for row in rows]
+        return result, trajectory
+
+    def test_replay_matches_per_object_decisions(self):
+        for policy in (self.policy, self.policy.replace(decay_factor=0.5, fee_decreasing_threshold=0.2)):
+            result, trajectory = self._run(policy)
+            expected = self._reference(policy)
+
+            self.assertEqual(trajectory, expected)
+            self.assertEqual(result.rows, len(self.rows))
+            self.assertEqual(result.updates, sum(1 for row in expected if row[-1]))
+            self.assertEqual(sum(result.channel_updates.values()), result.updates)
+            self.assertIn('decrease', result.reasons)
+            self.assertIn('ratio_change', result.reasons)
+
+    def test_run_backtest_streams_database_history(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = Database(os.path.join(tmpdir, 'lightning_node.db'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.connect()
+                db.create_tables()
+            for channel in self.channels.values():
+                db.conn.execute(
+                    "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+                    (channel.channel_name, channel.channel_id, channel.channel_point, channel.capacity)
+                )
+            # 挿入順に関係なく日時順に再生される
+            db.conn.executemany(
+                "INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, ?, ?)", reversed(self.rows)
+            )
+            db.conn.commit()
+
+            output_file = os.path.join(tmpdir, 'trajectory.csv.gz')
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_backtest(db, self.policy, self.fixed_channels, self.control_channels, output_file)
+            db.close()
+
+            with gzip.open(output_file, 'rt', encoding='utf-8') as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(tuple(rows[0]), TRAJECTORY_COLUMNS)
+        self.assertEqual(len(rows) - 1, len(self.rows))
+        self.assertEqual(result, self._run(self.policy)[0])
+
+    def test_parse_policy_overrides(self):
+        overrides = parse_policy_overrides(['localfee_ratio=1, 1, 1, 1, 1', ('DECAY_FACTOR', '0.5')])
+        self.assertEqual(overrides, {'LocalFee_ratio': [1.0] * 5, 'decay_factor': 0.5})
+        self.assertEqual(self.policy.replace(**overrides).calculate_decreased_fee(3000), 2000)
+        with self.assertRaises(ValueError):
+            parse_policy_overrides(['inboundFee_base=0'])
+        with self.assertRaises(ValueError):
+            parse_policy_overrides(['data_period'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from db.database import Database
+
+
+class TestChannelExport(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.connect()
+        self.db.create_tables()
+        for channel_id in ('chan_a', 'chan_b'):
+            self.db.cursor.execute(
+                'INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)',
+                (f'name_{channel_id}', channel_id, 'txid:0', 1000000)
+            )
+        rows = [
+            ('chan_a', '2024-01-01 00:00:00', 100000, 500),
+            ('chan_a', '2024-01-01 02:00:00', 300000, 450),
+            ('chan_a', '2024-01-01 01:00:00', 200000, 400),
+        ]
+        for channel_id, date, local_balance, local_fee in rows:
+            self.db.cursor.execute(
+                'INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (channel_id, date, local_balance, local_fee, -50, 0, 0, 0, 0, 900, 1)
+            )
+        self.db.conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_rows_carry_the_latest_snapshot(self):
+        rows = list(self.db.iter_channels_with_latest_data())
+        self.assertEqual(rows, [
+            ('name_chan_a', 'chan_a', 'txid:0', 1000000, '2024-01-01 02:00:00', 300000, 450, -50, 900, 1),
+            ('name_chan_b', 'chan_b', 'txid:0', 1000000, None, None, None, None, None, None),
+        ])
+
+    def test_streaming_does_not_disturb_the_shared_cursor(self):
+        self.db.cursor.execute('SELECT channel_id FROM channel_lists ORDER BY id')
+        rows = self.db.iter_channels_with_latest_data()
+        next(rows)
+        self.assertEqual(self.db.cursor.fetchone(), ('chan_a',))
+        rows.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import contextlib
+import io
+import unittest
+from db.database import Database
+from models.channel_data import ChannelData
+from models.channel_history import ChannelHistory
+from services.data_analyzer import DataAnalyzer
+
+
+class TestChannelHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = ChannelHistory('chan_a')
+        self.history.append('2024-01-01 00:00:00', 900000, 100, -10, 100000, 5, 0, 1, None, 1)
+        self.history.append('2024-01-01 01:00:00', 850000, 100, None, 150000, 5, 0, 2, 4200, 0)
+
+    def test_row_views_keep_channel_data_attributes(self):
+        latest = self.history[-1]
+        self.assertIsInstance(latest, ChannelData)
+        self.assertEqual(len(self.history), 2)
+        self.assertEqual(latest.date, '2024-01-01 01:00:00')
+        self.assertEqual(latest.local_balance, 850000)
+        self.assertIsNone(latest.local_infee)
+        self.assertEqual(latest.amboss_fee, 4200)
+        self.assertFalse(latest.active)
+        self.assertIsNone(self.history[0].amboss_fee)
+        self.assertEqual([data.num_updates for data in self.history], [1, 2])
+        with self.assertRaises(IndexError):
+            self.history[2]
+
+    def test_models_have_no_instance_dict(self):
+        self.assertFalse(hasattr(self.history, '__dict__'))
+        self.assertFalse(hasattr(self.history[0], '__dict__'))
+
+    def test_analyzer_gives_same_answers_for_history_and_list(self):
+        analyzer = DataAnalyzer(db_connection=None, config=None)
+        rows = list(self.history)
+        for method in (analyzer.is_within_tolerance, analyzer.is_within_tolerance_1, analyzer.is_same_localfee):
+            self.assertEqual(method(self.history, 1000000), method(rows, 1000000))
+
+    def test_real_values_from_sqlite_keep_their_fraction(self):
+        db = Database(':memory:')
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.connect()
+            db.create_tables()
+        # 収集側が REAL で書き込んだ行（型の緩い SQLite ではそのまま保存される）
+        db.conn.execute("INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ('chan_a', '2024-01-01 00:00:00', 500000.0, 100.0, -10, 0, 0, 0, 0, 1234.5, 1))
+        db.conn.commit()
+        history = db.get_recent_channel_data_bulk(1)['chan_a']
+        db.close()
+
+        latest = history[-1]
+        # 整数値の REAL は int として、端数のある値はそのまま返す
+        self.assertEqual((latest.local_balance, latest.local_fee, latest.amboss_fee), (500000, 100, 1234.5))
+        self.assertIsInstance(latest.local_balance, int)
+        history.set_latest(local_balance=400000.0)
+        self.assertEqual(history[-1].local_balance, 400000)
+        history.set_latest(local_balance=400000.5)
+        self.assertEqual(history.column('local_balance'), [400000.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
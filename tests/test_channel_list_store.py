@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from db.channel_list_store import ChannelListStore
+from db.migrations import migrate
+
+
+class TestChannelListStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'fixed_channel_list.csv')
+        self.conn = sqlite3.connect(':memory:')
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(self.conn)
+        self.store = ChannelListStore(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _write(self, content, mtime_offset=0):
+        with open(self.filename, 'w', encoding='utf-8') as file:
+            file.write(content)
+        if mtime_offset:
+            stat = os.stat(self.filename)
+            os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset))
+
+    def _load(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            channels = self.store.load('fixed', self.filename)
+        return channels, output.getvalue()
+
+    def test_rows_are_validated_and_typed(self):
+        self._write('channel_name,channel_id,fee\n'
+                    'a,111,100\n'
+                    'b,222\n'
+                    'c,,100\n'
+                    'd,444,abc\n'
+                    'e,555, -5 \n'
+                    'f,111,200\n')
+        channels, output = self._load()
+
+        self.assertEqual(channels, {'111': 200, '555': -5})
+        self.assertIn(':3: expected channel_name, channel_id, fee', output)
+        self.assertIn(':4: empty channel_id', output)
+        self.assertIn(":5: invalid fee 'abc'", output)
+        self.assertIn(':7: duplicate channel 111', output)
+
+    def test_file_is_reimported_only_when_content_changes(self):
+        self._write('channel_name,channel_id,fee\na,111,100\n')
+        channels, output = self._load()
+        self.assertEqual(channels, {'111': 100})
+        self.assertIn('Imported 1 channels', output)
+
+        channels, output = self._load()
+        self.assertEqual(channels, {'111': 100})
+        self.assertEqual(output, '')
+
+        # 内容が同じなら mtime が変わっても取り込み直さない
+        self._write('channel_name,channel_id,fee\na,111,100\n', mtime_offset=1_000_000_000)
+        channels, output = self._load()
+        self.assertEqual(output, '')
+
+        self._write('channel_name,channel_id,fee\na,111,150\nb,222,0\n', mtime_offset=2_000_000_000)
+        channels, output = self._load()
+        self.assertEqual(channels, {'111': 150, '222': 0})
+        self.assertIn('Imported 2 channels', output)
+
+    def test_missing_file_returns_empty_list(self):
+        channels, output = self._load()
+        self.assertEqual(channels, {})
+        self.assertIn('not found', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
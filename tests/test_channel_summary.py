@@ -0,0 +1,156 @@
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from db.channel_summary_store import ChannelSummaryStore
+from db.database import Database
+from db.migrations import migrate
+from models.channel import Channel
+from services.data_analyzer import DataAnalyzer
+from services.fee_policy import FeePolicy
+from services.policy_planner import PolicyPlanner
+
+CAPACITY = 1000000
+
+
+class TestChannelSummaryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(self.conn)
+        self.store = ChannelSummaryStore(self.conn)
+        self.analyzer = DataAnalyzer(db_connection=None, config=None)
+        self.rng = random.Random(7)
+        self.counters = {}
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _add_channel(self, channel_id, capacity=CAPACITY):
+        self.conn.execute(
+            "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+            (channel_id, channel_id, f'{channel_id}:0', capacity)
+        )
+
+    def _add_snapshots(self, channel_id, count):
+        for _ in range(count):
+            index = self.counters.get(channel_id, 0)
+            self.counters[channel_id] = index + 1
+            # 同じ区間・同じ手数料が続きやすいように前の値を引き継ぐことが多い乱数列
+            balance = self.rng.choice([150000, 350000, 550000, 750000, 950000, 960000])
+            fee = self.rng.choice([1000, 1000, 1000, 1200])
+            self.conn.execute(
+                "INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, ?, 1)",
+                (channel_id, f'2024-01-{1 + index // 24:02d} {index % 24:02d}:00:00', balance, fee, -1000, 800)
+            )
+        self.conn.commit()
+
+    def _window(self, channel_id, size):
+        # 比較対象は従来どおり直近 size 行を読み込む経路
+        db = Database(':memory:')
+        db.conn = db.read_conn = self.conn
+        db.cursor = db.read_cursor = self.conn.cursor()
+        return db.get_recent_channel_data(channel_id, size)
+
+    def test_incremental_refresh_matches_full_window_checks(self):
+        self._add_channel('chan_a')
+        self._add_channel('chan_b')
+        for _ in range(15):
+            self._add_snapshots('chan_a', self.rng.randint(0, 3))
+            self._add_snapshots('chan_b', self.rng.randint(1, 2))
+            summaries = self.store.refresh()
+
+            for channel_id, summary in summaries.items():
+                for data_period in (1, 2, 3, 5, 8):
+                    window = self._window(channel_id, data_period)
+                    self.assertEqual(summary.window_size(data_period), len(window))
+                    self.assertEqual(summary.is_within_tolerance(data_period),
+                                     self.analyzer.is_within_tolerance(window, CAPACITY))
+                    self.assertEqual(summary.is_within_tolerance_1(data_period),
+                                     self.analyzer.is_within_tolerance_1(window, CAPACITY))
+                    self.assertEqual(summary.is_same_localfee(data_period),
+                                     self.analyzer.is_same_localfee(window, CAPACITY))
+                self.assertEqual(summary.last_date, window[-1].date)
+
+        self.assertEqual(self.store.refresh(), self.store.rebuild())
+
+    def test_missing_summary_is_rebuilt_from_history(self):
+        self._add_channel('chan_a')
+        self._add_snapshots('chan_a', 10)
+        expected = self.store.refresh()['chan_a']
+
+        self.conn.execute("DELETE FROM channel_summary")
+        self.conn.commit()
+        self.assertEqual(self.store.refresh()['chan_a'], expected)
+        self.assertEqual(expected.row_count, 10)
+
+    def test_capacity_change_rebuilds_summary(self):
+        self._add_channel('chan_a')
+        self._add_snapshots('chan_a', 6)
+        self.store.refresh()
+
+        self.conn.execute("UPDATE channel_lists SET capacity = ? WHERE channel_id = 'chan_a'", (CAPACITY * 2,))
+        self.conn.commit()
+        summary = self.store.refresh()['chan_a']
+        self.assertEqual(summary.capacity, CAPACITY * 2)
+        self.assertEqual(summary.row_count, 6)
+        self.assertEqual(summary, self.store.rebuild()['chan_a'])
+
+    def test_summary_plan_matches_per_object_plan(self):
+        policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=3,
+        )
+        channels = []
+        for i in range(20):
+            channel_id = f'chan_{i:02d}'
+            self._add_channel(channel_id)
+            self._add_snapshots(channel_id, self.rng.randint(0, 6))
+            channels.append(Channel(id=i, channel_name=channel_id, channel_id=channel_id,
+                                    channel_point=f'{channel_id}:0', capacity=CAPACITY))
+        control_channels = {channel.channel_id: 0 for channel in channels[2:]}
+        fixed_channels = {channels[0].channel_id: 500}
+
+        planner = PolicyPlanner(policy, self.analyzer, fixed_channels, control_channels)
+        history_map = {channel.channel_id: self._window(channel.channel_id, policy.data_period)
+                       for channel in channels}
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = planner.plan(channels, history_map, initial=False)
+            actual = planner.plan_summary(channels, self.store.refresh())
+
+        self.assertEqual(actual, expected)
+        self.assertTrue(expected)
+
+    def test_reads_go_through_the_read_only_connection(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = Database(os.path.join(tmpdir, 'lightning_node.db'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.connect()
+                db.create_tables()
+            self.conn, original = db.conn, self.conn
+            original.close()
+            self._add_channel('chan_a')
+            self._add_snapshots('chan_a', 5)
+
+            statements = []
+            db.read_conn.set_trace_callback(statements.append)
+            store = ChannelSummaryStore(db.conn, db.read_conn)
+            self.assertEqual(store.refresh()['chan_a'].row_count, 5)
+            self._add_snapshots('chan_a', 2)
+            self.assertEqual(store.refresh()['chan_a'].row_count, 7)
+            db.close()
+        # channel_datas と要約の読み込みは読み取り専用接続、書き込みは読み書き接続で行う
+        self.assertTrue(any('channel_datas' in statement for statement in statements))
+        self.assertTrue(any('FROM channel_summary' in statement for statement in statements))
+        self.assertFalse(any('INSERT' in statement for statement in statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from db.connection import apply_pragmas, connect_read_only, connect_read_write
+from db.database import Database
+
+
+class TestConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmpdir.name, 'lightning_node.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_write_connection_enables_wal(self):
+        conn = connect_read_write(self.db_file)
+        try:
+            self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        finally:
+            conn.close()
+
+    def test_read_only_connection_rejects_writes(self):
+        conn = connect_read_write(self.db_file)
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        reader = connect_read_only(self.db_file)
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                reader.execute("INSERT INTO t VALUES (1)")
+            # 書き込み側のコミットは読み取り側から見える
+            conn.execute("INSERT INTO t VALUES (1)")
+            conn.commit()
+            self.assertEqual(reader.execute("SELECT COUNT(*) FROM t").fetchone()[0], 1)
+        finally:
+            reader.close()
+            conn.close()
+
+    def test_read_only_connection_applies_pragmas(self):
+        connect_read_write(self.db_file).close()
+        reader = connect_read_only(self.db_file, {'cache_size': -2048, 'temp_store': 'MEMORY'})
+        try:
+            self.assertEqual(reader.execute("PRAGMA cache_size").fetchone()[0], -2048)
+            self.assertEqual(reader.execute("PRAGMA temp_store").fetchone()[0], 2)
+            self.assertEqual(reader.execute("PRAGMA query_only").fetchone()[0], 1)
+        finally:
+            reader.close()
+
+    def test_invalid_pragmas_are_rejected(self):
+        conn = sqlite3.connect(':memory:')
+        try:
+            for pragmas in ({'journal_mode': 'OFF'}, {'cache_size': '0; DROP TABLE channel_datas'},
+                            {'temp_store': 'MEMORY --'}, {'mmap_size': 1.5}, {'mmap_size': True}):
+                with self.assertRaises(ValueError):
+                    apply_pragmas(conn, pragmas)
+            apply_pragmas(conn, {'cache_size': -1024, 'temp_store': 'memory'})
+            self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -1024)
+        finally:
+            conn.close()
+
+    def test_invalid_pragma_config_fails_to_connect(self):
+        db = Database(self.db_file, {'cache_size': '0; DROP TABLE channel_datas'})
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertFalse(db.connect())
+        db.close()
+        self.assertIn('Database connection error', output.getvalue())
+
+    def test_database_uses_separate_read_connection(self):
+        db = Database(self.db_file)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(db.connect())
+            db.create_tables()
+        try:
+            self.assertIsNot(db.read_conn, db.conn)
+            self.assertEqual(db.get_channels(), [])
+            db.mark_channels_evaluated({'123': '2024-01-01 00:00:00'})
+            self.assertEqual(
+                db.read_conn.execute("SELECT last_date FROM channel_eval_state").fetchone()[0],
+                '2024-01-01 00:00:00'
+            )
+        finally:
+            db.close()
+
+    def test_memory_database_shares_connection(self):
+        db = Database(':memory:')
+        self.assertTrue(db.connect())
+        try:
+            self.assertIs(db.read_conn, db.conn)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+from services.credentials import CredentialProvider
+
+
+class TestCredentialProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\x01\x02')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_headers_are_cached_until_mtime_changes(self):
+        provider = CredentialProvider(self.macaroon_path, None)
+        headers = provider.get_headers()
+        self.assertEqual(headers, {'Grpc-Metadata-macaroon': '0102'})
+        self.assertIs(provider.get_headers(), headers)
+
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\xff')
+        stat = os.stat(self.macaroon_path)
+        os.utime(self.macaroon_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertEqual(provider.get_headers(), {'Grpc-Metadata-macaroon': 'ff'})
+
+    def test_no_tls_path_means_default_verification(self):
+        self.assertIsNone(CredentialProvider(self.macaroon_path, '').get_ssl_context())
+
+
+if __name__ == '__main__':
+    unittest.main()
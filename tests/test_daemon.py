@@ -0,0 +1,75 @@
+import configparser
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from services.daemon import FeeManagerDaemon
+
+
+class TestFeeManagerDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmpdir.name, 'ln-fee-manager.conf')
+        with open(self.config_path, 'w') as file:
+            file.write('[analysis]\n')
+        self.marker = 1
+        self.cycles = 0
+        self.reloaded = []
+        self.fail_first_cycle = False
+        self.daemon = FeeManagerDaemon(
+            run_cycle=self._run_cycle,
+            snapshot_marker=lambda: self.marker,
+            watched_files=lambda: [self.config_path],
+            reload=self.reloaded.append,
+            interval=100.0,
+            poll_interval=1.0,
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run_cycle(self):
+        self.cycles += 1
+        if self.cycles == 1 and self.fail_first_cycle:
+            raise sqlite3.OperationalError('database is locked')
+
+    def test_runs_on_interval_and_on_new_snapshots(self):
+        self.assertTrue(self.daemon.poll(now=0.0))
+        self.assertFalse(self.daemon.poll(now=10.0))
+        self.marker = 2
+        self.assertTrue(self.daemon.poll(now=20.0))
+        self.assertFalse(self.daemon.poll(now=50.0))
+        self.assertTrue(self.daemon.poll(now=120.0))
+        self.assertEqual(self.cycles, 3)
+
+    def test_reloads_changed_files(self):
+        self.daemon.poll(now=0.0)
+        stat = os.stat(self.config_path)
+        os.utime(self.config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.daemon.poll(now=1.0)
+        self.assertEqual(self.reloaded, [{self.config_path}])
+
+    def test_cycle_and_reload_errors_do_not_stop_the_daemon(self):
+        self.fail_first_cycle = True
+
+        def reload(changed):
+            raise configparser.ParsingError(self.config_path)
+
+        self.daemon.reload = reload
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.assertFalse(self.daemon.poll(now=0.0))
+            stat = os.stat(self.config_path)
+            os.utime(self.config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            self.assertFalse(self.daemon.poll(now=1.0))
+            # 失敗した評価は次の予定時刻に再実行される
+            self.assertTrue(self.daemon.poll(now=100.0))
+        self.assertEqual((self.cycles, self.daemon.failures), (2, 1))
+        self.assertIn('database is locked', output.getvalue())
+        self.assertIn('Error reloading', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
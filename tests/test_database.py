@@ -1,44 +1,50 @@
-import sqlite3
+import contextlib
+import io
+import os
+import tempfile
 import unittest
-from src.db.database import Database
+from db.database import Database
 
 class TestDatabase(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.db = Database('lightning_node.db')
-        cls.db.create_tables()
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.db = Database(os.path.join(cls.tmpdir.name, 'lightning_node.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.db.connect()
+            cls.db.create_tables()
+        # channel_lists と channel_datas は収集側が書き込むテーブル
+        cls.db.conn.execute(
+            "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+            ('Test Channel', 'test_channel_1', 'deadbeef:0', 1000000)
+        )
+        cls.db.conn.execute(
+            "INSERT INTO channel_datas (channel_id, date, local_balance, local_fee, remote_balance, amboss_fee, active) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ('test_channel_1', '2023-10-01', 500000, 100, 500000, 50, 1)
+        )
+        cls.db.conn.commit()
 
     def test_insert_channel(self):
-        channel_data = {
-            'channel_name': 'Test Channel',
-            'channel_id': 'test_channel_1',
-            'capacity': 1000000
-        }
-        self.db.insert_channel(channel_data)
-        channel = self.db.get_channel('test_channel_1')
-        self.assertEqual(channel['channel_name'], 'Test Channel')
-        self.assertEqual(channel['capacity'], 1000000)
+        channels = {channel.channel_id: channel for channel in self.db.get_channels()}
+        channel = channels['test_channel_1']
+        self.assertEqual(channel.channel_name, 'Test Channel')
+        self.assertEqual(channel.capacity, 1000000)
 
     def test_insert_channel_data(self):
-        channel_data = {
-            'channel_id': 'test_channel_1',
-            'date': '2023-10-01',
-            'local_balance': 500000,
-            'local_fee': 100,
-            'remote_balance': 500000,
-            'amboss_fee': 50,
-            'active': 1
-        }
-        self.db.insert_channel_data(channel_data)
-        data = self.db.get_channel_data('test_channel_1', '2023-10-01')
-        self.assertEqual(data['local_balance'], 500000)
-        self.assertEqual(data['local_fee'], 100)
+        data = self.db.get_recent_channel_data('test_channel_1', 1)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[-1].date, '2023-10-01')
+        self.assertEqual(data[-1].local_balance, 500000)
+        self.assertEqual(data[-1].local_fee, 100)
+        self.assertEqual(data[-1].amboss_fee, 50)
+        self.assertTrue(data[-1].active)
 
     @classmethod
     def tearDownClass(cls):
-        cls.db.drop_tables()
         cls.db.close()
+        cls.tmpdir.cleanup()
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,268 @@
+import base64
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+from benchmarks.fake_lnd_server import FakeLndServer
+from db.database import Database
+from db.fee_update_log import FeeUpdateLog
+from db.update_state_store import UpdateStateStore
+from models.channel import Channel
+from services.event_stream import (
+    CHANNEL_EVENTS_PATH, HTLC_EVENTS_PATH, ChannelBalanceTracker, EventStreamRunner, channel_point_from_proto,
+)
+from services.fee_calculator import FeeCalculator
+from services.fee_policy import FeePolicy
+from services.live_state import LiveChannelState
+from services.policy_planner import PolicyPlanner
+from services.update_executor import FeeUpdateResult
+from services.update_scheduler import UpdateScheduler
+from tests.test_fee_calculator_api import StubConfig
+
+POLICY = FeePolicy(
+    inboundFee_base=-1000,
+    inboundFee_ratio=[0, 0, 0, 0, 0.1],
+    LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+    fee_decreasing_threshold=0.4,
+    data_period=2,
+)
+
+
+def _forward(incoming, outgoing, htlc_id, **event):
+    return dict(incoming_channel_id=incoming, outgoing_channel_id=outgoing, incoming_htlc_id=str(htlc_id),
+                outgoing_htlc_id=str(htlc_id), event_type='FORWARD', **event)
+
+
+class TestChannelBalanceTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = ChannelBalanceTracker(POLICY)
+        self.tracker.reset({
+            'aa:0': LiveChannelState('aa:0', '1', True, 1000000, 500000, 500, 1000, 0, 0),
+            'bb:1': LiveChannelState('bb:1', '2', True, 1000000, 500000, 500, 1000, 0, 0),
+        })
+
+    def test_settled_forward_moves_both_balances(self):
+        info = {'info': {'incoming_amt_msat': '300001000', 'outgoing_amt_msat': '300000000'}}
+        self.assertEqual(self.tracker.apply_htlc_event(_forward('1', '2', 7, forward_event=info)), [])
+        self.assertEqual(self.tracker.local_balance('bb:1'), 500000)
+
+        changed = self.tracker.apply_htlc_event(_forward('1', '2', 7, settle_event={}))
+        self.assertEqual(changed, ['aa:0', 'bb:1'])
+        self.assertEqual(self.tracker.local_balance('aa:0'), 800001)
+        self.assertEqual(self.tracker.local_balance('bb:1'), 200000)
+        self.assertEqual(self.tracker.bucket('aa:0'), 4)
+        self.assertEqual(self.tracker.bucket('bb:1'), 1)
+
+    def test_failed_and_unknown_htlcs_do_not_move_balances(self):
+        info = {'info': {'incoming_amt_msat': '1000', 'outgoing_amt_msat': '1000'}}
+        self.tracker.apply_htlc_event(_forward('1', '2', 1, forward_event=info))
+        self.tracker.apply_htlc_event(_forward('1', '2', 1, forward_fail_event={}))
+        self.assertEqual(self.tracker.apply_htlc_event(_forward('1', '2', 1, settle_event={})), [])
+        # 金額が分からない受取（RECEIVE）は次の再同期に任せる
+        self.assertEqual(self.tracker.apply_htlc_event(
+            {'incoming_channel_id': '1', 'incoming_htlc_id': '3', 'event_type': 'RECEIVE', 'settle_event': {}}), [])
+        self.assertEqual(self.tracker.apply_htlc_event({'subscribed_event': {}}), [])
+        self.assertEqual(self.tracker.local_balance('aa:0'), 500000)
+        self.assertEqual(self.tracker.pending_htlcs, {})
+
+    def test_channel_events(self):
+        txid = 'aa' * 32
+        raw = base64.b64encode(bytes.fromhex(txid)[::-1]).decode('ascii')
+        self.assertEqual(channel_point_from_proto({'funding_txid_bytes': raw, 'output_index': 2}), f'{txid}:2')
+
+        opened = {'type': 'OPEN_CHANNEL', 'open_channel': {
+            'channel_point': f'{txid}:2', 'chan_id': '3', 'active': True, 'capacity': '2000000', 'local_balance': '0'}}
+        self.assertEqual(self.tracker.apply_channel_event(opened), [f'{txid}:2'])
+        self.assertEqual(self.tracker.bucket(f'{txid}:2'), 0)
+
+        inactive = {'type': 'INACTIVE_CHANNEL', 'inactive_channel': {'funding_txid_bytes': raw, 'output_index': 2}}
+        self.assertEqual(self.tracker.apply_channel_event(inactive), [f'{txid}:2'])
+        self.assertFalse(self.tracker.states[f'{txid}:2'].active)
+
+        closed = {'type': 'CLOSED_CHANNEL', 'closed_channel': {'channel_point': 'aa:0', 'chan_id': '1'}}
+        self.tracker.apply_channel_event(closed)
+        self.assertIsNone(self.tracker.bucket('aa:0'))
+        self.assertNotIn('1', self.tracker.points)
+
+
+class TestEventStreamRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\x01')
+        self.db = Database(os.path.join(self.tmpdir.name, 'lightning_node.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.connect()
+            self.db.create_tables()
+        for channel_id, point in (('1', 'aa:0'), ('2', 'bb:1')):
+            self.db.conn.execute(
+                "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+                (f'channel{channel_id}', channel_id, point, 1000000)
+            )
+            self.db.conn.execute("INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, ?, ?)",
+                                 (channel_id, '2024-01-01 00:00:00', 500000, 800, -1000, 1000, 1))
+        self.db.conn.commit()
+        self.server = FakeLndServer().start()
+        self.server.add_channel('aa:0', '1', 1000000, 500000, fee_per_mil=800, inbound_fee_per_mil=0, base_fee_msat=500)
+        self.server.add_channel('bb:1', '2', 1000000, 500000, fee_per_mil=800, inbound_fee_per_mil=0, base_fee_msat=500)
+        self.calculator = FeeCalculator(StubConfig(self.server.url, self.macaroon_path), None)
+        planner = PolicyPlanner(POLICY, None, {}, {'1': 0, '2': 0})
+        self.now = 1000.0
+        self.runner = EventStreamRunner(self.calculator, self.db, planner, debounce=5.0, min_update_interval=60.0,
+                                        resync_interval=600.0, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.runner.stop()
+        self.calculator.close()
+        self.server.stop()
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def _forward(self, incoming, outgoing, amt_msat, htlc_id):
+        info = {'info': {'incoming_amt_msat': str(amt_msat), 'outgoing_amt_msat': str(amt_msat)}}
+        self.runner.handle_event(HTLC_EVENTS_PATH, _forward(incoming, outgoing, htlc_id, forward_event=info), self.now)
+        self.runner.handle_event(HTLC_EVENTS_PATH, _forward(incoming, outgoing, htlc_id, settle_event={}), self.now)
+
+    def test_bucket_change_is_debounced_and_rate_limited(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(self.runner.resync(self.now))
+            # 入金側は残高 50% -> 95%（区間 2 -> 4）、出金側は 5%（区間 0）
+            self._forward('1', '2', 450000000, 1)
+            self.assertEqual(self.runner.due, {'aa:0': 1005.0, 'bb:1': 1005.0})
+            self.assertEqual(self.runner.run_due(1004.0), 0)
+
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 2)
+        updates = {update['data']['chan_point']['funding_txid_str']: update['data']
+                   for update in self.server.policy_updates}
+        self.assertEqual(updates['aa']['fee_rate_ppm'], POLICY.calculate_local_fee(1000, 4))
+        self.assertEqual(updates['aa']['inbound_fee']['fee_rate_ppm'], POLICY.calculate_inbound_fee(1000, 4))
+        self.assertEqual(updates['bb']['fee_rate_ppm'], POLICY.calculate_local_fee(1000, 0))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            # 戻ってまた移動しても、前回の更新から min_update_interval が経つまで待つ
+            self._forward('2', '1', 450000000, 2)
+            self.assertEqual(self.runner.due['aa:0'], 1065.0)
+            self._forward('1', '2', 450000000, 3)
+            self.now = 1065.0
+            # 元の区間に戻っているため更新しない
+            self.assertEqual(self.runner.run_due(self.now), 0)
+        self.assertEqual(len(self.server.policy_updates), 2)
+        self.assertEqual(self.runner.due, {})
+        # 送った更新は監査ログにも残る
+        record = FeeUpdateLog(self.db.conn).get_channel_history('1')[0]
+        self.assertEqual((record.new_local_fee, record.reason, record.success),
+                         (POLICY.calculate_local_fee(1000, 4), 'ratio_change', True))
+
+    def test_unlisted_and_unchanged_channels_are_not_updated(self):
+        self.runner.planner.control_channels = {'1': 0}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.runner.resync(self.now)
+            self._forward('1', '2', 450000000, 1)
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 1)
+            # LND の手数料が既に新しい区間の値になっていれば送らない
+            self._forward('2', '1', 450000000, 2)
+            self._forward('1', '2', 450000000, 3)
+            self.now = 2000.0
+            self.runner.buckets['aa:0'] = 2
+            self.runner.due['aa:0'] = self.now
+            self.assertEqual(self.runner.run_due(self.now), 0)
+        self.assertEqual([update['data']['chan_point']['funding_txid_str'] for update in self.server.policy_updates],
+                         ['aa'])
+
+    def test_failed_update_is_retried(self):
+        self.runner.planner.control_channels = {'1': 0}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.runner.resync(self.now)
+            self._forward('1', '2', 450000000, 1)
+            self.server.error_rate = 1.0
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 0)
+            # 失敗したチャネルは元の区間のまま再試行を待つ
+            self.assertEqual(self.runner.buckets['aa:0'], 2)
+            self.assertEqual(self.runner.due, {'aa:0': 1035.0})
+
+            self.server.error_rate = 0.0
+            self.now = 1035.0
+            self.assertEqual(self.runner.run_due(self.now), 1)
+        self.assertEqual(self.runner.buckets['aa:0'], 4)
+        self.assertEqual(self.server.channels['aa:0']['fee_per_mil'], POLICY.calculate_local_fee(1000, 4))
+        self.assertEqual([record.success for record in FeeUpdateLog(self.db.conn).get_channel_history('1')],
+                         [True, False])
+
+    def test_debug_mode_does_not_change_the_tracked_policy(self):
+        self.runner.planner.control_channels = {'1': 0}
+        self.calculator.config.debug_mode = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.runner.resync(self.now)
+            self._forward('1', '2', 450000000, 1)
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 0)
+        self.assertEqual(self.server.policy_updates, [])
+        # 送信していないため LND のポリシーとレート制限の状態はそのまま
+        self.assertEqual(self.runner.tracker.states['aa:0'].fee_per_mil, 800)
+        self.assertEqual(self.runner.last_update, {})
+        self.assertFalse(FeeUpdateLog(self.db.conn).get_channel_history('1')[0].success)
+
+    def test_scheduler_cooldown_and_budget_apply_to_the_stream(self):
+        self.runner.scheduler = UpdateScheduler(UpdateStateStore(self.db.conn), min_interval=3600, budget=1,
+                                                window=3600, clock=lambda: 50000.0)
+        # 定期実行がチャネル 2 を更新した直後
+        self.runner.scheduler.record([FeeUpdateResult(Channel(id=2, channel_name='channel2', channel_id='2',
+                                                              channel_point='bb:1', capacity=1000000), True)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.runner.resync(self.now)
+            self._forward('1', '2', 450000000, 1)
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 1)
+        # チャネル 2 はクールダウン中のため送らず、区間を進めずに再評価を待つ
+        self.assertEqual([update['data']['chan_point']['funding_txid_str'] for update in self.server.policy_updates],
+                         ['aa'])
+        self.assertEqual((self.runner.buckets['bb:1'], self.runner.due), (2, {'bb:1': 1035.0}))
+        self.assertEqual(UpdateStateStore(self.db.conn).load_last_updates(['1']), {'1': 50000.0})
+
+    def test_evaluate_error_does_not_stop_runner(self):
+        self.runner.planner.control_channels = {'1': 0}
+
+        def fail(channel_id, count):
+            raise RuntimeError('database is locked')
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            self.runner.resync(self.now)
+            self._forward('1', '2', 450000000, 1)
+            self.runner.db.get_recent_channel_data = fail
+            self.now = 1005.0
+            self.assertEqual(self.runner.run_due(self.now), 0)
+        self.assertIn('database is locked', output.getvalue())
+        self.assertEqual(self.runner.buckets, {'aa:0': 2, 'bb:1': 2})
+        self.assertEqual(self.runner.due, {'aa:0': 1035.0, 'bb:1': 1035.0})
+        self.assertEqual(self.server.policy_updates, [])
+
+    def test_streams_trigger_update(self):
+        self.runner.clock = time.monotonic
+        self.runner.debounce = 0.0
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.runner.start_streams()
+            self.assertTrue(self.server.wait_for_subscribers(HTLC_EVENTS_PATH))
+            self.assertTrue(self.server.wait_for_subscribers(CHANNEL_EVENTS_PATH))
+            self.runner.resync(time.monotonic())
+            self.server.forward_htlc('2', '1', 450000000)
+
+            deadline = time.monotonic() + 5.0
+            while len(self.server.policy_updates) < 2 and time.monotonic() < deadline:
+                self.runner.step(time.monotonic())
+        self.assertEqual(len(self.server.policy_updates), 2)
+        # 送ったポリシーが LND 側にも反映されている
+        self.assertEqual(self.server.channels['aa:0']['fee_per_mil'], POLICY.calculate_local_fee(1000, 0))
+        self.assertEqual(self.server.channels['bb:1']['fee_per_mil'], POLICY.calculate_local_fee(1000, 4))
+        self.assertEqual(self.runner.tracker.local_balance('aa:0'), self.server.channels['aa:0']['local_balance'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,41 +1,83 @@
+import contextlib
+import io
+import os
+import tempfile
 import unittest
-from src.services.fee_calculator import FeeCalculator
+from models.channel import Channel
+from services.fee_calculator import FeeCalculator
+from services.fee_policy import FeePolicy
+from tests.test_fee_calculator_api import StubConfig
 
 class TestFeeCalculator(unittest.TestCase):
 
     def setUp(self):
-        self.fee_calculator = FeeCalculator()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(macaroon_path, 'wb') as file:
+            file.write(b'\x01')
+        # API は呼び出さないため接続できない URL でよい
+        self.fee_calculator = FeeCalculator(StubConfig('http://127.0.0.1:9', macaroon_path), None)
         self.inboundFee_base = -1000
         self.inboundFee_ratio = [1.2, 1.1, 1, 1, 1]
         self.LocalFee_ratio = [0.4, 0.6, 0.8, 1, 1.2]
+        # 手数料の計算式は FeePolicy に移った
+        self.fee_policy = FeePolicy(self.inboundFee_base, self.inboundFee_ratio, self.LocalFee_ratio,
+                                    fee_decreasing_threshold=0.4, data_period=8)
+
+    def tearDown(self):
+        self.fee_calculator.close()
+        self.tmpdir.cleanup()
 
     def test_calculate_inbound_fee(self):
+        amboss_fee = 100
         local_balance = 5000
         capacity = 10000
-        expected_fee = self.inboundFee_base * self.inboundFee_ratio[2]  # Assuming 50% ratio
-        calculated_fee = self.fee_calculator.calculate_inbound_fee(local_balance, capacity)
+        ratio_index = self.fee_policy.get_ratio_index(local_balance / capacity)
+        self.assertEqual(ratio_index, 2)  # 50%
+        expected_fee = int(self.inboundFee_base + amboss_fee * self.inboundFee_ratio[2])
+        calculated_fee = self.fee_policy.calculate_inbound_fee(amboss_fee, ratio_index)
         self.assertEqual(calculated_fee, expected_fee)
 
     def test_calculate_local_fee(self):
         amboss_fee = 100
         local_balance = 8000
         capacity = 10000
-        expected_fee = amboss_fee * self.LocalFee_ratio[3]  # Assuming 80% ratio
-        calculated_fee = self.fee_calculator.calculate_local_fee(local_balance, capacity, amboss_fee)
+        ratio_index = self.fee_policy.get_ratio_index(local_balance / capacity)
+        self.assertEqual(ratio_index, 4)  # 80% 以上
+        expected_fee = int(amboss_fee * self.LocalFee_ratio[4]) - self.inboundFee_base
+        calculated_fee = self.fee_policy.calculate_local_fee(amboss_fee, ratio_index)
         self.assertEqual(calculated_fee, expected_fee)
 
     def test_adjust_local_fee(self):
-        current_local_fee = 100
+        current_local_fee = 2000
         local_balance_ratio = 0.55  # 55%
-        adjusted_fee = self.fee_calculator.adjust_local_fee(current_local_fee, local_balance_ratio)
-        self.assertEqual(adjusted_fee, current_local_fee * 0.9)  # Should decrease by 10%
+        self.assertGreaterEqual(local_balance_ratio, self.fee_policy.fee_decreasing_threshold)
+        adjusted_fee = self.fee_policy.calculate_decreased_fee(current_local_fee)
+        # インバウンド割引分を除いた部分を 10% 下げる
+        self.assertEqual(adjusted_fee, int((current_local_fee + self.inboundFee_base) * 0.9) - self.inboundFee_base)
+        # インバウンド割引分より下には下げない
+        self.assertEqual(self.fee_policy.calculate_decreased_fee(1000), -self.inboundFee_base)
 
     def test_fee_calculation_with_fixed_channels(self):
         fixed_channels = [("channel1", "id1", 50), ("channel2", "id2", 100)]
         for channel in fixed_channels:
             channel_name, channel_id, fee = channel
-            calculated_fee = self.fee_calculator.calculate_fixed_fee(channel_name, fee)
-            self.assertEqual(calculated_fee, fee)  # Fixed fee should remain the same
+            calculated_fee = self.fee_policy.calculate_fixed_fee(fee)
+            # インバウンド割引分を上乗せし、実効手数料は固定値のまま
+            self.assertEqual(calculated_fee + self.inboundFee_base, fee)
+
+    def test_policy_data_uses_the_configured_fees(self):
+        data = self.fee_calculator._build_policy_data(1120, -900, 300000)
+        self.assertEqual(data['base_fee_msat'], 500)
+        self.assertEqual(data['time_lock_delta'], 72)
+        self.assertEqual(data['fee_rate_ppm'], 1120)
+        self.assertEqual(data['inbound_fee'], {'base_fee_msat': 0, 'fee_rate_ppm': -900})
+        self.assertEqual(data['max_htlc_msat'], self.fee_calculator.get_max_htlc_msat(300000))
+
+    def test_positive_inbound_fee_is_rejected(self):
+        channel = Channel(id=1, channel_name='peer', channel_id='123', channel_point='deadbeef:1', capacity=1000000)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(self.fee_calculator.set_fee_api(channel, 1000, 100, 300000))
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,134 @@
+import contextlib
+import io
+import os
+import ssl
+import tempfile
+import unittest
+from benchmarks.fake_lnd_server import FakeLndServer
+from models.channel import Channel
+from services.fee_calculator import FeeCalculator
+
+
+class StubConfig:
+    def __init__(self, api_url, macaroon_path, max_retries=0, debug_mode=False):
+        self.api_url = api_url
+        self.macaroon_path = macaroon_path
+        self.max_retries = max_retries
+        self.debug_mode = debug_mode
+
+    def get_api_url(self):
+        return self.api_url
+
+    def get_macaroon_path(self):
+        return self.macaroon_path
+
+    def get_tls_path(self):
+        return ''
+
+    def get_basefee_msat(self):
+        return 500
+
+    def get_time_lock_delta(self):
+        return 72
+
+    def get_api_timeout(self):
+        return 5.0
+
+    def get_api_max_workers(self):
+        return 2
+
+    def get_api_max_retries(self):
+        return self.max_retries
+
+    def get_api_retry_backoff(self):
+        return 0
+
+    def get_api_apply_mode(self):
+        return 'per_channel'
+
+    def get_debug_mode(self):
+        return self.debug_mode
+
+
+class TestSetFeeApi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\xab\xcd')
+        self.channel = Channel(id=1, channel_name='peer', channel_id='123', channel_point='deadbeef:1',
+                               capacity=1000000)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_tls_rotation_closes_the_old_adapter(self):
+        with FakeLndServer() as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+            self.assertEqual(calculator.list_channels(), [])
+            old_adapter = calculator.session.adapters['http://']
+            self.assertEqual(len(old_adapter.poolmanager.pools), 1)
+
+            # tls.cert が更新されて新しい SSL コンテキストが読み込まれた場合
+            calculator.credentials.get_ssl_context = ssl.create_default_context
+            self.assertEqual(calculator.list_channels(), [])
+            calculator.close()
+
+        self.assertIsNot(calculator.session.adapters['http://'], old_adapter)
+        self.assertIs(calculator.session.adapters['https://'], calculator.session.adapters['http://'])
+        self.assertEqual(len(old_adapter.poolmanager.pools), 0)
+
+    def test_posts_channel_policy(self):
+        with FakeLndServer() as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+            self.assertTrue(calculator.set_fee_api(self.channel, 1200, -100, 300000))
+            calculator.close()
+
+        self.assertEqual(len(server.policy_updates), 1)
+        update = server.policy_updates[0]
+        self.assertEqual(update['macaroon'], 'abcd')
+        self.assertEqual(update['data'], {
+            'chan_point': {'funding_txid_str': 'deadbeef', 'output_index': 1},
+            'base_fee_msat': 500,
+            'fee_rate_ppm': 1200,
+            'time_lock_delta': 72,
+            'max_htlc_msat': 200000000,
+            'inbound_fee': {'base_fee_msat': 0, 'fee_rate_ppm': -100},
+        })
+
+    def test_server_error_is_reported_as_failure(self):
+        with FakeLndServer(error_rate=1.0) as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+            result = calculator.set_fee_api(self.channel, 1200, -100, 300000)
+            calculator.close()
+
+        self.assertFalse(result)
+        self.assertFalse(result.dry_run)
+        # 失敗理由として HTTP ステータスと LND の応答本文を返す
+        self.assertEqual(result.error, 'HTTP 500: {"message": "injected error"}')
+        self.assertEqual(server.policy_updates, [])
+        self.assertEqual(server.error_count, 1)
+
+    def test_debug_mode_is_a_dry_run(self):
+        with FakeLndServer() as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path, debug_mode=True), None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = calculator.set_fee_api(self.channel, 1200, -100, 300000)
+            calculator.close()
+
+        self.assertTrue(result)
+        self.assertTrue(result.dry_run)
+        self.assertEqual(server.request_count, 0)
+
+    def test_server_errors_are_retried(self):
+        with FakeLndServer(error_rate=1.0) as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path, max_retries=2), None)
+            self.assertFalse(calculator.set_fee_api(self.channel, 1200, -100, 300000))
+            calculator.close()
+
+        self.assertEqual(server.request_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
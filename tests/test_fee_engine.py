@@ -0,0 +1,87 @@
+import random
+import unittest
+import pandas as pd
+from models.channel_data import ChannelData
+from services.data_analyzer import DataAnalyzer
+from services.fee_engine import VectorizedFeeEngine
+from services.fee_policy import FeePolicy
+
+
+class TestVectorizedFeeEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=8,
+        )
+        self.analyzer = DataAnalyzer(db_connection=None, config=None)
+        self.engine = VectorizedFeeEngine(self.policy)
+
+    def _random_channels(self, count):
+        rng = random.Random(42)
+        rows = []
+        capacities = {}
+        for i in range(count):
+            channel_id = f'chan_{i}'
+            capacity = rng.choice([1000000, 2000000, 5000000])
+            capacities[channel_id] = capacity
+            balance = rng.randint(0, capacity)
+            fee = rng.choice([100, 1500, 2200])
+            stable = i % 3 == 0
+            for j in range(rng.randint(1, 8)):
+                if not stable:
+                    balance = min(capacity, max(0, balance + rng.randint(-capacity // 4, capacity // 4)))
+                    if rng.random() < 0.3:
+                        fee = rng.choice([100, 1500, 2200])
+                rows.append({
+                    'channel_id': channel_id,
+                    'date': f'2024-01-01 {j:02d}:00:00',
+                    'local_balance': balance,
+                    'local_fee': fee,
+                    'local_infee': -1000,
+                    'amboss_fee': rng.choice([None, 0, 333, 1234, 7000]),
+                    'active': 1,
+                    'capacity': capacity,
+                })
+        return rows, capacities
+
+    def test_matches_per_object_path(self):
+        rows, capacities = self._random_channels(300)
+        result = self.engine.evaluate(pd.DataFrame(rows))
+
+        channel_data_map = {}
+        for row in rows:
+            channel_data_map.setdefault(row['channel_id'], []).append(ChannelData(
+                channel_id=row['channel_id'], date=row['date'], local_balance=row['local_balance'],
+                local_fee=row['local_fee'], local_infee=row['local_infee'], remote_balance=0,
+                remote_fee=0, remote_infee=0, num_updates=0, amboss_fee=row['amboss_fee'], active=True
+            ))
+
+        self.assertEqual(len(result), len(channel_data_map))
+        for channel_id, channel_data in channel_data_map.items():
+            capacity = capacities[channel_id]
+            latest = channel_data[-1]
+            expected = result.loc[channel_id]
+            ratio = latest.local_balance / capacity
+            ratio_index = self.policy.get_ratio_index(ratio)
+
+            self.assertEqual(expected['range_flags'], self.analyzer._get_range_flags(ratio))
+            self.assertEqual(expected['within_tolerance'], self.analyzer.is_within_tolerance(channel_data, capacity))
+            self.assertEqual(expected['within_tolerance_1'], self.analyzer.is_within_tolerance_1(channel_data, capacity))
+            self.assertEqual(expected['same_localfee'], self.analyzer.is_same_localfee(channel_data, capacity))
+            self.assertEqual(expected['ratio_index'], ratio_index)
+            self.assertEqual(expected['decreased_local_fee'], self.policy.calculate_decreased_fee(latest.local_fee))
+
+            if latest.amboss_fee is None:
+                self.assertFalse(expected['has_amboss_fee'])
+                continue
+            self.assertEqual(expected['amboss_fee_clamped'], self.policy.clamp_amboss_fee(latest.amboss_fee))
+            self.assertEqual(expected['new_local_fee'], self.policy.calculate_local_fee(latest.amboss_fee, ratio_index))
+            self.assertEqual(expected['new_inbound_fee'], self.policy.calculate_inbound_fee(latest.amboss_fee, ratio_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
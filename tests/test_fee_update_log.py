@@ -0,0 +1,107 @@
+import contextlib
+import io
+import sqlite3
+import unittest
+from db.fee_update_log import DRY_RUN_ERROR, FeeUpdateLog
+from db.migrations import migrate
+from services.policy_planner import PolicyChange
+from services.policy_batcher import coalesce_policy_changes
+from services.update_executor import FeeUpdateExecutor, FeeUpdateResult
+
+
+class StubFeeCalculator:
+    max_workers = 2
+    basefee_msat = 500
+
+    def set_fee_api(self, channel, fee, infee, local_balance=None):
+        if channel.channel_id == 'boom':
+            raise RuntimeError('connection reset')
+        return channel.channel_id != 'fail'
+
+    def set_global_fee_api(self, fee, infee, channel_count=None):
+        return True
+
+    def get_max_htlc_msat(self, local_balance):
+        return int(local_balance / 3 * 2 * 1000)
+
+
+def _change(channel_id, new_local_fee=900, local_balance=300000, reason='decrease'):
+    return PolicyChange(
+        channel_id=channel_id, channel_name=f'channel_{channel_id}', channel_point=f'{channel_id}:0',
+        old_local_fee=1000, new_local_fee=new_local_fee, old_inbound_fee=-100, new_inbound_fee=-200,
+        local_balance=local_balance, reason=reason, ratio=local_balance / 1000000,
+    )
+
+
+class TestFeeUpdateLog(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(self.conn)
+        self.log = FeeUpdateLog(self.conn)
+        self.calculator = StubFeeCalculator()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_records_every_result_of_a_run(self):
+        executor = FeeUpdateExecutor(self.calculator)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for channel_id in ('ok', 'fail', 'boom'):
+                executor.submit_change(_change(channel_id))
+            executor.shutdown()
+
+        self.assertEqual(self.log.record_results(executor.results, self.calculator, '2024-01-01 00:00:00'), 3)
+        self.assertFalse(self.conn.in_transaction)
+        history = {channel_id: self.log.get_channel_history(channel_id) for channel_id in ('ok', 'fail', 'boom')}
+        record = history['ok'][0]
+        self.assertEqual((record.old_local_fee, record.new_local_fee), (1000, 900))
+        self.assertEqual((record.old_inbound_fee, record.new_inbound_fee), (-100, -200))
+        self.assertEqual(record.max_htlc_msat, 200000000)
+        self.assertEqual((record.reason, record.ratio, record.success, record.error), ('decrease', 0.3, True, None))
+        self.assertFalse(history['fail'][0].success)
+        self.assertEqual(history['boom'][0].error, 'connection reset')
+
+    def test_global_batch_logs_one_row_per_channel(self):
+        changes = (_change('a'), _change('b'))
+        executor = FeeUpdateExecutor(self.calculator)
+        batches = coalesce_policy_changes(changes, ['a', 'b'])
+        self.assertTrue(batches[0].is_global)
+        executor.submit_batch(batches[0])
+        executor.shutdown()
+        self.assertEqual(self.log.record_results(executor.results, self.calculator), 2)
+        for channel_id in ('a', 'b'):
+            record = self.log.get_channel_history(channel_id)[0]
+            # global 指定の呼び出しは max_htlc_msat を送らない
+            self.assertEqual((record.max_htlc_msat, record.success), (None, True))
+
+    def test_channel_history_is_newest_first_and_uses_the_index(self):
+        for day, fee in ((1, 900), (3, 700), (2, 800)):
+            self.log.record_results([FeeUpdateResult(_change('a', fee), True, local_balance=300000)],
+                                    self.calculator, f'2024-01-0{day} 00:00:00')
+        self.log.record_results([FeeUpdateResult(_change('b'), True)], self.calculator, '2024-01-05 00:00:00')
+
+        self.assertEqual([record.new_local_fee for record in self.log.get_channel_history('a')], [700, 800, 900])
+        self.assertEqual(len(self.log.get_channel_history('a', limit=1)), 1)
+        self.assertIsNone(self.log.get_channel_history('b')[0].max_htlc_msat)
+        plan = ' '.join(row[-1] for row in self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM fee_updates WHERE channel_id = 'a' ORDER BY timestamp DESC, id DESC"
+        ))
+        self.assertIn('ix_fee_updates_channel_timestamp', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_dry_run_results_are_logged_as_not_applied(self):
+        result = FeeUpdateResult(_change('a'), True, local_balance=300000, dry_run=True)
+        self.assertEqual(self.log.record_results([result], self.calculator), 1)
+        record = self.log.get_channel_history('a')[0]
+        self.assertEqual((record.success, record.error), (False, DRY_RUN_ERROR))
+
+    def test_results_without_a_policy_change_are_skipped(self):
+        class Plain:
+            channel_id = 'x'
+        self.assertEqual(self.log.record_results([FeeUpdateResult(Plain(), True)], self.calculator), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from db.database import Database
+
+
+class TestIncrementalEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.connect()
+        self.db.create_tables()
+        for channel_id in ('chan_a', 'chan_b'):
+            self.db.cursor.execute(
+                'INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)',
+                (channel_id, channel_id, 'txid:0', 1000000)
+            )
+            self._insert(channel_id, '2024-01-01 00:00:00')
+
+    def tearDown(self):
+        self.db.close()
+
+    def _insert(self, channel_id, date):
+        self.db.cursor.execute(
+            'INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (channel_id, date, 500000, 100, -10, 500000, 0, 0, 0, 100, 1)
+        )
+        self.db.conn.commit()
+
+    def test_only_channels_with_new_snapshots_are_returned(self):
+        new_data = self.db.get_channels_with_new_data()
+        self.assertEqual(new_data, {'chan_a': '2024-01-01 00:00:00', 'chan_b': '2024-01-01 00:00:00'})
+
+        self.db.mark_channels_evaluated(new_data)
+        self.assertEqual(self.db.get_channels_with_new_data(), {})
+
+        self._insert('chan_b', '2024-01-01 01:00:00')
+        self.assertEqual(self.db.get_channels_with_new_data(), {'chan_b': '2024-01-01 01:00:00'})
+
+    def test_unmarked_channel_is_retried(self):
+        self.db.mark_channels_evaluated({'chan_a': '2024-01-01 00:00:00'})
+        self.assertEqual(set(self.db.get_channels_with_new_data()), {'chan_b'})
+
+    def test_failed_channel_and_late_rows_are_picked_up(self):
+        self.db.mark_channels_evaluated({'chan_a': '2024-01-01 00:00:00', 'chan_b': '2024-01-01 00:00:00'})
+        self._insert('chan_a', '2024-01-01 02:00:00')
+        self._insert('chan_b', '2024-01-01 02:00:00')
+        # chan_b の更新が失敗したため chan_a だけ評価済みにする
+        self.db.mark_channels_evaluated({'chan_a': '2024-01-01 02:00:00'})
+        self.assertEqual(self.db.get_channels_with_new_data(), {'chan_b': '2024-01-01 02:00:00'})
+
+        # 他チャネルの評価済み日時より古い行が遅れて書き込まれても対象になる
+        self.db.mark_channels_evaluated({'chan_b': '2024-01-01 02:00:00'})
+        self.db.cursor.execute(
+            'INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)',
+            ('chan_c', 'chan_c', 'txid:1', 1000000)
+        )
+        self._insert('chan_c', '2024-01-01 00:00:00')
+        self.db.mark_channels_evaluated({'chan_c': '2024-01-01 00:00:00'})
+        self._insert('chan_c', '2024-01-01 01:00:00')
+        self.assertEqual(self.db.get_channels_with_new_data(), {'chan_c': '2024-01-01 01:00:00'})
+
+    def test_bulk_loader_can_be_restricted_to_channels(self):
+        channel_data_map = self.db.get_recent_channel_data_bulk(8, ['chan_b'])
+        self.assertEqual(list(channel_data_map), ['chan_b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import pandas as pd
+from benchmarks.fake_lnd_server import FakeLndServer
+from models.channel import Channel
+from models.channel_history import ChannelHistory
+from services.data_analyzer import DataAnalyzer
+from services.fee_calculator import FeeCalculator
+from services.fee_policy import FeePolicy
+from services.fee_engine import VectorizedFeeEngine
+from services.live_state import (
+    LiveChannelState, drop_live_noops, fetch_live_state, merge_live_state, merge_live_state_frame, parse_live_state,
+)
+from services.policy_planner import PolicyPlanner
+from tests.test_fee_calculator_api import StubConfig
+
+
+class TestParseLiveState(unittest.TestCase):
+
+    def test_joins_channels_and_fee_report_by_channel_point(self):
+        states = parse_live_state(
+            [
+                {'channel_point': 'aa:0', 'chan_id': '1', 'active': True, 'capacity': '1000000', 'local_balance': '250000'},
+                # active / local_balance が省略されたチャネル
+                {'channel_point': 'bb:1', 'chan_id': '2', 'capacity': '500000'},
+            ],
+            [
+                {'channel_point': 'aa:0', 'base_fee_msat': '500', 'fee_per_mil': '1200', 'inbound_fee_per_mil': -300},
+                {'channel_point': 'zz:9', 'fee_per_mil': '1'},
+            ],
+        )
+        self.assertEqual(set(states), {'aa:0', 'bb:1'})
+        self.assertEqual(states['aa:0'].local_balance, 250000)
+        self.assertEqual(states['aa:0'].fee_per_mil, 1200)
+        self.assertEqual(states['aa:0'].inbound_fee_per_mil, -300)
+        self.assertFalse(states['bb:1'].active)
+        self.assertEqual(states['bb:1'].local_balance, 0)
+        self.assertIsNone(states['bb:1'].fee_per_mil)
+
+
+class TestLiveStateRun(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\x01')
+        self.policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=2,
+        )
+        self.channels = [
+            Channel(id=1, channel_name='stale', channel_id='1', channel_point='aa:0', capacity=1000000),
+            Channel(id=2, channel_name='already_set', channel_id='2', channel_point='bb:1', capacity=1000000),
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _histories(self):
+        histories = {}
+        for channel in self.channels:
+            history = ChannelHistory(channel.channel_id)
+            # 記録上は残高 10%（手数料 1100）で2回とも同じ区間
+            for hour in range(2):
+                history.append(f'2024-01-01 {hour:02d}:00:00', 100000, 1100, -1000, 0, 0, 0, 0, 1000, 1)
+            histories[channel.channel_id] = history
+        return histories
+
+    def _plan(self, histories):
+        planner = PolicyPlanner(self.policy, DataAnalyzer(db_connection=None, config=None), {},
+                                {channel.channel_id: 0 for channel in self.channels})
+        return planner.plan(self.channels, histories, initial=True)
+
+    def test_live_balances_are_used_and_noop_updates_are_not_sent(self):
+        with FakeLndServer() as server:
+            # 'stale' は実際には残高 90%、'already_set' は計画どおりのポリシーが既に設定済み
+            server.add_channel('aa:0', '1', 1000000, 900000, fee_per_mil=1100, inbound_fee_per_mil=-1000, base_fee_msat=500)
+            server.add_channel('bb:1', '2', 1000000, 100000, fee_per_mil=2200, inbound_fee_per_mil=-1000, base_fee_msat=500)
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                live_states = fetch_live_state(calculator)
+                histories = self._histories()
+                self.assertEqual(merge_live_state(self.channels, histories, live_states), 2)
+                changes = drop_live_noops(self._plan(histories), live_states, calculator.basefee_msat)
+                for change in changes:
+                    self.assertTrue(calculator.set_fee_api(change, change.new_local_fee, change.new_inbound_fee,
+                                                           change.local_balance))
+            calculator.close()
+
+        # 2回の一括取得と、必要な1件の更新だけが送られる
+        self.assertEqual(server.request_count, 3)
+        self.assertEqual([change.channel_id for change in changes], ['1'])
+        self.assertEqual(changes[0].local_balance, 900000)
+        self.assertEqual(changes[0].old_local_fee, 1100)
+        self.assertEqual(changes[0].new_local_fee, self.policy.calculate_local_fee(1000, 4))
+        self.assertEqual(server.policy_updates[0]['data']['max_htlc_msat'], calculator.get_max_htlc_msat(900000))
+        # 記録上の値だけで計画すると両方とも更新対象になる
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(len(self._plan(self._histories())), 2)
+
+    def test_vectorized_window_merges_the_same_values(self):
+        live_states = {
+            'aa:0': LiveChannelState('aa:0', '1', True, 1000000, 900000, 500, 1100, 0, -1000),
+            'bb:1': LiveChannelState('bb:1', '2', False, 1000000, 500000, 500, None, 0, None),
+        }
+        histories = self._histories()
+        frame = pd.DataFrame([
+            {'channel_id': channel.channel_id, 'date': date, 'local_balance': 100000, 'local_fee': 1100,
+             'local_infee': -1000, 'amboss_fee': 1000, 'active': 1, 'capacity': channel.capacity}
+            for channel in self.channels for date in histories[channel.channel_id].dates
+        ])
+        self.assertEqual(merge_live_state(self.channels, histories, live_states), 2)
+        self.assertEqual(merge_live_state_frame(frame, self.channels, live_states), 2)
+        # 古い行は変えず、最新行だけを置き換える
+        self.assertEqual(frame['local_balance'].tolist(), [100000, 900000, 100000, 500000])
+        self.assertEqual(frame['active'].tolist(), [1, 1, 1, 0])
+        self.assertEqual(frame['local_fee'].tolist(), [1100, 1100, 1100, 1100])
+
+        planner = PolicyPlanner(self.policy, DataAnalyzer(db_connection=None, config=None), {},
+                                {channel.channel_id: 0 for channel in self.channels})
+        engine = VectorizedFeeEngine(self.policy)
+        analysis_map = {row.Index: row for row in engine.evaluate(frame).itertuples()}
+        with contextlib.redirect_stdout(io.StringIO()):
+            changes = planner.plan_vectorized(self.channels, analysis_map)
+            self.assertEqual(changes, planner.plan(self.channels, histories, initial=False))
+        # 非アクティブになった 'bb:1' は計画されない
+        self.assertEqual([(change.channel_id, change.local_balance) for change in changes], [('1', 900000)])
+
+    def test_failed_fetch_returns_none(self):
+        with FakeLndServer(error_rate=1.0, seed=1) as server:
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertIsNone(fetch_live_state(calculator))
+            calculator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import unittest
+import urllib.request
+from services.metrics import MetricsRegistry, MetricsServer
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_disabled_registry_records_nothing(self):
+        registry = MetricsRegistry()
+        registry.inc('decisions_total', reason='fixed')
+        registry.set('fee_ppm', 100, channel_id='c1')
+        self.assertEqual(registry.render(), '\n')
+
+    def test_shards_from_threads_are_merged(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.enable()
+        registry.describe('decisions_total', 'counter', 'Decisions')
+
+        def work():
+            for _ in range(100):
+                registry.inc('decisions_total', reason='decrease')
+            registry.observe('latency_seconds', 0.05)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.observe('latency_seconds', 2.0)
+
+        text = registry.render()
+        self.assertIn('# TYPE decisions_total counter', text)
+        self.assertIn('decisions_total{reason="decrease"} 400', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 4', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 4', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 5', text)
+        self.assertIn('latency_seconds_count 5', text)
+        # 終了したスレッドのシャードは1つにまとめられる
+        self.assertEqual(len(registry._shards), 1)
+        self.assertIn('decisions_total{reason="decrease"} 400', registry.render())
+
+    def test_gauge_keeps_last_value_across_threads(self):
+        registry = MetricsRegistry()
+        registry.enable()
+        registry.set('fee_ppm', 100, channel_id='c1')
+        thread = threading.Thread(target=registry.set, args=('fee_ppm', 200), kwargs={'channel_id': 'c1'})
+        thread.start()
+        thread.join()
+        self.assertIn('fee_ppm{channel_id="c1"} 200', registry.render())
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.enable()
+        registry.set('fee_ppm', 1, channel_name='a "b"\\c')
+        self.assertIn('fee_ppm{channel_name="a \\"b\\"\\\\c"} 1', registry.render())
+
+    def test_server_exposes_metrics(self):
+        registry = MetricsRegistry()
+        registry.enable()
+        registry.inc('runs_total', mode='regular')
+        server = MetricsServer(registry, port=0).start()
+        try:
+            with urllib.request.urlopen(server.url, timeout=5) as response:
+                body = response.read().decode('utf-8')
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        finally:
+            server.stop()
+        self.assertIn('runs_total{mode="regular"} 1', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import contextlib
+import io
+import sqlite3
+import unittest
+from db.migrations import LATEST_VERSION, get_schema_version, migrate
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _index_names(self):
+        rows = self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'channel_datas'"
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def test_fresh_database_reaches_latest_version(self):
+        self.assertEqual(migrate(self.conn), LATEST_VERSION)
+        self.assertEqual(get_schema_version(self.conn), LATEST_VERSION)
+        self.assertIn('ux_channel_datas_channel_date', self._index_names())
+        self.assertIn('ix_channel_datas_channel_date_cover', self._index_names())
+
+    def test_upgrades_existing_database_in_place(self):
+        # 旧バージョン（インデックスなし、user_version = 0）のデータベースを再現
+        self.conn.execute('''
+            CREATE TABLE channel_datas (
+                channel_id TEXT NOT NULL, date TEXT NOT NULL, local_balance INTEGER,
+                local_fee INTEGER, local_infee INTEGER, remote_balance INTEGER,
+                remote_fee INTEGER, remote_infee INTEGER, num_updates INTEGER,
+                amboss_fee INTEGER, active INTEGER
+            )
+        ''')
+        rows = [
+            ('chan_a', '2024-01-01 00:00:00', 100, 1, 0, 0, 0, 0, 0, 10, 1),
+            ('chan_a', '2024-01-01 00:00:00', 200, 2, 0, 0, 0, 0, 0, 10, 1),
+            ('chan_a', '2024-01-02 00:00:00', 300, 3, 0, 0, 0, 0, 0, 10, 1),
+        ]
+        self.conn.executemany('INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            migrate(self.conn)
+        self.assertIn('chan_a 2024-01-01 00:00:00: 1 removed', output.getvalue())
+
+        balances = [row[0] for row in self.conn.execute(
+            'SELECT local_balance FROM channel_datas ORDER BY date'
+        )]
+        self.assertEqual(balances, [200, 300])
+        # 削除した重複行は退避テーブルに残る
+        backup = self.conn.execute('SELECT channel_id, date, local_balance FROM channel_datas_duplicates').fetchall()
+        self.assertEqual(backup, [('chan_a', '2024-01-01 00:00:00', 100)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute('INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows[2])
+
+    def test_no_backup_table_without_duplicates(self):
+        migrate(self.conn)
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn('channel_datas_duplicates', tables)
+
+    def test_migrate_is_idempotent(self):
+        migrate(self.conn)
+        self.assertEqual(migrate(self.conn), LATEST_VERSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
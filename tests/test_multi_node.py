@@ -0,0 +1,155 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from models.channel import Channel
+from services.config_loader import ConfigLoader
+from services.metrics import MetricsRegistry
+from services.node_runner import RunSummary, run_nodes
+from services.update_executor import FeeUpdateExecutor
+from utils.profiling import Profiler
+
+CONFIG = """
+[database]
+database_file = global.db
+
+[channels]
+fixed_channel_list = fixed.csv
+control_channel_list = control.csv
+
+[api]
+api_url = https://127.0.0.1:8080
+macaroon_path = admin.macaroon
+tls_path = tls.cert
+max_workers = 4
+
+[fees]
+basefee_msat = 500
+time_lock_delta = 72
+inboundFee_base = -1000
+inboundFee_ratio = 0, 0, 0, 0, 0.1
+LocalFee_ratio = 1.2, 1, 0.8, 0.6, 0.4
+fee_decreasing_threshold = 0.4
+
+[analysis]
+data_period = 8
+
+[debug]
+Debug_mode = False
+
+[node:alpha]
+database_file = alpha.db
+api_url = https://10.0.0.1:8080
+macaroon_path = alpha.macaroon
+
+[node:beta]
+database_file = beta.db
+control_channel_list = beta_control.csv
+inboundFee_base = -500
+"""
+
+
+class TestNodeConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tmpdir.name, 'ln-fee-manager.conf')
+        with open(self.config_file, 'w', encoding='utf-8') as file:
+            file.write(CONFIG)
+        self.config = ConfigLoader(self.config_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_node_names(self):
+        self.assertEqual(self.config.get_node_names(), ['alpha', 'beta'])
+
+    def test_node_options_override_global_settings(self):
+        alpha = self.config.for_node('alpha')
+        self.assertEqual(alpha.node_name, 'alpha')
+        self.assertEqual(alpha.get_database_file(), 'alpha.db')
+        self.assertEqual(alpha.get_api_url(), 'https://10.0.0.1:8080')
+        self.assertEqual(alpha.get_macaroon_path(), 'alpha.macaroon')
+        self.assertEqual(alpha.get_control_channel_list(), 'control.csv')
+        self.assertEqual(alpha.get_inboundFee_base(), -1000)
+        self.assertEqual(alpha.get_api_max_workers(), 4)
+
+        beta = self.config.for_node('beta')
+        self.assertEqual(beta.get_api_url(), 'https://127.0.0.1:8080')
+        self.assertEqual(beta.get_control_channel_list(), 'beta_control.csv')
+        self.assertEqual(beta.get_inboundFee_base(), -500)
+        # 元の設定は変更されない
+        self.assertEqual(self.config.get_database_file(), 'global.db')
+
+    def test_unknown_node(self):
+        with self.assertRaises(ValueError):
+            self.config.for_node('gamma')
+
+
+class TestRunNodes(unittest.TestCase):
+
+    def test_failing_node_does_not_stop_the_others(self):
+        class NodeConfig:
+            def __init__(self, node_name):
+                self.node_name = node_name
+
+        def run_node(node_config):
+            if node_config.node_name == 'broken':
+                raise RuntimeError('database is locked')
+            return RunSummary(None, 10, ('change',), 1, 0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            summaries = run_nodes([NodeConfig('a'), NodeConfig('broken'), NodeConfig('c')], run_node)
+
+        self.assertEqual([summary.node_name for summary in summaries], ['a', 'broken', 'c'])
+        self.assertEqual([summary.succeeded for summary in summaries], [1, 0, 1])
+        self.assertEqual(summaries[1].error, 'database is locked')
+
+    def test_profiler_and_metrics_are_tagged_per_node(self):
+        profiler = Profiler()
+        profiler.enable()
+        registry = MetricsRegistry()
+        registry.enable()
+
+        class NodeConfig:
+            def __init__(self, node_name, channels):
+                self.node_name = node_name
+                self.channels = channels
+
+        class StubFeeCalculator:
+            max_workers = 2
+
+            def set_fee_api(self, channel, fee, infee, local_balance=None):
+                # 更新はワーカースレッドで送られる
+                profiler.count('api.requests')
+                registry.inc('fee_manager_api_requests_total', outcome='success')
+                return True
+
+        def run_node(node_config):
+            with profiler.span('plan'):
+                profiler.count('planned', node_config.channels)
+            executor = FeeUpdateExecutor(StubFeeCalculator())
+            for index in range(node_config.channels):
+                executor.submit(Channel(id=index, channel_name=str(index), channel_id=str(index),
+                                        channel_point=f'{index:02x}:0', capacity=1000000), 100, 0)
+            executor.shutdown()
+            return RunSummary(None, node_config.channels, (), executor.success_count(), 0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_nodes([NodeConfig('alpha', 2), NodeConfig('beta', 3)], run_node)
+
+        report = profiler.report()
+        self.assertEqual(report['counters'], {'planned': 5, 'api.requests': 5})
+        self.assertEqual(report['nodes']['alpha']['counters'], {'planned': 2, 'api.requests': 2})
+        self.assertEqual(report['nodes']['beta']['counters'], {'planned': 3, 'api.requests': 3})
+        self.assertEqual(report['nodes']['beta']['spans']['plan']['count'], 1)
+        counters = registry.collect().counters
+        self.assertEqual(counters[('fee_manager_api_requests_total', (('node', 'alpha'), ('outcome', 'success')))], 2)
+        self.assertEqual(counters[('fee_manager_api_requests_total', (('node', 'beta'), ('outcome', 'success')))], 3)
+        # 単一ノードの実行ではノード別の集計を出さない
+        self.assertNotIn('nodes', Profiler().report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+from db.database import Database
+from services.backtest import BacktestResult, run_backtest
+from services.fee_policy import FeePolicy
+from services.parameter_sweep import (
+    SweepResult, expand_grid, export_history, load_history, parse_grid, rank_results, run_sweep,
+)
+
+
+class TestParameterSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=4,
+        )
+        self.db = Database(os.path.join(self.tmpdir.name, 'lightning_node.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.connect()
+            self.db.create_tables()
+
+        rng = random.Random(5)
+        for i in range(6):
+            self.db.conn.execute(
+                "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+                (f'chan_{i}', f'chan_{i}', f'chan_{i}:0', 1000000)
+            )
+            balance = rng.randrange(1000000)
+            for hour in range(40):
+                balance = min(max(balance + rng.randint(-100000, 100000), 0), 1000000)
+                self.db.conn.execute(
+                    "INSERT INTO channel_datas VALUES (?, ?, ?, 1500, -1000, 0, 0, 0, 0, ?, 1)",
+                    (f'chan_{i}', f'2024-01-{1 + hour // 24:02d} {hour % 24:02d}:00:00', balance,
+                     None if hour == 3 else 800)
+                )
+        # channel_lists にないチャネルの行は対象外
+        self.db.conn.execute("INSERT INTO channel_datas VALUES ('gone', '2024-01-01 00:00:00', 1, 1, 1, 0, 0, 0, 0, 1, 1)")
+        self.db.conn.commit()
+        self.fixed_channels = {'chan_0': 300}
+        self.control_channels = {f'chan_{i}': 0 for i in range(1, 6)}
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_parse_and_expand_grid(self):
+        grid = parse_grid(['decay_factor=0.8|0.9', 'localfee_ratio=1,1,1,1,1|2,1.5,1,0.5,0.2|1.2,1,0.8,0.6,0.4'])
+        self.assertEqual(grid['decay_factor'], [0.8, 0.9])
+        self.assertEqual(grid['LocalFee_ratio'][1], [2.0, 1.5, 1.0, 0.5, 0.2])
+
+        combinations = expand_grid(grid)
+        self.assertEqual(len(combinations), 6)
+        self.assertIn({'decay_factor': 0.9, 'LocalFee_ratio': [1.0] * 5}, combinations)
+        sampled = expand_grid(grid, samples=3, seed=1)
+        self.assertEqual(len(sampled), 3)
+        self.assertEqual(sampled, expand_grid(grid, samples=3, seed=1))
+        self.assertEqual(expand_grid({}), [{}])
+        with self.assertRaises(ValueError):
+            parse_grid(['decay_factor'])
+
+    def test_export_history_round_trip(self):
+        directory = os.path.join(self.tmpdir.name, 'history')
+        self.assertEqual(export_history(self.db, directory), 240)
+        channels, columns = load_history(directory)
+        self.assertEqual([channel.channel_id for channel in channels], [f'chan_{i}' for i in range(6)])
+        self.assertEqual(len(columns['local_balance']), 240)
+
+    def test_sweep_matches_database_backtest(self):
+        directory = os.path.join(self.tmpdir.name, 'history')
+        export_history(self.db, directory)
+        combinations = expand_grid(parse_grid(['decay_factor=0.5|0.9', 'fee_decreasing_threshold=0.2|0.6']))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run_sweep(directory, self.policy, combinations, self.fixed_channels,
+                                self.control_channels, max_workers=2)
+
+        self.assertEqual(len(results), len(combinations))
+        for result in results:
+            expected = run_backtest(self.db, self.policy.replace(**result.parameters),
+                                    self.fixed_channels, self.control_channels)
+            self.assertEqual(result.result, expected)
+
+    def test_rank_results(self):
+        def make(updates, fees):
+            return SweepResult({'updates': updates}, BacktestResult(10, 1, updates, {}, {}, (5, 5), fees))
+
+        results = [make(5, (100, 50)), make(3, (100, 90)), make(3, (300, 0)), make(1, (None, 0))]
+        by_updates = rank_results(results, 'updates')
+        self.assertEqual([result.result.updates for result in by_updates], [1, 3, 3, 5])
+        self.assertEqual(by_updates[1].fee_spread, 300)
+        by_spread = rank_results(results, 'fee_spread')
+        self.assertEqual([result.fee_spread for result in by_spread], [300, 50, 10, None])
+        with self.assertRaises(ValueError):
+            rank_results(results, 'profit')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from benchmarks.fake_lnd_server import FakeLndServer
+from services.fee_calculator import FeeCalculator
+from services.policy_batcher import coalesce_policy_changes, count_update_calls
+from services.policy_planner import PolicyChange, REASON_RATIO_CHANGE
+from services.update_executor import FeeUpdateExecutor
+from tests.test_fee_calculator_api import StubConfig
+
+
+class GlobalRecordingFeeCalculator:
+    max_workers = 2
+
+    def __init__(self):
+        self.global_calls = []
+        self.channel_calls = []
+
+    def set_fee_api(self, channel, fee, infee, local_balance=None):
+        self.channel_calls.append(channel.channel_id)
+        return True
+
+    def set_global_fee_api(self, fee, infee, channel_count=None):
+        self.global_calls.append((fee, infee, channel_count))
+        return True
+
+
+class TestPolicyBatcher(unittest.TestCase):
+
+    def _change(self, channel_id, new_local_fee, local_balance=300000, old_local_fee=500):
+        return PolicyChange(
+            channel_id=channel_id, channel_name=channel_id, channel_point='txid:0',
+            old_local_fee=old_local_fee, new_local_fee=new_local_fee, old_inbound_fee=-1000,
+            new_inbound_fee=-1000, local_balance=local_balance, reason=REASON_RATIO_CHANGE, ratio=0.3,
+        )
+
+    def test_groups_identical_policies_and_drops_no_ops(self):
+        changes = [
+            self._change('a', 1200), self._change('b', 1200), self._change('c', 1400),
+            self._change('d', 1200, local_balance=600000), self._change('e', 500),
+        ]
+        batches = coalesce_policy_changes(changes)
+
+        # 残高（max_htlc_msat）が違っても手数料が同じなら同じグループになる
+        self.assertEqual(sorted(len(batch.changes) for batch in batches), [1, 3])
+        self.assertFalse(any(batch.is_global for batch in batches))
+        self.assertEqual(count_update_calls(batches), 4)
+
+    def test_shared_policy_across_the_node_is_sent_globally(self):
+        calculator = GlobalRecordingFeeCalculator()
+        changes = [self._change(channel_id, 1200, local_balance=balance)
+                   for channel_id, balance in (('a', 100000), ('b', 300000), ('c', 900000))]
+        batches = coalesce_policy_changes(changes, node_channel_ids=['a', 'b', 'c'])
+        self.assertEqual(count_update_calls(batches), 1)
+
+        executor = FeeUpdateExecutor(calculator)
+        for batch in batches:
+            executor.submit_batch(batch)
+        executor.shutdown()
+
+        self.assertEqual(calculator.global_calls, [(1200, -1000, 3)])
+        self.assertEqual(calculator.channel_calls, [])
+        self.assertEqual(executor.success_count(), 3)
+
+    def test_partial_coverage_is_not_global(self):
+        changes = [self._change(channel_id, 1200) for channel_id in ('a', 'b')]
+        batches = coalesce_policy_changes(changes, node_channel_ids=['a', 'b', 'c'])
+        self.assertFalse(batches[0].is_global)
+
+    def test_global_mode_reduces_lnd_calls(self):
+        with FakeLndServer() as server, tempfile.TemporaryDirectory() as tmpdir:
+            macaroon_path = os.path.join(tmpdir, 'admin.macaroon')
+            with open(macaroon_path, 'wb') as file:
+                file.write(b'\x01')
+            calculator = FeeCalculator(StubConfig(server.url, macaroon_path), None)
+            changes = []
+            for index, balance in enumerate((100000, 250000, 500000, 750000)):
+                point = f'{index:02x}:0'
+                server.add_channel(point, str(index), 1000000, balance, fee_per_mil=500, inbound_fee_per_mil=-1000)
+                changes.append(PolicyChange(
+                    channel_id=str(index), channel_name=str(index), channel_point=point, old_local_fee=500,
+                    new_local_fee=1200, old_inbound_fee=-1000, new_inbound_fee=-1000, local_balance=balance,
+                    reason=REASON_RATIO_CHANGE, ratio=balance / 1000000,
+                ))
+
+            executor = FeeUpdateExecutor(calculator)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for batch in coalesce_policy_changes(changes, node_channel_ids=['0', '1', '2', '3']):
+                    executor.submit_batch(batch)
+                executor.shutdown()
+            calculator.close()
+
+        # 4チャネル分の更新が1回の呼び出しで済み、max_htlc_msat は送らない
+        self.assertEqual(len(server.policy_updates), 1)
+        self.assertTrue(server.policy_updates[0]['data']['global'])
+        self.assertNotIn('max_htlc_msat', server.policy_updates[0]['data'])
+        self.assertEqual(executor.success_count(), 4)
+        self.assertEqual({channel['fee_per_mil'] for channel in server.channels.values()}, {1200})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import pandas as pd
+from db.channel_summary_store import ChannelSummaryStore
+from db.database import Database
+from models.channel import Channel
+from models.channel_history import ChannelHistory
+from services.data_analyzer import DataAnalyzer
+from services.fee_engine import VectorizedFeeEngine
+from services.fee_policy import FeePolicy
+from services.policy_planner import PolicyPlanner, REASON_DECREASE, REASON_FIXED
+
+
+class TestPolicyPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = FeePolicy(
+            inboundFee_base=-1000,
+            inboundFee_ratio=[0, 0, 0, 0, 0.1],
+            LocalFee_ratio=[1.2, 1, 0.8, 0.6, 0.4],
+            fee_decreasing_threshold=0.4,
+            data_period=4,
+        )
+        self.analyzer = DataAnalyzer(db_connection=None, config=None)
+
+    def _planner(self, fixed_channels, control_channels):
+        return PolicyPlanner(self.policy, self.analyzer, fixed_channels, control_channels)
+
+    def _channel(self, channel_id, capacity=1000000):
+        return Channel(id=1, channel_name=channel_id, channel_id=channel_id, channel_point='txid:0', capacity=capacity)
+
+    def _history(self, channel_id, balances, fee, amboss_fee=800):
+        history = ChannelHistory(channel_id)
+        for i, balance in enumerate(balances):
+            history.append(f'2024-01-01 {i:02d}:00:00', balance, fee, -1000, 0, 0, 0, 0, amboss_fee, 1)
+        return history
+
+    def test_stable_high_balance_decreases_fee(self):
+        channel = self._channel('chan_a')
+        history = self._history('chan_a', [900000] * 4, 2000)
+        with redirect_stdout(io.StringIO()):
+            changes = self._planner({}, {'chan_a': 0}).plan([channel], {'chan_a': history}, initial=False)
+
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].reason, REASON_DECREASE)
+        self.assertEqual(changes[0].new_local_fee, self.policy.calculate_decreased_fee(2000))
+        self.assertEqual(changes[0].ratio, 0.9)
+
+    def test_fixed_channel_is_skipped_when_already_set(self):
+        channel = self._channel('chan_f')
+        with redirect_stdout(io.StringIO()):
+            planner = self._planner({'chan_f': 200}, {})
+            unchanged = planner.plan([channel], {'chan_f': self._history('chan_f', [500000], 1200)}, initial=True)
+            changed = planner.plan([channel], {'chan_f': self._history('chan_f', [500000], 900)}, initial=True)
+
+        self.assertEqual(unchanged, ())
+        self.assertEqual(changed[0].reason, REASON_FIXED)
+        self.assertEqual(changed[0].new_local_fee, 1200)
+
+    def test_vectorized_plan_matches_per_object_plan(self):
+        rng = random.Random(7)
+        channels, histories, rows = [], {}, []
+        for i in range(200):
+            channel = self._channel(f'chan_{i}')
+            balances = [rng.choice([50000, 300000, 500000, 700000, 950000]) for _ in range(rng.randint(1, 5))]
+            if i % 3 == 0:
+                balances = [balances[0]] * len(balances)
+            history = self._history(channel.channel_id, balances, rng.choice([1000, 2000]), rng.choice([None, 900]))
+            channels.append(channel)
+            histories[channel.channel_id] = history
+            for data in history:
+                rows.append({
+                    'channel_id': data.channel_id, 'date': data.date, 'local_balance': data.local_balance,
+                    'local_fee': data.local_fee, 'local_infee': data.local_infee, 'amboss_fee': data.amboss_fee,
+                    'active': 1, 'capacity': channel.capacity,
+                })
+
+        fixed_channels = {f'chan_{i}': 300 for i in range(0, 200, 10)}
+        control_channels = {channel.channel_id: 0 for channel in channels}
+        planner = self._planner(fixed_channels, control_channels)
+        analysis = VectorizedFeeEngine(self.policy).evaluate(pd.DataFrame(rows))
+
+        with redirect_stdout(io.StringIO()):
+            expected = planner.plan(channels, histories, initial=False)
+            actual = planner.plan_vectorized(channels, {row.Index: row for row in analysis.itertuples()})
+
+        self.assertTrue(expected)
+        self.assertEqual(actual, expected)
+
+    def test_paths_agree_on_fractional_values_from_sqlite(self):
+        rng = random.Random(11)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = Database(os.path.join(tmpdir, 'lightning_node.db'))
+            with redirect_stdout(io.StringIO()):
+                db.connect()
+                db.create_tables()
+            for i in range(60):
+                channel_id = f'chan_{i}'
+                db.conn.execute(
+                    "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+                    (channel_id, channel_id, f'txid:{i}', 1000000)
+                )
+                # 収集側が REAL で書き込んだ端数付きの残高・Amboss 手数料
+                balance = rng.choice([50000.5, 300000.25, 500000.0, 950000.75])
+                amboss_fee = rng.choice([None, 800, 1234.5, 2000.25])
+                for hour in range(rng.randint(1, 5)):
+                    db.conn.execute(
+                        "INSERT INTO channel_datas VALUES (?, ?, ?, ?, -1000, 0, 0, 0, 0, ?, 1)",
+                        (channel_id, f'2024-01-01 {hour:02d}:00:00', balance, rng.choice([1000, 2000]), amboss_fee)
+                    )
+            db.conn.commit()
+
+            channels = db.get_channels()
+            planner = self._planner({}, {channel.channel_id: 0 for channel in channels})
+            engine = VectorizedFeeEngine(self.policy)
+            with redirect_stdout(io.StringIO()):
+                expected = planner.plan(channels, db.get_recent_channel_data_bulk(self.policy.data_period),
+                                        initial=False)
+                analysis = engine.evaluate(engine.load_window(db.read_conn))
+                vectorized = planner.plan_vectorized(channels, {row.Index: row for row in analysis.itertuples()})
+                summarized = planner.plan_summary(channels, ChannelSummaryStore(db.conn, db.read_conn).refresh())
+            db.close()
+
+        self.assertTrue(expected)
+        self.assertEqual(vectorized, expected)
+        self.assertEqual(summarized, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import unittest
+from utils.profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = Profiler()
+        with profiler.span('plan'):
+            pass
+        with profiler.timer('sql.get_channels'):
+            pass
+        profiler.count('skipped.inactive')
+
+        report = profiler.report()
+        self.assertEqual(report['spans'], {})
+        self.assertEqual(report['counters'], {})
+        self.assertEqual(report['histograms'], {})
+
+    def test_spans_counters_and_histograms(self):
+        profiler = Profiler()
+        profiler.enable()
+
+        @profiler.timed('sql.query')
+        def query():
+            return 42
+
+        with profiler.span('plan'):
+            self.assertEqual(query(), 42)
+        profiler.count('skipped.inactive')
+        profiler.count('skipped.inactive', 2)
+        profiler.observe('http.chanpolicy', 0.003)
+        profiler.observe('http.chanpolicy', 0.2)
+
+        report = profiler.report()
+        self.assertEqual(report['spans']['plan']['count'], 1)
+        self.assertEqual(report['counters'], {'skipped.inactive': 3})
+        self.assertEqual(report['histograms']['sql.query']['count'], 1)
+
+        http = report['histograms']['http.chanpolicy']
+        self.assertEqual(http['count'], 2)
+        self.assertEqual(http['buckets']['5'], 1)
+        self.assertEqual(http['buckets']['250'], 2)
+        self.assertEqual(http['buckets']['+Inf'], 2)
+
+    def test_write_report(self):
+        profiler = Profiler()
+        profiler.enable()
+        profiler.count('api.failures')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_file = os.path.join(tmpdir, 'profile', 'report.json')
+            profiler.write_report(output_file)
+            with open(output_file, encoding='utf-8') as file:
+                self.assertEqual(json.load(file)['counters'], {'api.failures': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from db.database import Database
+
+
+class TestRecentChannelDataBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.connect()
+        self.db.create_tables()
+        rows = []
+        for channel_id in ('chan_a', 'chan_b'):
+            for day in range(1, 6):
+                rows.append((channel_id, f'2024-01-0{day} 00:00:00', day * 1000, day, -10, 0, 0, 0, 0, 100, 1))
+        rows.append(('chan_c', '2024-01-01 00:00:00', 500, 1, 0, 0, 0, 0, 0, None, 0))
+        self.db.cursor.executemany(
+            'INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        self.db.conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_bulk_matches_per_channel_query(self):
+        bulk = self.db.get_recent_channel_data_bulk(3)
+        self.assertEqual(set(bulk), {'chan_a', 'chan_b', 'chan_c'})
+        for channel_id, channel_data in bulk.items():
+            expected = self.db.get_recent_channel_data(channel_id, 3)
+            self.assertEqual([d.date for d in channel_data], [d.date for d in expected])
+            self.assertEqual([d.local_balance for d in channel_data], [d.local_balance for d in expected])
+
+    def test_bulk_returns_oldest_first(self):
+        channel_data = self.db.get_recent_channel_data_bulk(3)['chan_a']
+        self.assertEqual([d.local_fee for d in channel_data], [3, 4, 5])
+        self.assertFalse(self.db.get_recent_channel_data_bulk(3)['chan_c'][0].active)
+
+
+if __name__ == '__main__':
+    unittest.main()
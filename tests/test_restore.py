@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from benchmarks.fake_lnd_server import FakeLndServer
+from db.database import Database
+from services.fee_calculator import FeeCalculator
+from services.live_state import fetch_live_state
+from services.restore import REASON_RESTORE, parse_restore_time, plan_restore
+from services.update_executor import FeeUpdateExecutor
+from tests.test_fee_calculator_api import StubConfig
+
+ROWS = [
+    # channel_id, date, local_balance, local_fee, local_infee, amboss_fee, active
+    ('1', '2024-01-01 00:00:00', 500000, 1000, -100, 900, 1),
+    ('1', '2024-01-02 00:00:00', 500000, 1500, -200, 900, 1),
+    ('2', '2024-01-01 12:00:00', 200000, 800, 0, 900, 1),
+    ('2', '2024-01-03 00:00:00', 200000, 2000, 0, 900, 1),
+    ('3', '2024-01-01 00:00:00', 900000, 700, -50, 900, 1),
+    # 復元時点より後にしかスナップショットがない
+    ('4', '2024-01-05 00:00:00', 900000, 700, -50, 900, 1),
+    # LND では既に閉じられている
+    ('5', '2024-01-01 00:00:00', 900000, 700, -50, 900, 1),
+]
+
+
+class TestRestore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.macaroon_path = os.path.join(self.tmpdir.name, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as file:
+            file.write(b'\x01')
+        self.db = Database(os.path.join(self.tmpdir.name, 'lightning_node.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.db.connect()
+            self.db.create_tables()
+        for channel_id in '12345':
+            self.db.conn.execute(
+                "INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity) VALUES (?, ?, ?, ?)",
+                (f'channel{channel_id}', channel_id, f'{channel_id * 2}:0', 1000000)
+            )
+        self.db.conn.executemany("INSERT INTO channel_datas VALUES (?, ?, ?, ?, ?, 0, 0, 0, 0, ?, ?)", ROWS)
+        self.db.conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+
+    def test_parse_restore_time(self):
+        self.assertEqual(parse_restore_time('2024-01-02'), '2024-01-02 00:00:00')
+        self.assertEqual(parse_restore_time('2024-01-02T03:04'), '2024-01-02 03:04:00')
+        self.assertEqual(parse_restore_time(' 2024-01-02 03:04:05 '), '2024-01-02 03:04:05')
+        with self.assertRaises(ValueError):
+            parse_restore_time('yesterday')
+
+    def test_channel_data_as_of(self):
+        snapshots = self.db.get_channel_data_as_of('2024-01-02 00:00:00')
+        self.assertEqual(set(snapshots), {'1', '2', '3', '5'})
+        self.assertEqual((snapshots['1'].local_fee, snapshots['1'].local_infee), (1500, -200))
+        self.assertEqual(snapshots['2'].date, '2024-01-01 12:00:00')
+        self.assertTrue(snapshots['3'].active)
+
+    def test_only_channels_that_differ_are_restored(self):
+        with FakeLndServer() as server:
+            # 1: 誤った設定が入っている、2: 残高が変わり手数料も変更済み、3: 既に復元時点と同じ
+            server.add_channel('11:0', '1', 1000000, 400000, fee_per_mil=3000, inbound_fee_per_mil=-100, base_fee_msat=500)
+            server.add_channel('22:0', '2', 1000000, 600000, fee_per_mil=2000, inbound_fee_per_mil=0, base_fee_msat=500)
+            server.add_channel('33:0', '3', 1000000, 900000, fee_per_mil=700, inbound_fee_per_mil=-50, base_fee_msat=500)
+            server.add_channel('44:0', '4', 1000000, 900000, fee_per_mil=1, inbound_fee_per_mil=0, base_fee_msat=500)
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                changes = plan_restore(self.db.get_channels(), self.db.get_channel_data_as_of('2024-01-02 00:00:00'),
+                                       fetch_live_state(calculator), calculator.basefee_msat)
+                executor = FeeUpdateExecutor(calculator)
+                for change in changes:
+                    executor.submit_change(change)
+                executor.shutdown()
+            calculator.close()
+
+        self.assertEqual([change.channel_id for change in changes], ['1', '2'])
+        self.assertEqual({change.reason for change in changes}, {REASON_RESTORE})
+        self.assertEqual((changes[0].old_local_fee, changes[0].new_local_fee), (3000, 1500))
+        self.assertEqual((changes[1].new_local_fee, changes[1].local_balance), (800, 600000))
+        self.assertEqual(executor.success_count(), 2)
+        self.assertEqual(server.channels['11:0']['fee_per_mil'], 1500)
+        self.assertEqual(server.channels['11:0']['inbound_fee_per_mil'], -200)
+        self.assertEqual(server.channels['22:0']['fee_per_mil'], 800)
+        # max_htlc_msat は現在の残高から計算する
+        self.assertEqual({update['data']['max_htlc_msat'] for update in server.policy_updates},
+                         {calculator.get_max_htlc_msat(400000), calculator.get_max_htlc_msat(600000)})
+
+    def test_base_fee_difference_is_restored(self):
+        with FakeLndServer() as server:
+            server.add_channel('33:0', '3', 1000000, 900000, fee_per_mil=700, inbound_fee_per_mil=-50, base_fee_msat=0)
+            calculator = FeeCalculator(StubConfig(server.url, self.macaroon_path), None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                changes = plan_restore(self.db.get_channels(), self.db.get_channel_data_as_of('2024-01-02 00:00:00'),
+                                       fetch_live_state(calculator), calculator.basefee_msat)
+            calculator.close()
+        self.assertEqual([change.channel_id for change in changes], ['3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import threading
+import unittest
+from models.channel import Channel
+from services.fee_calculator import PolicySendResult
+from services.update_executor import FeeUpdateExecutor
+
+
+class RecordingFeeCalculator:
+    max_workers = 4
+
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def set_fee_api(self, channel, fee, infee, local_balance=None):
+        with self.lock:
+            self.calls.append((channel.channel_id, fee, infee, local_balance))
+        if channel.channel_id == 'boom':
+            raise RuntimeError('connection reset')
+        return channel.channel_id not in self.fail_ids
+
+
+class TestFeeUpdateExecutor(unittest.TestCase):
+
+    def _channel(self, channel_id):
+        return Channel(id=1, channel_name=channel_id, channel_id=channel_id, channel_point='txid:0', capacity=1000000)
+
+    def test_collects_per_channel_results(self):
+        calculator = RecordingFeeCalculator(fail_ids={'c2'})
+        executor = FeeUpdateExecutor(calculator)
+        for channel_id in ('c1', 'c2', 'c3', 'boom'):
+            executor.submit(self._channel(channel_id), 100, -10, 300000)
+        executor.shutdown()
+
+        self.assertEqual(len(calculator.calls), 4)
+        self.assertEqual(executor.success_count(), 2)
+        self.assertEqual(executor.failure_count(), 2)
+        failed = {result.channel.channel_id: result.error for result in executor.results if not result.success}
+        self.assertEqual(failed, {'c2': None, 'boom': 'connection reset'})
+
+    def test_dry_runs_and_errors_of_the_send_result_are_kept(self):
+        calculator = RecordingFeeCalculator()
+        statuses = {'dry': PolicySendResult(True, dry_run=True), 'bad': PolicySendResult(False, error='HTTP 500')}
+        calculator.set_fee_api = lambda channel, fee, infee, local_balance=None: statuses[channel.channel_id]
+        executor = FeeUpdateExecutor(calculator)
+        for channel_id in ('dry', 'bad'):
+            executor.submit(self._channel(channel_id), 100, -10, 300000)
+        executor.shutdown()
+
+        results = {result.channel.channel_id: result for result in executor.results}
+        self.assertTrue(results['dry'].dry_run)
+        self.assertEqual(results['bad'].error, 'HTTP 500')
+        # 送信していない更新は成功数に含めない
+        self.assertEqual((executor.success_count(), executor.failure_count(), executor.dry_run_count()), (0, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
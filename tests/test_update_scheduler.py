@@ -0,0 +1,123 @@
+import contextlib
+import io
+import sqlite3
+import unittest
+from db.migrations import migrate
+from db.update_state_store import UpdateStateStore
+from services.policy_batcher import coalesce_policy_changes
+from services.policy_planner import PolicyChange
+from services.update_executor import FeeUpdateResult
+from services.update_scheduler import TokenBucket, UpdateScheduler, fee_distance
+
+
+def _change(channel_id, old_local_fee, new_local_fee, old_inbound_fee=0, new_inbound_fee=0):
+    return PolicyChange(
+        channel_id=channel_id, channel_name=f'channel{channel_id}', channel_point=f'{channel_id}:0',
+        old_local_fee=old_local_fee, new_local_fee=new_local_fee, old_inbound_fee=old_inbound_fee,
+        new_inbound_fee=new_inbound_fee, local_balance=500000, reason='decrease', ratio=0.5,
+    )
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_take_and_refill(self):
+        bucket = TokenBucket(2, 0.5, updated_at=100.0)
+        self.assertTrue(bucket.take(100.0))
+        self.assertTrue(bucket.take(100.0))
+        self.assertFalse(bucket.take(101.0))
+        self.assertTrue(bucket.take(102.0))
+        # 容量を超えては貯まらない
+        bucket.refill(1000.0)
+        self.assertEqual(bucket.tokens, 2)
+
+
+class TestUpdateScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(self.conn)
+        self.store = UpdateStateStore(self.conn)
+        self.now = 10000.0
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _scheduler(self, **kwargs):
+        return UpdateScheduler(self.store, clock=lambda: self.now, **kwargs)
+
+    def test_fee_distance(self):
+        self.assertEqual(fee_distance(_change('1', 1000, 900, -200, -100)), 200)
+        self.assertEqual(fee_distance(_change('1', None, 900)), 900)
+
+    def test_cooldown_defers_recently_updated_channels(self):
+        scheduler = self._scheduler(min_interval=3600)
+        changes = (_change('1', 1000, 900), _change('2', 1000, 900))
+        scheduler.record([FeeUpdateResult(changes[0], True), FeeUpdateResult(changes[1], False)])
+
+        self.now += 1800
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes)
+        self.assertEqual(selected, (changes[1],))
+        self.assertEqual(deferred, (changes[0],))
+
+        self.now += 1800
+        selected, deferred = scheduler.schedule(changes)
+        self.assertEqual(selected, changes)
+        self.assertEqual(deferred, ())
+
+    def test_budget_sends_largest_fee_distance_first(self):
+        scheduler = self._scheduler(budget=2, window=3600)
+        changes = (_change('1', 1000, 990), _change('2', 1000, 500), _change('3', 1000, 1100, 0, -300))
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes)
+        self.assertEqual([change.channel_id for change in selected], ['2', '3'])
+        self.assertEqual([change.channel_id for change in deferred], ['1'])
+
+        # 予算は実行をまたいで保存され、window / budget 秒ごとに1件回復する
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = self._scheduler(budget=2, window=3600).schedule(deferred)
+        self.assertEqual((selected, len(deferred)), ((), 1))
+        self.now += 1800
+        selected, deferred = self._scheduler(budget=2, window=3600).schedule(deferred)
+        self.assertEqual([change.channel_id for change in selected], ['1'])
+
+    def test_dry_runs_spend_no_budget_and_start_no_cooldown(self):
+        scheduler = self._scheduler(min_interval=3600, budget=1, window=3600)
+        changes = (_change('1', 1000, 900), _change('2', 1000, 800))
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes, dry_run=True)
+            scheduler.record([FeeUpdateResult(change, True, dry_run=True) for change in selected])
+            # Debug_mode の実行の後でも同じ変更を送れる
+            self.assertEqual(scheduler.schedule(changes), (selected, deferred))
+        self.assertEqual([change.channel_id for change in selected], ['2'])
+
+    def test_budget_is_charged_per_update_call(self):
+        scheduler = self._scheduler(budget=2, window=3600)
+        # 全チャネル共通のポリシーは global 指定の1回の呼び出しになる
+        changes = (_change('1', 1000, 900), _change('2', 1100, 900), _change('3', 1200, 900))
+        coalesce = lambda planned: coalesce_policy_changes(planned, ['1', '2', '3'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes, coalesce=coalesce)
+        self.assertEqual((selected, deferred), (changes, ()))
+        self.assertEqual(self.store.load_budget()[0], 1)
+
+        # global にならない変更は1件ずつ課金され、手数料が変わらない変更は送りも課金もしない
+        changes += (_change('4', 800, 800), _change('5', 1000, 600))
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes, coalesce=coalesce_policy_changes)
+        self.assertEqual([change.channel_id for change in selected], ['5'])
+        self.assertEqual([change.channel_id for change in deferred], ['3', '2', '1'])
+
+    def test_cooldown_and_budget_combined(self):
+        scheduler = self._scheduler(min_interval=600, budget=1, window=60)
+        changes = (_change('1', 1000, 100), _change('2', 1000, 900), _change('3', 1000, 800))
+        scheduler.record([FeeUpdateResult(changes[0], True)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, deferred = scheduler.schedule(changes)
+        self.assertEqual([change.channel_id for change in selected], ['3'])
+        self.assertEqual([change.channel_id for change in deferred], ['1', '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()